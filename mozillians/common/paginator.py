@@ -0,0 +1,40 @@
+from django.core.paginator import EmptyPage, Page, PageNotAnInteger, Paginator
+
+
+class HasMorePage(Page):
+    """Page of a HasMorePaginator, it knows if a next page exists."""
+
+    def __init__(self, object_list, number, paginator, has_more):
+        self.has_more = has_more
+        super(HasMorePage, self).__init__(object_list, number, paginator)
+
+    def has_next(self):
+        return self.has_more
+
+
+class HasMorePaginator(Paginator):
+    """Paginator that never counts the objects.
+
+    Every page fetches one object more than it shows, to find out if
+    there is a next page. Use it for listings where the total count is
+    expensive and not needed, e.g. search results.
+    """
+    skips_count = True
+
+    def validate_number(self, number):
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('That page number is not an integer')
+        if number < 1:
+            raise EmptyPage('That page number is less than 1')
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        bottom = (number - 1) * self.per_page
+        object_list = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not object_list and number > 1:
+            raise EmptyPage('That page contains no results')
+        return HasMorePage(object_list[:self.per_page], number, self,
+                           len(object_list) > self.per_page)
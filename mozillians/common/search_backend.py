@@ -0,0 +1,553 @@
+"""
+An in-process haystack search backend.
+
+The search documents and an inverted index of their terms are kept in
+memory. When the connection has a PATH they are also saved in that
+directory, so all the processes of a node share the index. It is used
+when Elasticsearch is disabled and by the test suite.
+
+Supports what the phonebook search needs: term and prefix (trailing *)
+matching on the text fields, exact, range and in filters, AND/OR/NOT
+combinations, model filtering, ordering and slicing. Facets,
+highlighting, spelling suggestions and more like this are not supported
+and phrases are matched as a set of terms.
+"""
+import bisect
+import cPickle as pickle
+import fcntl
+import logging
+import operator
+import os
+import re
+import struct
+import threading
+from contextlib import contextmanager
+
+from django.utils import six
+from django.utils.encoding import force_text
+
+from haystack import connections
+from haystack.backends import BaseEngine, BaseSearchBackend, BaseSearchQuery, log_query
+from haystack.constants import DJANGO_CT, DJANGO_ID
+from haystack.exceptions import SkipDocument
+from haystack.inputs import AutoQuery, BaseInput, Exact, Not
+from haystack.models import SearchResult
+from haystack.utils import get_identifier, get_model_ct
+
+
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+PHRASE_RE = re.compile(r'"(?P<phrase>.*?)"')
+TEXT_TYPES = six.string_types + (list, tuple)
+RANGE_FILTERS = {
+    'gt': operator.gt,
+    'gte': operator.ge,
+    'lt': operator.lt,
+    'lte': operator.le,
+}
+
+# Each log record is a pickled list of changes, prefixed by its length.
+LOG_HEADER = struct.Struct('>I')
+# The log is folded in a new snapshot once it is larger than this and
+# than the snapshot.
+COMPACT_MIN_SIZE = 1024 * 1024
+
+logger = logging.getLogger('mozillians.search')
+
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+def tokenize(value):
+    """Return the lower case terms of a value or a list of values."""
+    if isinstance(value, (list, tuple)):
+        return [term for item in value for term in tokenize(item)]
+    return TOKEN_RE.findall(force_text(value).lower())
+
+
+def get_store(path, name):
+    """Return the store of an index, shared by the threads of the process."""
+    key = path or name
+    with _stores_lock:
+        if key not in _stores:
+            _stores[key] = SearchStore(path)
+        return _stores[key]
+
+
+def reset_stores():
+    """Empty the in memory stores, between tests."""
+    with _stores_lock:
+        for store in _stores.values():
+            if not store.path:
+                with store.lock:
+                    store.truncate()
+                    store.commit()
+
+
+class SearchStore(object):
+    """The documents of an index and the inverted index of their fields.
+
+    String and list values are split in terms, terms maps each field to
+    the documents of every term. Other values, e.g. the privacy levels,
+    are kept whole in values, which maps each field to the documents of
+    every value.
+
+    On disk an index is a snapshot and a log of the changes committed
+    since, so a commit only appends its own changes. The snapshot is
+    rewritten, with the next generation and an empty log, once the log
+    outgrows it.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self.lock = threading.RLock()
+        # The changes not committed yet, doc_id and document or None.
+        self.pending = []
+        self.truncated = False
+        # The snapshot read and how much of its log was replayed.
+        self.inode = None
+        self.generation = 0
+        self.snapshot_size = 0
+        self.log_offset = 0
+        self.reset()
+
+    def reset(self):
+        self.documents = {}
+        self.terms = {}
+        self.values = {}
+        self._sorted_terms = {}
+
+    @property
+    def log_path(self):
+        return '{0}.{1}.log'.format(self.path, self.generation)
+
+    def load(self):
+        """Catch up with the changes committed by the other processes.
+
+        A new snapshot is read whole, otherwise only the log records
+        appended since the last load are replayed.
+        """
+        if not self.path:
+            return
+        try:
+            stat = os.stat(self.path)
+        except OSError:
+            stat = None
+        changed = False
+        if (stat and (stat.st_dev, stat.st_ino)) != self.inode:
+            self._read_snapshot(stat)
+            changed = True
+        changed = self._replay_log() or changed
+        if changed and self.pending:
+            self._apply(self.pending)
+
+    def _read_snapshot(self, stat):
+        self.reset()
+        self.inode, self.generation, self.snapshot_size, self.log_offset = None, 0, 0, 0
+        if stat is None:
+            return
+        with open(self.path, 'rb') as index_file:
+            data = pickle.load(index_file)
+            stat = os.fstat(index_file.fileno())
+        self.documents = data['documents']
+        self.terms = data['terms']
+        self.values = data['values']
+        self.generation = data['generation']
+        self.inode = (stat.st_dev, stat.st_ino)
+        self.snapshot_size = stat.st_size
+
+    def _replay_log(self):
+        try:
+            log_file = open(self.log_path, 'rb')
+        except IOError:
+            return False
+        replayed = False
+        with log_file:
+            log_file.seek(self.log_offset)
+            while True:
+                header = log_file.read(LOG_HEADER.size)
+                if len(header) < LOG_HEADER.size:
+                    break
+                size, = LOG_HEADER.unpack(header)
+                record = log_file.read(size)
+                if len(record) < size:
+                    # Still being written.
+                    break
+                self._apply(pickle.loads(record))
+                self.log_offset += LOG_HEADER.size + size
+                replayed = True
+        return replayed
+
+    def _apply(self, changes):
+        for doc_id, document in changes:
+            if document is None:
+                self._discard(doc_id)
+            else:
+                self._add(doc_id, document)
+
+    @contextmanager
+    def _file_lock(self):
+        """Lock the index files against the other processes."""
+        if not self.path:
+            yield
+            return
+        directory = os.path.dirname(self.path)
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+        with open(self.path + '.lock', 'a') as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def commit(self):
+        """Save the pending changes, appending them to the log."""
+        with self.lock, self._file_lock():
+            if not self.path:
+                self.pending, self.truncated = [], False
+                return
+            self.load()
+            if self.truncated:
+                # Nothing committed before the truncation survives it.
+                self.reset()
+                self._apply(self.pending)
+            elif self.pending:
+                self._append_log(self.pending)
+            if self.truncated or self.log_offset > max(self.snapshot_size, COMPACT_MIN_SIZE):
+                self._write_snapshot()
+            self.pending, self.truncated = [], False
+
+    def _append_log(self, changes):
+        record = pickle.dumps(changes, pickle.HIGHEST_PROTOCOL)
+        with open(self.log_path, 'ab') as log_file:
+            # Drop the partial record of a writer that died mid-write.
+            log_file.truncate(self.log_offset)
+            log_file.write(LOG_HEADER.pack(len(record)) + record)
+        self.log_offset += LOG_HEADER.size + len(record)
+
+    def _write_snapshot(self):
+        old_log_path = self.log_path
+        self.generation += 1
+        tmp_path = '{0}.{1}.tmp'.format(self.path, os.getpid())
+        with open(tmp_path, 'wb') as index_file:
+            data = {'documents': self.documents, 'terms': self.terms, 'values': self.values,
+                    'generation': self.generation}
+            pickle.dump(data, index_file, pickle.HIGHEST_PROTOCOL)
+        # Readers see either the old or the new snapshot, never a partial one.
+        os.rename(tmp_path, self.path)
+        stat = os.stat(self.path)
+        self.inode = (stat.st_dev, stat.st_ino)
+        self.snapshot_size = stat.st_size
+        self.log_offset = 0
+        try:
+            os.remove(old_log_path)
+        except OSError:
+            pass
+
+    def add(self, doc_id, document):
+        self._add(doc_id, document)
+        self.pending.append((doc_id, document))
+
+    def discard(self, doc_id):
+        self._discard(doc_id)
+        self.pending.append((doc_id, None))
+
+    def truncate(self):
+        """Remove all the documents, the next commit rewrites the snapshot."""
+        self.reset()
+        self.pending, self.truncated = [], True
+
+    def _add(self, doc_id, document):
+        self._discard(doc_id)
+        self.documents[doc_id] = document
+        for field, value in document.items():
+            if value is None:
+                continue
+            if isinstance(value, TEXT_TYPES):
+                field_terms = self.terms.setdefault(field, {})
+                for term in set(tokenize(value)):
+                    field_terms.setdefault(term, set()).add(doc_id)
+            else:
+                self.values.setdefault(field, {}).setdefault(value, set()).add(doc_id)
+        self._sorted_terms = {}
+
+    def _discard(self, doc_id):
+        document = self.documents.pop(doc_id, None)
+        if document is None:
+            return
+        for field, value in document.items():
+            if value is None:
+                continue
+            if isinstance(value, TEXT_TYPES):
+                index, keys = self.terms[field], set(tokenize(value))
+            else:
+                index, keys = self.values[field], [value]
+            for key in keys:
+                index[key].discard(doc_id)
+                if not index[key]:
+                    del index[key]
+        self._sorted_terms = {}
+
+    def term(self, field, term):
+        return self.terms.get(field, {}).get(term, set())
+
+    def prefix(self, field, prefix):
+        terms = self._sorted_terms.get(field)
+        if terms is None:
+            terms = self._sorted_terms[field] = sorted(self.terms.get(field, {}))
+        ids = set()
+        for term in terms[bisect.bisect_left(terms, prefix):]:
+            if not term.startswith(prefix):
+                break
+            ids |= self.terms[field][term]
+        return ids
+
+    def value(self, field, value):
+        try:
+            return self.values.get(field, {}).get(value, set())
+        except TypeError:
+            # Unhashable values are never indexed whole.
+            return set()
+
+
+class EmbeddedSearchBackend(BaseSearchBackend):
+
+    def __init__(self, connection_alias, **connection_options):
+        super(EmbeddedSearchBackend, self).__init__(connection_alias, **connection_options)
+        index_name = connection_options.get('INDEX_NAME', connection_alias)
+        path = connection_options.get('PATH')
+        if path:
+            path = os.path.join(path, '{0}.pickle'.format(index_name))
+        self.store = get_store(path, index_name)
+
+    def update(self, index, iterable, commit=True):
+        documents = []
+        for obj in iterable:
+            try:
+                documents.append((get_identifier(obj), index.full_prepare(obj)))
+            except SkipDocument:
+                logger.debug(u'Indexing for object `%s` skipped', obj)
+            except Exception:
+                if not self.silently_fail:
+                    raise
+                logger.error(u'Preparing object for update failed', exc_info=True,
+                             extra={'data': {'index': index, 'object': get_identifier(obj)}})
+
+        with self.store.lock:
+            for doc_id, document in documents:
+                self.store.add(doc_id, document)
+            if commit:
+                self.store.commit()
+
+    def remove(self, obj_or_string, commit=True):
+        with self.store.lock:
+            self.store.discard(get_identifier(obj_or_string))
+            if commit:
+                self.store.commit()
+
+    def clear(self, models=None, commit=True):
+        with self.store.lock:
+            if not models:
+                self.store.truncate()
+            else:
+                self.store.load()
+                model_cts = set(get_model_ct(model) for model in models)
+                for doc_id, document in self.store.documents.items():
+                    if document[DJANGO_CT] in model_cts:
+                        self.store.discard(doc_id)
+            if commit:
+                self.store.commit()
+
+    @log_query
+    def search(self, query_string, sort_by=None, start_offset=0, end_offset=None,
+               models=None, result_class=None, limit_to_registered_models=True, **kwargs):
+        unified_index = connections[self.connection_alias].get_unified_index()
+        if models:
+            model_cts = set(get_model_ct(model) for model in models)
+        elif limit_to_registered_models:
+            model_cts = set(get_model_ct(model) for model in unified_index.get_indexed_models())
+        else:
+            model_cts = None
+
+        with self.store.lock:
+            self.store.load()
+            ids = self._evaluate(query_string, unified_index)
+            documents = [self.store.documents[doc_id] for doc_id in ids]
+
+        if model_cts is not None:
+            documents = [document for document in documents
+                         if document[DJANGO_CT] in model_cts]
+
+        documents.sort(key=lambda document: (document[DJANGO_CT], _pk_key(document)))
+        for order in reversed(sort_by or []):
+            field = unified_index.get_index_fieldname(order.lstrip('-'))
+            documents.sort(key=lambda document: document.get(field), reverse=order[0] == '-')
+
+        result_class = result_class or SearchResult
+        results = []
+        for document in documents[start_offset:end_offset]:
+            app_label, model_name = document[DJANGO_CT].split('.')
+            stored_fields = dict((key, value) for key, value in document.items()
+                                 if key not in (DJANGO_CT, DJANGO_ID))
+            results.append(result_class(app_label, model_name, document[DJANGO_ID], 1.0,
+                                        **stored_fields))
+        return {'results': results, 'hits': len(documents)}
+
+    def _evaluate(self, node, unified_index):
+        """Return the ids of the documents matching a filter tree."""
+        ids = None
+        for child in node.children:
+            if isinstance(child, tuple):
+                field, filter_type = node.split_expression(child[0])
+                if field == 'content':
+                    field = unified_index.document_field
+                else:
+                    field = unified_index.get_index_fieldname(field)
+                matched = self._filter(field, filter_type, child[1])
+            else:
+                matched = self._evaluate(child, unified_index)
+
+            if ids is None:
+                ids = matched
+            elif node.connector == node.OR:
+                ids = ids | matched
+            else:
+                ids = ids & matched
+
+        if ids is None:
+            # An empty query matches everything.
+            ids = set(self.store.documents)
+        if node.negated:
+            ids = set(self.store.documents) - ids
+        return ids
+
+    def _filter(self, field, filter_type, value):
+        if isinstance(value, Not):
+            return set(self.store.documents) - self._match_text(field, value.query_string)
+        if isinstance(value, AutoQuery):
+            return self._match_text(field, value.query_string)
+        if isinstance(value, Exact):
+            filter_type, value = 'exact', value.query_string
+        elif isinstance(value, BaseInput):
+            value = value.query_string
+
+        if filter_type in RANGE_FILTERS:
+            return self._match_range(field, RANGE_FILTERS[filter_type], value)
+        if filter_type == 'range':
+            start, end = value
+            return (self._match_range(field, operator.ge, start)
+                    & self._match_range(field, operator.le, end))
+        if filter_type == 'in':
+            ids = set()
+            for item in value:
+                ids |= self._match_value(field, item)
+            return ids
+        if filter_type == 'startswith':
+            return self._match_terms(field, u'{0}*'.format(force_text(value)))
+        if filter_type == 'endswith':
+            suffix = force_text(value).lower()
+            return self._match_documents(
+                field, lambda stored: force_text(stored).lower().endswith(suffix))
+        if filter_type == 'exact':
+            return self._match_exact(field, value)
+        # content, contains and fuzzy
+        if isinstance(value, six.string_types):
+            return self._match_text(field, value)
+        return self._match_value(field, value)
+
+    def _match_terms(self, field, word):
+        """Return the documents with all the terms of word.
+
+        The last term matches as a prefix if word ends with *. Returns
+        None if word has no terms.
+        """
+        terms = tokenize(word)
+        if not terms:
+            return None
+        ids = None
+        for i, term in enumerate(terms):
+            if i == len(terms) - 1 and word.endswith('*'):
+                matched = self.store.prefix(field, term)
+            else:
+                matched = self.store.term(field, term)
+            ids = matched if ids is None else ids & matched
+        return ids
+
+    def _match_text(self, field, text):
+        """Return the documents with all the words of text, except the -excluded ones."""
+        ids = None
+        excluded = set()
+        words = PHRASE_RE.findall(text) + PHRASE_RE.sub(' ', text).split()
+        for word in words:
+            exclude = word.startswith('-') and len(word) > 1
+            matched = self._match_terms(field, word[1:] if exclude else word)
+            if matched is None:
+                continue
+            if exclude:
+                excluded |= matched
+            else:
+                ids = matched if ids is None else ids & matched
+        if ids is None:
+            ids = set(self.store.documents) if excluded else set()
+        return ids - excluded
+
+    def _match_value(self, field, value):
+        """Return the documents with value, whole or as a term."""
+        ids = self.store.value(field, value)
+        terms = self._match_terms(field, force_text(value))
+        if terms:
+            ids = ids | terms
+        return ids
+
+    def _match_exact(self, field, value):
+        if not isinstance(value, six.string_types):
+            return self.store.value(field, value)
+        value = value.lower()
+
+        def is_exact(stored):
+            if isinstance(stored, (list, tuple)):
+                return value in [force_text(item).lower() for item in stored]
+            return force_text(stored).lower() == value
+
+        candidates = self._match_terms(field, value.rstrip('*')) or set()
+        return set(doc_id for doc_id in candidates
+                   if is_exact(self.store.documents[doc_id].get(field)))
+
+    def _match_range(self, field, compare, value):
+        ids = set()
+        for stored, value_ids in self.store.values.get(field, {}).items():
+            if compare(stored, value):
+                ids |= value_ids
+        if field in self.store.terms:
+            ids |= self._match_documents(
+                field, lambda stored: not isinstance(stored, (list, tuple))
+                and compare(stored, value))
+        return ids
+
+    def _match_documents(self, field, predicate):
+        """Return the documents whose value of field satisfies predicate."""
+        return set(doc_id for doc_id, document in self.store.documents.items()
+                   if document.get(field) is not None and predicate(document[field]))
+
+
+def _pk_key(document):
+    pk = document[DJANGO_ID]
+    return (0, int(pk), pk) if pk.isdigit() else (1, 0, pk)
+
+
+class EmbeddedSearchQuery(BaseSearchQuery):
+
+    def build_query(self):
+        """Return the filter tree itself, the backend evaluates it."""
+        return self.query_filter
+
+    def build_query_fragment(self, field, filter_type, value):
+        return u''
+
+    def __str__(self):
+        return repr(self.query_filter)
+
+
+class EmbeddedSearchEngine(BaseEngine):
+    backend = EmbeddedSearchBackend
+    query = EmbeddedSearchQuery
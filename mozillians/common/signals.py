@@ -1,5 +1,10 @@
-from django.db.models import signals
+from threading import local
+
+from django.apps import apps
 from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import signals
 
 from haystack.signals import BaseSignalProcessor
 
@@ -7,6 +12,47 @@ from mozillians.users.models import IdpProfile, UserProfile
 from mozillians.groups.models import Group
 
 
+SEARCH_DIRTY_KEY = 'search_dirty:{0}:{1}'
+SEARCH_DIRTY_TIMEOUT = 60
+
+_pending = local()
+
+
+def is_indexable(instance):
+    """Return True if the instance belongs to the search index."""
+    # Do not index incomplete profiles and not visible groups.
+    return ((isinstance(instance, UserProfile) and instance.is_complete)
+            or (isinstance(instance, Group) and instance.visible)
+            or isinstance(instance, IdpProfile))
+
+
+def flush_search_queue():
+    """Send the objects changed by this thread to the search index in one task."""
+    from mozillians.common.tasks import update_search_index
+
+    pending = getattr(_pending, 'objects', None)
+    _pending.objects = None
+    if not pending:
+        return
+
+    # Objects waiting for a flush already will be read from the db
+    # after this commit, don't queue them again.
+    dirty_objects = [(label, pk) for label, pk in sorted(pending)
+                     if cache.add(SEARCH_DIRTY_KEY.format(label, pk), True, SEARCH_DIRTY_TIMEOUT)]
+    if dirty_objects:
+        update_search_index.apply_async(args=[dirty_objects],
+                                        countdown=settings.SEARCH_INDEX_QUEUE_DELAY)
+
+
+def reindex_profile(profile):
+    """Reindex profile and its identities after a change saved with update().
+
+    update() sends no post_save, the search cards would keep the old values.
+    """
+    signal_processor = apps.get_app_config('haystack').signal_processor
+    signal_processor.handle_save(UserProfile, profile)
+
+
 # Django Haystack signals
 class SearchSignalProcessor(BaseSignalProcessor):
 
@@ -18,13 +64,32 @@ class SearchSignalProcessor(BaseSignalProcessor):
         signals.post_save.connect(self.handle_save, sender=IdpProfile)
         signals.post_delete.connect(self.handle_delete, sender=IdpProfile)
 
+    def enqueue(self, instance):
+        """Mark the instance dirty, it is indexed after the transaction commits."""
+        if getattr(_pending, 'objects', None) is None:
+            _pending.objects = set()
+        _pending.objects.add((instance._meta.label, instance.pk))
+        # Only the first callback of a transaction has anything to flush.
+        transaction.on_commit(flush_search_queue)
+
     def handle_save(self, sender, instance, **kwargs):
-        # Do not index incomplete profiles and not visible groups.
-        if not settings.DINO_PARK_ACTIVE:
-            if ((isinstance(instance, UserProfile) and instance.is_complete)
-                or (isinstance(instance, Group) and instance.visible)
-                    or (isinstance(instance, IdpProfile))):
+        if settings.DINO_PARK_ACTIVE:
+            return
+        if is_indexable(instance):
+            if settings.SEARCH_INDEX_QUEUED:
+                self.enqueue(instance)
+            else:
                 super(SearchSignalProcessor, self).handle_save(sender, instance, **kwargs)
+        if isinstance(instance, UserProfile):
+            # The identity documents carry the search cards of the profile.
+            for identity in IdpProfile.objects.filter(profile=instance):
+                self.handle_save(IdpProfile, identity)
+
+    def handle_delete(self, sender, instance, **kwargs):
+        if settings.SEARCH_INDEX_QUEUED:
+            self.enqueue(instance)
+        else:
+            super(SearchSignalProcessor, self).handle_delete(sender, instance, **kwargs)
 
     def teardown(self):
         signals.post_save.disconnect(self.handle_save, sender=UserProfile)
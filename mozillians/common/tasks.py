@@ -1,10 +1,22 @@
+from collections import defaultdict
+
+from django.apps import apps
 from django.conf import settings
+from django.core.cache import cache
 
 import requests
+from elasticsearch import ElasticsearchException
+from haystack import connection_router, connections
+from haystack.exceptions import NotHandled
+from haystack.utils import get_model_ct
 
 from mozillians.celery import app
 
 
+SEARCH_INDEX_RETRY_DELAY = 60
+SEARCH_INDEX_MAX_RETRIES = 5
+
+
 @app.task
 def celery_healthcheck():
     """Ping healthchecks.io periodically to monitor celery/celerybeat health."""
@@ -14,3 +26,54 @@ def celery_healthcheck():
         return None
     response = requests.get(url)
     return response.status_code == requests.codes.ok
+
+
+@app.task(bind=True, ignore_result=True, default_retry_delay=SEARCH_INDEX_RETRY_DELAY,
+          max_retries=SEARCH_INDEX_MAX_RETRIES)
+def update_search_index(self, dirty_objects):
+    """Index the changed objects in bulk, remove the deleted ones from the index.
+
+    dirty_objects is a list of (model label, pk) pairs. The objects are
+    read from the db when the task runs, so every object is indexed once
+    no matter how many times it was saved since it was queued. The task
+    is retried when the search backend fails, the dirty keys are already
+    cleared so the saves meanwhile queue their own update.
+    """
+    from mozillians.common.signals import SEARCH_DIRTY_KEY, is_indexable
+    from mozillians.users.tasks import SEARCH_REINDEX_KEY, get_search_reindex_backend
+
+    # Saves from now on need a new flush.
+    cache.delete_many([SEARCH_DIRTY_KEY.format(label, pk) for label, pk in dirty_objects])
+
+    backends = [connections[using].backend(using, **connections[using].options)
+                for using in connection_router.for_write()]
+    reindex_name = cache.get(SEARCH_REINDEX_KEY)
+    if reindex_name:
+        # Keep the index being rebuilt up to date too.
+        backends.append(get_search_reindex_backend(reindex_name))
+    for backend in backends:
+        # Own instances, the errors are raised without affecting the searches.
+        backend.silently_fail = False
+
+    pks_by_model = defaultdict(set)
+    for label, pk in dirty_objects:
+        pks_by_model[label].add(pk)
+
+    for label, pks in pks_by_model.items():
+        model = apps.get_model(label)
+        objects = list(model.objects.filter(pk__in=pks))
+        deleted_pks = pks - set(obj.pk for obj in objects)
+        objects = [obj for obj in objects if is_indexable(obj)]
+
+        for backend in backends:
+            try:
+                index = connections[backend.connection_alias].get_unified_index().get_index(model)
+            except NotHandled:
+                continue
+            try:
+                if objects:
+                    backend.update(index, objects)
+                for pk in deleted_pks:
+                    backend.remove('{0}.{1}'.format(get_model_ct(model), pk))
+            except ElasticsearchException as exc:
+                raise self.retry(exc=exc)
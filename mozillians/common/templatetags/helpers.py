@@ -16,6 +16,7 @@ from django.utils.safestring import mark_safe
 import bleach
 import markdown as markdown_module
 from django_jinja import library
+from functools32 import lru_cache
 from jinja2 import Markup, contextfunction
 from pytz import timezone, utc
 from sorl.thumbnail import get_thumbnail
@@ -26,6 +27,7 @@ from mozillians.common import utils
 from mozillians.users.managers import PUBLIC
 
 GRAVATAR_URL = 'https://secure.gravatar.com/avatar/{emaildigest}'
+GRAVATAR_CACHE_SIZE = 4096
 
 
 @library.global_function
@@ -64,6 +66,12 @@ def urlparams(url_, hash=None, **query):
 
 def gravatar(email, default_avatar_url=settings.DEFAULT_AVATAR_URL, size=175, rating='pg'):
     """Return the Gravatar URL for an email address."""
+    return _gravatar(email, default_avatar_url, size, rating)
+
+
+@lru_cache(maxsize=GRAVATAR_CACHE_SIZE)
+def _gravatar(email, default_avatar_url, size, rating):
+    """Memoized gravatar(), listings render the same avatars over and over."""
     url = GRAVATAR_URL.format(emaildigest=md5(email).hexdigest())
     url = urlparams(url, d=default_avatar_url, s=size, r=rating)
     return url
@@ -313,10 +321,10 @@ def get_privacy_aware_photo_url(profile, privacy_level, geometry, **kwargs):
     if profile.privacy_photo >= privacy_level:
         if not profile.photo:
             return gravatar(profile.email, size=geometry)
-        return profile.get_photo_thumbnail(geometry, **kwargs).url
+        return profile.get_photo_thumbnail_url(geometry, **kwargs)
 
-    profile.photo = ''
-    return profile.get_photo_thumbnail(geometry, **kwargs).url
+    kwargs.setdefault('crop', 'center')
+    return get_thumbnail(settings.DEFAULT_AVATAR_PATH, geometry, **kwargs).url
 
 
 # Port from jingo.helpers
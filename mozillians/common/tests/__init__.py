@@ -11,6 +11,8 @@ from django.test.utils import modify_settings, override_settings
 from mock import patch
 from nose.tools import make_decorator, ok_
 
+from mozillians.common.search_backend import reset_stores
+
 
 AUTHENTICATION_BACKENDS = (
     'mozillians.common.tests.authentication.DummyAuthenticationBackend',
@@ -30,6 +32,15 @@ ES_INDEXES = {
 @modify_settings(MIDDLEWARE={'remove': 'mozilla_django_oidc.middleware.RefreshIDToken'})
 class TestCase(BaseTestCase):
 
+    def setUp(self):
+        super(TestCase, self).setUp()
+        reset_stores()
+
+    def tearDown(self):
+        # The search index is not rolled back with the db.
+        reset_stores()
+        super(TestCase, self).tearDown()
+
     @contextmanager
     def login(self, user):
         client = Client()
@@ -23,6 +23,19 @@ class HelperTests(TestCase):
                          '39b808083f0031a56e9872?s=80&r=bar&d='
                          '%2Fmedia%2Fimg%2Fdefault_avatar.png'))
 
+    @patch('mozillians.common.templatetags.helpers.md5')
+    def test_gravatar_cached(self, md5_mock):
+        md5_mock.return_value.hexdigest.return_value = 'digest'
+        helpers._gravatar.cache_clear()
+        helpers.gravatar('foo@example.com', size=80)
+        avatar_url = helpers.gravatar('foo@example.com', size=80)
+        eq_(md5_mock.call_count, 1)
+        ok_(avatar_url.startswith('https://secure.gravatar.com/avatar/digest?'))
+
+        helpers.gravatar('foo@example.com', size=150)
+        eq_(md5_mock.call_count, 2)
+        helpers._gravatar.cache_clear()
+
     @patch('mozillians.common.templatetags.helpers.markdown_module.markdown', wraps=markdown)
     @patch('mozillians.common.templatetags.helpers.bleach.clean', wraps=clean)
     def test_markdown(self, clean_mock, markdown_mock):
@@ -0,0 +1,41 @@
+from django.core.paginator import EmptyPage
+
+from nose.tools import eq_, ok_, raises
+
+from mozillians.common.paginator import HasMorePaginator
+from mozillians.common.tests import TestCase
+
+
+class CountingList(list):
+    counted = False
+
+    def __len__(self):
+        self.counted = True
+        return super(CountingList, self).__len__()
+
+
+class HasMorePaginatorTests(TestCase):
+
+    def test_pages(self):
+        objects = CountingList(range(25))
+        paginator = HasMorePaginator(objects, 10)
+
+        page = paginator.page(1)
+        eq_(list(page), range(10))
+        ok_(page.has_next())
+        ok_(not page.has_previous())
+
+        page = paginator.page(3)
+        eq_(list(page), range(20, 25))
+        ok_(not page.has_next())
+        ok_(page.has_previous())
+        ok_(not objects.counted)
+
+    def test_empty_first_page(self):
+        page = HasMorePaginator([], 10).page(1)
+        eq_(list(page), [])
+        ok_(not page.has_next())
+
+    @raises(EmptyPage)
+    def test_page_out_of_range(self):
+        HasMorePaginator(range(5), 10).page(2)
@@ -0,0 +1,104 @@
+import os
+import shutil
+import tempfile
+
+from haystack.query import SearchQuerySet
+from mock import patch
+from nose.tools import eq_, ok_
+
+from mozillians.common import search_backend
+from mozillians.common.search_backend import EmbeddedSearchBackend, SearchStore
+from mozillians.common.tests import TestCase
+from mozillians.users.managers import MOZILLIANS, PUBLIC
+from mozillians.users.models import UserProfile
+from mozillians.users.search_indexes import UserProfileIndex
+from mozillians.users.tests import UserFactory
+
+
+class EmbeddedSearchBackendTests(TestCase):
+
+    def setUp(self):
+        super(EmbeddedSearchBackendTests, self).setUp()
+        self.profile = UserFactory.create(userprofile={'full_name': 'Foo Bar',
+                                                       'privacy_full_name': MOZILLIANS,
+                                                       'ircname': 'quux',
+                                                       'privacy_ircname': PUBLIC}).userprofile
+
+    def _search(self, **kwargs):
+        return [int(result.pk) for result in
+                SearchQuerySet().models(UserProfile).filter(**kwargs)]
+
+    def test_privacy_levels(self):
+        eq_(self._search(search_text_mozillians='foo'), [self.profile.pk])
+        eq_(self._search(search_text_public='foo'), [])
+        eq_(self._search(search_text_public='quux'), [self.profile.pk])
+        eq_(self._search(full_name='foo', privacy_full_name__gte=PUBLIC), [])
+        eq_(self._search(full_name='foo', privacy_full_name__gte=MOZILLIANS), [self.profile.pk])
+
+    def test_prefix(self):
+        eq_(self._search(search_text_mozillians='fo*'), [self.profile.pk])
+        eq_(self._search(full_name__startswith='ba'), [self.profile.pk])
+        eq_(self._search(full_name__startswith='baz'), [])
+
+    def test_auto_query(self):
+        sqs = SearchQuerySet().models(UserProfile)
+        eq_(len(sqs.auto_query('foo bar')), 1)
+        eq_(len(sqs.auto_query('foo -bar')), 0)
+
+    def test_remove(self):
+        self.profile.delete()
+        eq_(self._search(search_text_mozillians='foo'), [])
+
+    def test_persistence(self):
+        path = tempfile.mkdtemp()
+        try:
+            backend = EmbeddedSearchBackend('default', PATH=path, INDEX_NAME='persisted')
+            backend.update(UserProfileIndex(), [self.profile])
+
+            store = SearchStore(backend.store.path)
+            store.load()
+            eq_(store.term('search_text_mozillians', 'foo'),
+                set(['users.userprofile.{0}'.format(self.profile.pk)]))
+        finally:
+            shutil.rmtree(path)
+
+    def test_commit_appends_to_log(self):
+        path = tempfile.mkdtemp()
+        try:
+            backend = EmbeddedSearchBackend('default', PATH=path, INDEX_NAME='persisted')
+            backend.update(UserProfileIndex(), [self.profile])
+            ok_(os.path.exists(backend.store.log_path))
+            ok_(not os.path.exists(backend.store.path))
+            reader = SearchStore(backend.store.path)
+            reader.load()
+
+            other = UserFactory.create(userprofile={'full_name': 'Baz',
+                                                    'privacy_full_name': MOZILLIANS}).userprofile
+            backend.update(UserProfileIndex(), [other], commit=False)
+            reader.load()
+            eq_(reader.term('search_text_mozillians', 'baz'), set())
+
+            backend.remove(self.profile)
+            reader.load()
+            eq_(reader.term('search_text_mozillians', 'foo'), set())
+            eq_(reader.term('search_text_mozillians', 'baz'),
+                set(['users.userprofile.{0}'.format(other.pk)]))
+        finally:
+            shutil.rmtree(path)
+
+    def test_compact_log(self):
+        path = tempfile.mkdtemp()
+        try:
+            backend = EmbeddedSearchBackend('default', PATH=path, INDEX_NAME='persisted')
+            reader = SearchStore(backend.store.path)
+            with patch.object(search_backend, 'COMPACT_MIN_SIZE', 0):
+                backend.update(UserProfileIndex(), [self.profile])
+                reader.load()
+                backend.clear()
+            eq_(backend.store.generation, 2)
+            eq_(sorted(os.listdir(path)), ['persisted.pickle', 'persisted.pickle.lock'])
+            reader.load()
+            eq_(reader.generation, 2)
+            eq_(reader.documents, {})
+        finally:
+            shutil.rmtree(path)
@@ -0,0 +1,93 @@
+from django.core.cache import cache
+from django.test import override_settings
+
+from celery.exceptions import Retry
+from elasticsearch import TransportError
+from mock import patch
+from nose.tools import assert_raises, eq_, ok_
+
+from mozillians.common.signals import SEARCH_DIRTY_KEY, flush_search_queue
+from mozillians.common.tasks import update_search_index
+from mozillians.common.tests import TestCase
+from mozillians.users.models import IdpProfile
+from mozillians.users.tests import UserFactory
+
+
+class SearchIndexQueueTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    @override_settings(SEARCH_INDEX_QUEUED=True, SEARCH_INDEX_QUEUE_DELAY=5)
+    @patch('mozillians.common.tasks.update_search_index.apply_async')
+    def test_saves_are_coalesced(self, apply_async_mock):
+        user = UserFactory.create()
+        profile = user.userprofile
+        profile.save()
+        profile.save()
+        flush_search_queue()
+
+        eq_(apply_async_mock.call_count, 1)
+        kwargs = apply_async_mock.call_args[1]
+        ok_(('users.UserProfile', profile.pk) in kwargs['args'][0])
+        eq_(kwargs['countdown'], 5)
+
+        # Already queued, the pending task will pick up the change.
+        profile.save()
+        flush_search_queue()
+        eq_(apply_async_mock.call_count, 1)
+
+    @override_settings(SEARCH_INDEX_QUEUED=True)
+    @patch('mozillians.common.tasks.update_search_index.apply_async')
+    def test_profile_save_queues_identities(self, apply_async_mock):
+        profile = UserFactory.create().userprofile
+        identity = IdpProfile.objects.create(profile=profile, auth0_user_id='github|foo',
+                                             email='foo@example.com', primary=True)
+        flush_search_queue()
+        cache.clear()
+        apply_async_mock.reset_mock()
+
+        profile.save()
+        flush_search_queue()
+
+        eq_(set(apply_async_mock.call_args[1]['args'][0]),
+            set([('users.UserProfile', profile.pk), ('users.IdpProfile', identity.pk)]))
+
+    @override_settings(SEARCH_INDEX_QUEUED=False)
+    @patch('mozillians.common.tasks.update_search_index.apply_async')
+    def test_not_queued(self, apply_async_mock):
+        UserFactory.create().userprofile.save()
+        flush_search_queue()
+        ok_(not apply_async_mock.called)
+
+    @patch('mozillians.common.tasks.connections')
+    @patch('mozillians.common.tasks.connection_router')
+    def test_update_search_index(self, router_mock, connections_mock):
+        router_mock.for_write.return_value = ['default']
+        backend = connections_mock['default'].backend.return_value
+        profile = UserFactory.create().userprofile
+        cache.set(SEARCH_DIRTY_KEY.format('users.UserProfile', profile.pk), True)
+
+        update_search_index([('users.UserProfile', profile.pk),
+                             ('users.UserProfile', profile.pk + 1000)])
+
+        ok_(not cache.get(SEARCH_DIRTY_KEY.format('users.UserProfile', profile.pk)))
+        eq_(backend.update.call_count, 1)
+        eq_(backend.update.call_args[0][1], [profile])
+        backend.remove.assert_called_with('users.userprofile.{0}'.format(profile.pk + 1000))
+        ok_(not backend.silently_fail)
+
+    @patch('mozillians.common.tasks.update_search_index.retry')
+    @patch('mozillians.common.tasks.connections')
+    @patch('mozillians.common.tasks.connection_router')
+    def test_update_search_index_retry(self, router_mock, connections_mock, retry_mock):
+        router_mock.for_write.return_value = ['default']
+        backend = connections_mock['default'].backend.return_value
+        exc = TransportError(503, 'unavailable')
+        backend.update.side_effect = exc
+        retry_mock.side_effect = Retry
+        profile = UserFactory.create().userprofile
+
+        with assert_raises(Retry):
+            update_search_index([('users.UserProfile', profile.pk)])
+        retry_mock.assert_called_with(exc=exc)
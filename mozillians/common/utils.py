@@ -1,6 +1,8 @@
 import sys
+import time
 
 from django.conf import settings
+from django.core.cache import cache
 
 import requests
 import waffle
@@ -63,6 +65,30 @@ def is_test_environment():
     return False
 
 
+def get_cache_generation(name):
+    """Return the current generation of name, used to version cache keys.
+
+    Generations start from the current time, so that they keep growing
+    even if the counter is evicted from the cache.
+    """
+    key = 'generation:{0}'.format(name)
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, int(time.time() * 1000), None)
+        generation = cache.get(key, 0)
+    return generation
+
+
+def bump_cache_generation(name):
+    """Invalidate all the cache keys versioned with the generation of name."""
+    key = 'generation:{0}'.format(name)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # The counter is not in the cache, start a new generation.
+        cache.add(key, int(time.time() * 1000), None)
+
+
 def bundle_profile_data(profile_id, delete=False):
     """Packs all the Identity Profiles of a user into a dictionary."""
     from mozillians.common.templatetags.helpers import get_object_or_none
@@ -26,7 +26,7 @@ def dino_park_resolver(attname, default_value, root, info, *args):
             profile = user.userprofile
             # We are looking for vouches! Let's return a few
             if attname == 'vouches':
-                return Vouch.objects.filter(vouchee=profile)
+                return Vouch.objects.filter(vouchee=profile).select_related('voucher__user')
             return profile
 
     if profile_attr and hasattr(profile_attr, 'get'):
@@ -268,11 +268,13 @@ class GroupAdmin(GroupBaseAdmin):
 
     def full_member_count(self, obj):
         """Return number of members in group."""
-        return obj.groupmembership_set.filter(status=GroupMembership.MEMBER).count()
+        return obj.member_count
+    full_member_count.admin_order_field = 'member_count'
 
     def pending_member_count(self, obj):
         """Return number of pending members in group."""
-        return obj.groupmembership_set.filter(status=GroupMembership.PENDING).count()
+        return obj.pending_count
+    pending_member_count.admin_order_field = 'pending_count'
 
     def pending_terms_member_count(self, obj):
         """Return number of members in group who haven't accepted terms yet."""
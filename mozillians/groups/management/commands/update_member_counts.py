@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from mozillians.groups.models import Group, Skill
+
+
+class Command(BaseCommand):
+    args = '(no args)'
+    help = 'Recounts the stored member counts of all the groups and skills'
+
+    def handle(self, *args, **options):
+        for model in [Group, Skill]:
+            model.update_member_counts()
+            self.stdout.write('Updated the member counts of {0} {1}.\n'.format(
+                model.objects.count(), model._meta.verbose_name_plural))
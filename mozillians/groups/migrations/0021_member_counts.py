@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def count_members(through, field, **filters):
+    counts = (through.objects.filter(**{field: OuterRef('pk')}).filter(**filters)
+              .values(field).annotate(count=Count('pk')).values('count'))
+    return Coalesce(Subquery(counts, output_field=models.IntegerField()), 0)
+
+
+def update_member_counts(apps, schema_editor):
+    Group = apps.get_model('groups', 'Group')
+    GroupMembership = apps.get_model('groups', 'GroupMembership')
+    Skill = apps.get_model('groups', 'Skill')
+    UserProfile = apps.get_model('users', 'UserProfile')
+
+    Group.objects.update(member_count=count_members(GroupMembership, 'group', status='member'),
+                         pending_count=count_members(GroupMembership, 'group', status='pending'))
+    Skill.objects.update(member_count=count_members(UserProfile.skills.through, 'skill'))
+
+
+def backwards(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('groups', '0020_auto_20171206_0641'),
+        ('users', '0048_invitationcandidate'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='group',
+            name='member_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='group',
+            name='pending_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='skill',
+            name='member_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(update_member_counts, backwards),
+    ]
@@ -1,7 +1,12 @@
+from contextlib import contextmanager
+from threading import local
+
 from django.core.exceptions import ValidationError
 from django.conf import settings
-from django.db import models
-from django.db.models import Q
+from django.core.cache import cache
+from django.db import models, transaction
+from django.db.models import Count, OuterRef, Q, Subquery
+from django.db.models.functions import Coalesce
 from django.utils.timezone import now
 from django.utils.translation import ugettext as _
 from django.utils.translation import ugettext_lazy as _lazy
@@ -10,22 +15,30 @@ from autoslug.fields import AutoSlugField
 
 from mozillians.common.templatetags.helpers import get_object_or_none
 from mozillians.common.urlresolvers import reverse
-from mozillians.common.utils import absolutify
-from mozillians.groups.managers import GroupBaseManager, GroupManager, GroupQuerySet
+from mozillians.common.utils import absolutify, bump_cache_generation, get_cache_generation
+from mozillians.groups.managers import GroupBaseManager, GroupQuerySet
 from mozillians.groups.templatetags.helpers import slugify
 from mozillians.groups.tasks import email_membership_change
 from mozillians.users.tasks import (unsubscribe_from_basket_task, subscribe_user_to_basket,
                                     send_userprofile_to_cis)
 
 
+COMMON_SKILLS_LIMIT = 15
+COMMON_SKILLS_CACHE_TIMEOUT = 60 * 60
+
+
 class GroupBase(models.Model):
     """Base class for groups in Mozillians."""
     name = models.CharField(db_index=True, max_length=100,
                             unique=True, verbose_name=_lazy(u'Name'))
     url = models.SlugField(blank=True)
+    member_count = models.PositiveIntegerField(default=0, editable=False)
 
     objects = GroupBaseManager.from_queryset(GroupQuerySet)()
 
+    # Maintained by update_member_counts, never written by save.
+    COUNT_FIELDS = ['member_count']
+
     class Meta:
         abstract = True
         ordering = ['name']
@@ -53,15 +66,63 @@ class GroupBase(models.Model):
         results = results.distinct()
         return results
 
+    @classmethod
+    def autocomplete(cls, query, limit=None):
+        """Return the (pk, name) of the groups matching query, for autocompletes.
+
+        Same matches as search, answered from the in memory name index,
+        popular groups first.
+        """
+        from mozillians.groups.name_index import get_name_index
+
+        return get_name_index(cls).search(query, limit)
+
+    @classmethod
+    def _count_members(cls, **filters):
+        """Return an expression counting the memberships of each group."""
+        through = cls.members.through
+        field = cls._meta.model_name
+        counts = (through.objects.filter(**{field: OuterRef('pk')}).filter(**filters)
+                  .values(field).annotate(count=Count('pk')).values('count'))
+        return Coalesce(Subquery(counts, output_field=models.IntegerField()), 0)
+
+    @classmethod
+    def get_member_counts(cls):
+        return {'member_count': cls._count_members()}
+
+    @classmethod
+    def update_member_counts(cls, pks=None):
+        """Store the member counts of the groups with pks, or of all the groups.
+
+        Runs on every membership change, see groups.signals, and from the
+        update_member_counts command.
+        """
+        from mozillians.groups.name_index import get_generation_name
+
+        queryset = cls.objects.all()
+        if pks is not None:
+            queryset = queryset.filter(pk__in=pks)
+        queryset.update(**cls.get_member_counts())
+        # The autocompletes rank the names by member count.
+        bump_cache_generation(get_generation_name(cls))
+
+    def _save(self):
+        if self._state.adding:
+            super(GroupBase, self).save()
+        else:
+            update_fields = [field.name for field in self._meta.concrete_fields
+                             if not field.primary_key and field.name not in self.COUNT_FIELDS]
+            super(GroupBase, self).save(update_fields=update_fields)
+
     def save(self, *args, **kwargs):
         """Override save method."""
 
         self.name = self.name.lower()
-        super(GroupBase, self).save()
+        self._save()
         if not self.url:
             alias = self.ALIAS_MODEL.objects.create(name=self.name, alias=self)
             self.url = alias.url
-            super(GroupBase, self).save()
+            self._save()
 
     def __unicode__(self):
         return self.name
@@ -154,6 +215,29 @@ class GroupAlias(GroupAliasBase):
     alias = models.ForeignKey('Group', related_name='aliases')
 
 
+_bulk_membership_changes = local()
+
+
+@contextmanager
+def bulk_membership_changes():
+    """Mark the membership changes of this thread as a bulk change.
+
+    The GroupMembership signal receivers do nothing while it is active,
+    the code making the change applies their effects itself, once for
+    all the memberships. See Group.expire_memberships.
+    """
+    active = in_bulk_membership_changes()
+    _bulk_membership_changes.active = True
+    try:
+        yield
+    finally:
+        _bulk_membership_changes.active = active
+
+
+def in_bulk_membership_changes():
+    return getattr(_bulk_membership_changes, 'active', False)
+
+
 class GroupMembership(models.Model):
     """
     Through model for UserProfile <-> Group relationship
@@ -244,6 +328,7 @@ class Group(GroupBase):
                         u'intended to keep system groups like "staff" from cluttering up the '
                         u'interface.')
     )
+    pending_count = models.PositiveIntegerField(default=0, editable=False)
     max_reminder = models.IntegerField(
         default=0,
         help_text=(u'The max PK of pending membership requests the last time we sent the '
@@ -268,7 +353,12 @@ class Group(GroupBase):
                                           choices=ACCESS_GROUP_TYPES,
                                           verbose_name='Is this an access group?')
 
-    objects = GroupManager.from_queryset(GroupQuerySet)()
+    COUNT_FIELDS = ['member_count', 'pending_count']
+
+    @classmethod
+    def get_member_counts(cls):
+        return {'member_count': cls._count_members(status=GroupMembership.MEMBER),
+                'pending_count': cls._count_members(status=GroupMembership.PENDING)}
 
     @classmethod
     def get_functional_areas(cls):
@@ -293,6 +383,33 @@ class Group(GroupBase):
     def search(cls, query):
         return super(Group, cls).search(query).visible()
 
+    @classmethod
+    def get_common_skills_generation(cls, pk):
+        return 'common_skills:{0}'.format(pk)
+
+    def get_common_skills(self, limit=COMMON_SKILLS_LIMIT):
+        """Return the skills shared by most members, at most limit of them.
+
+        Only skills shared by at least two members are returned. The result
+        is cached, versioned with a generation bumped by groups.signals when
+        the members of the group or their skills change, or a skill of
+        theirs is renamed or deleted.
+        """
+        generation = get_cache_generation(self.get_common_skills_generation(self.pk))
+        cache_key = 'common_skills:{0}:{1}:{2}'.format(self.pk, limit, generation)
+        skills = cache.get(cache_key)
+        if skills is None:
+            through = Skill.members.through
+            counts = (through.objects.filter(userprofile__groupmembership__group=self,
+                                             userprofile__groupmembership__status=(
+                                                 GroupMembership.MEMBER))
+                      .values_list('skill', 'skill__name', 'skill__url')
+                      .annotate(count=Count('userprofile'))
+                      .filter(count__gt=1).order_by('-count', 'skill__name'))
+            skills = [(pk, name, url) for pk, name, url, count in counts[:limit]]
+            cache.set(cache_key, skills, COMMON_SKILLS_CACHE_TIMEOUT)
+        return [Skill(pk=pk, name=name, url=url) for pk, name, url in skills]
+
     def merge_groups(self, group_list):
         for membership in GroupMembership.objects.filter(group__in=group_list):
             # add_member will never demote someone, so just add them with the current membership
@@ -353,6 +470,8 @@ class Group(GroupBase):
                     subscribe_user_to_basket.delay(userprofile.id,
                                                    [settings.BASKET_NDA_NEWSLETTER])
 
+        userprofile.invalidate_privacy_clearance()
+
         if inviter:
             # Set the invite to the last person who renewed the membership
             invite = get_object_or_none(Invite, group=membership.group, redeemer=userprofile)
@@ -422,6 +541,8 @@ class Group(GroupBase):
             membership.save()
             send_email = True
 
+        userprofile.invalidate_privacy_clearance()
+
         # If group is the NDA group, unsubscribe user from the newsletter.
         if self.name == settings.NDA_GROUP:
             unsubscribe_from_basket_task.delay(userprofile.email, [settings.BASKET_NDA_NEWSLETTER])
@@ -429,6 +550,109 @@ class Group(GroupBase):
         if send_email:
             email_membership_change.delay(self.pk, userprofile.user.pk, old_status, status)
 
+    def expire_memberships(self, memberships):
+        """Remove the given memberships of this group in bulk.
+
+        Leaves the same end state as calling remove_member for each of them
+        with the status used for expired memberships, using a few set based
+        statements inside a transaction. The membership signal receivers
+        are muted with bulk_membership_changes, their effects are applied
+        once for all the memberships. Emailing the members and updating CIS
+        is left to the caller, the changes are returned as
+        (userprofile_id, user_id, old_status, new_status).
+        """
+        # Avoid circular dependencies
+        from mozillians.users.models import InvitationCandidate, UserProfile
+
+        status = None
+        if self.accepting_new_members != Group.OPEN:
+            status = GroupMembership.PENDING
+
+        with transaction.atomic():
+            rows = memberships.select_for_update().values_list(
+                'pk', 'userprofile_id', 'userprofile__user_id', 'status')
+            changes = []
+            demoted_pks = []
+            removed_pks = []
+            removed_profile_ids = []
+            for pk, profile_id, user_id, old_status in rows:
+                if status and old_status == GroupMembership.MEMBER:
+                    demoted_pks.append(pk)
+                else:
+                    removed_pks.append(pk)
+                    removed_profile_ids.append(profile_id)
+                changes.append((profile_id, user_id, old_status, status))
+            if not changes:
+                return []
+
+            # update() does not touch updated_on, set it like save() does.
+            GroupMembership.objects.filter(pk__in=demoted_pks).update(
+                status=status, needs_renewal=False, updated_on=now())
+
+            group_ids = set([self.pk])
+            if removed_pks:
+                with bulk_membership_changes():
+                    GroupMembership.objects.filter(pk__in=removed_pks).delete()
+                Invite.objects.filter(group=self, redeemer__in=removed_profile_ids).delete()
+                if self.name == settings.NDA_GROUP:
+                    group_ids.update(self._remove_access_memberships(removed_profile_ids))
+
+            Group.update_member_counts(group_ids)
+
+        for group_id in group_ids:
+            bump_cache_generation(Group.get_common_skills_generation(group_id))
+        profile_ids = [profile_id for profile_id, _, _, _ in changes]
+        for profile_id in profile_ids:
+            bump_cache_generation('privacy_clearance:{0}'.format(profile_id))
+
+        if self.name == settings.NDA_GROUP:
+            for profile in UserProfile.objects.filter(pk__in=profile_ids):
+                InvitationCandidate.refresh(profile.pk)
+                unsubscribe_from_basket_task.delay(profile.email,
+                                                   [settings.BASKET_NDA_NEWSLETTER])
+        return changes
+
+    def _remove_access_memberships(self, profile_ids):
+        """Remove the profiles that are not staff from all the access groups.
+
+        Bulk version of what remove_member does for the NDA group, returns
+        the ids of the access groups that changed.
+        """
+        # Avoid circular dependencies
+        from mozillians.users.models import UserProfile
+
+        profiles = dict((profile.pk, profile) for profile in
+                        UserProfile.objects.filter(pk__in=profile_ids).select_related('user')
+                        if not profile.can_create_access_groups)
+        access_memberships = list(GroupMembership.objects.filter(
+            userprofile__in=profiles.keys(), group__is_access_group=True
+        ).values_list('pk', 'group_id', 'userprofile_id'))
+        if not access_memberships:
+            return set()
+
+        pairs = set((group_id, profile_id) for _, group_id, profile_id in access_memberships)
+        curatorships = (Group.curators.through.objects
+                        .filter(group__in=[group_id for group_id, _ in pairs],
+                                userprofile__in=profiles.keys())
+                        .select_related('group'))
+        for curatorship in curatorships:
+            group = curatorship.group
+            profile = profiles[curatorship.userprofile_id]
+            if (group.pk, profile.pk) not in pairs:
+                continue
+            if not group.curator_can_leave(profile):
+                # If the user is the only curator, let's add the superusers as curators
+                # as a fallback option
+                for super_user in UserProfile.objects.filter(user__is_superuser=True):
+                    group.curators.add(super_user)
+                    if not group.has_member(super_user):
+                        group.add_member(super_user)
+            group.curators.remove(profile)
+
+        with bulk_membership_changes():
+            GroupMembership.objects.filter(pk__in=[pk for pk, _, _ in access_memberships]).delete()
+        return set(group_id for group_id, _ in pairs)
+
     def has_member(self, userprofile):
         """
         Return True if this user is in this group with status MEMBER.
@@ -0,0 +1,89 @@
+"""
+In memory index of the group and skill names, for the autocompletes.
+
+Every worker builds the index of a model the first time it is searched
+and keeps it until the cache generation of the model is bumped, which
+happens whenever a group, a skill or one of their aliases changes (see
+groups.signals) and when their member counts are updated. Searching the
+index does not touch the database.
+"""
+import threading
+
+from mozillians.common.utils import get_cache_generation
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_generation_name(model):
+    return 'group_names:{0}'.format(model._meta.label)
+
+
+def get_trigrams(text):
+    return set(text[i:i + 3] for i in range(len(text) - 2))
+
+
+def get_name_index(model):
+    """Return the up to date name index of a Group or Skill model."""
+    generation = get_cache_generation(get_generation_name(model))
+    index = _indexes.get(model)
+    if index is None or index.generation != generation:
+        with _indexes_lock:
+            index = _indexes.get(model)
+            if index is None or index.generation != generation:
+                index = _indexes[model] = GroupNameIndex.build(model, generation)
+    return index
+
+
+class GroupNameIndex(object):
+    """Trigram index of the names and aliases of groups.
+
+    Matches the groups with a name or alias containing the query, like
+    GroupBase.search. The groups with a name or alias starting with the
+    query come first, then the ones with the most members.
+    """
+
+    def __init__(self, generation, groups, aliases):
+        """groups are (pk, name, member count) and aliases (group pk, name) tuples."""
+        self.generation = generation
+        self.groups = dict((pk, (name, member_count or 0)) for pk, name, member_count in groups)
+        aliases = set((name.lower(), pk) for pk, name in aliases if pk in self.groups)
+        aliases.update((name.lower(), pk) for pk, (name, _) in self.groups.items())
+        self.aliases = sorted(aliases)
+        self.trigrams = {}
+        for position, (name, _) in enumerate(self.aliases):
+            for trigram in get_trigrams(name):
+                self.trigrams.setdefault(trigram, set()).add(position)
+
+    @classmethod
+    def build(cls, model, generation):
+        queryset = model.objects.all()
+        if 'visible' in [field.name for field in model._meta.get_fields()]:
+            queryset = queryset.filter(visible=True)
+        groups = queryset.values_list('pk', 'name', 'member_count')
+        aliases = model.ALIAS_MODEL.objects.values_list('alias_id', 'name')
+        return cls(generation, groups, aliases)
+
+    def search(self, query, limit=None):
+        """Return the (pk, name) of the groups matching query, best matches first."""
+        query = query.lower()
+        trigrams = get_trigrams(query)
+        if trigrams:
+            positions = set.intersection(*[self.trigrams.get(trigram, set())
+                                           for trigram in trigrams])
+        else:
+            positions = range(len(self.aliases))
+
+        # pk -> True if a name of the group starts with the query
+        matches = {}
+        for position in positions:
+            name, group_pk = self.aliases[position]
+            if query in name:
+                matches[group_pk] = matches.get(group_pk) or name.startswith(query)
+
+        def rank(pk):
+            name, member_count = self.groups[pk]
+            return (not matches[pk], -member_count, name)
+
+        return [(pk, self.groups[pk][0]) for pk in sorted(matches, key=rank)[:limit]]
@@ -1,3 +1,5 @@
+import json
+
 from haystack import indexes
 
 from mozillians.groups.models import Group
@@ -12,6 +14,17 @@ class GroupIndex(indexes.SearchIndex, indexes.Indexable):
     wiki = indexes.CharField(model_attr='wiki')
     description = indexes.CharField(model_attr='description')
     visible = indexes.CharField(model_attr='visible')
+    # the search result card, see users.search_indexes.get_search_card
+    card = indexes.CharField(indexed=False)
 
     def get_model(self):
         return Group
+
+    def prepare_card(self, obj):
+        # The member count changes without the group being saved, the
+        # search view reads it from the db.
+        return json.dumps({
+            'type': 'group',
+            'name': obj.name,
+            'url': obj.url,
+        })
@@ -1,11 +1,122 @@
 from django.db.models import signals
 from django.dispatch import receiver
 
-from mozillians.groups.models import GroupMembership
+from mozillians.common.utils import bump_cache_generation
+from mozillians.groups.models import (Group, GroupAlias, GroupMembership, Skill,
+                                      SkillAlias, in_bulk_membership_changes)
+from mozillians.groups.name_index import get_generation_name
 
 
 @receiver(signals.post_delete, sender=GroupMembership, dispatch_uid='delete_groupmembership_sig')
 def delete_groupmembership(sender, instance, **kwargs):
     from mozillians.users.tasks import send_userprofile_to_cis
 
+    if in_bulk_membership_changes():
+        return
     send_userprofile_to_cis.delay(instance.userprofile.pk)
+
+
+@receiver(signals.post_save, sender=GroupMembership,
+          dispatch_uid='groupmembership_privacy_clearance_sig')
+@receiver(signals.post_delete, sender=GroupMembership,
+          dispatch_uid='delete_groupmembership_privacy_clearance_sig')
+def invalidate_privacy_clearance(sender, instance, **kwargs):
+    """Invalidate the cached privacy clearance of the member.
+
+    Covers the memberships changed outside Group.add_member and
+    Group.remove_member, e.g. from the admin.
+    """
+    if in_bulk_membership_changes():
+        return
+    bump_cache_generation('privacy_clearance:{0}'.format(instance.userprofile_id))
+
+
+@receiver(signals.post_save, sender=Group, dispatch_uid='group_name_index_sig')
+@receiver(signals.post_delete, sender=Group, dispatch_uid='delete_group_name_index_sig')
+@receiver(signals.post_save, sender=GroupAlias, dispatch_uid='groupalias_name_index_sig')
+@receiver(signals.post_delete, sender=GroupAlias,
+          dispatch_uid='delete_groupalias_name_index_sig')
+def invalidate_group_name_index(sender, instance, **kwargs):
+    """Rebuild the group autocomplete index of every worker."""
+    bump_cache_generation(get_generation_name(Group))
+
+
+@receiver(signals.post_save, sender=Skill, dispatch_uid='skill_name_index_sig')
+@receiver(signals.post_delete, sender=Skill, dispatch_uid='delete_skill_name_index_sig')
+@receiver(signals.post_save, sender=SkillAlias, dispatch_uid='skillalias_name_index_sig')
+@receiver(signals.post_delete, sender=SkillAlias,
+          dispatch_uid='delete_skillalias_name_index_sig')
+def invalidate_skill_name_index(sender, instance, **kwargs):
+    """Rebuild the skill autocomplete index of every worker."""
+    bump_cache_generation(get_generation_name(Skill))
+
+
+@receiver(signals.post_save, sender=GroupMembership, dispatch_uid='group_member_counts_sig')
+@receiver(signals.post_delete, sender=GroupMembership,
+          dispatch_uid='delete_group_member_counts_sig')
+def update_group_member_counts(sender, instance, **kwargs):
+    if not kwargs.get('raw') and not in_bulk_membership_changes():
+        Group.update_member_counts([instance.group_id])
+
+
+@receiver(signals.m2m_changed, sender=Skill.members.through,
+          dispatch_uid='skill_member_counts_sig')
+def update_skill_member_counts(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # The members of a skill changed.
+        if action in ['post_add', 'post_remove', 'post_clear']:
+            Skill.update_member_counts([instance.pk])
+    elif action == 'pre_clear':
+        instance._cleared_skill_ids = list(instance.skills.values_list('pk', flat=True))
+    elif action == 'post_clear':
+        Skill.update_member_counts(instance.__dict__.pop('_cleared_skill_ids', []))
+    elif action in ['post_add', 'post_remove'] and pk_set:
+        Skill.update_member_counts(pk_set)
+
+
+@receiver(signals.post_save, sender=GroupMembership, dispatch_uid='group_common_skills_sig')
+@receiver(signals.post_delete, sender=GroupMembership,
+          dispatch_uid='delete_group_common_skills_sig')
+def invalidate_common_skills(sender, instance, **kwargs):
+    if in_bulk_membership_changes():
+        return
+    bump_cache_generation(Group.get_common_skills_generation(instance.group_id))
+
+
+@receiver(signals.m2m_changed, sender=Skill.members.through,
+          dispatch_uid='profile_skills_common_skills_sig')
+def invalidate_members_common_skills(sender, instance, action, reverse, pk_set, **kwargs):
+    """Invalidate the common skills of the groups of the profiles with changed skills."""
+    if reverse:
+        if action == 'pre_clear':
+            profile_ids = list(instance.members.values_list('pk', flat=True))
+        elif action in ['post_add', 'post_remove']:
+            profile_ids = pk_set
+        else:
+            return
+    elif action in ['post_add', 'post_remove', 'post_clear']:
+        profile_ids = [instance.pk]
+    else:
+        return
+
+    _invalidate_groups_common_skills(userprofile__in=profile_ids)
+
+
+@receiver(signals.post_save, sender=Skill, dispatch_uid='skill_common_skills_sig')
+@receiver(signals.pre_delete, sender=Skill, dispatch_uid='delete_skill_common_skills_sig')
+def invalidate_skill_common_skills(sender, instance, **kwargs):
+    """Invalidate the common skills of the groups of the members of a renamed or deleted skill.
+
+    Runs before the delete, the members of the skill are gone afterwards.
+    """
+    if kwargs.get('raw') or kwargs.get('created'):
+        return
+    _invalidate_groups_common_skills(userprofile__skills=instance)
+
+
+def _invalidate_groups_common_skills(**filters):
+    """Invalidate the common skills of the groups of the members matching filters."""
+    group_ids = (GroupMembership.objects.filter(status=GroupMembership.MEMBER, **filters)
+                 .values_list('group_id', flat=True).distinct())
+    for group_id in group_ids:
+        bump_cache_generation(Group.get_common_skills_generation(group_id))
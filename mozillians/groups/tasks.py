@@ -1,9 +1,12 @@
+import logging
+import time
+from collections import defaultdict
 from datetime import datetime, timedelta
 
 from django.conf import settings
 from django.contrib.auth.models import User
-from django.core.mail import send_mail
-from django.db.models import Count, Max
+from django.core.mail import get_connection, send_mail, send_mass_mail
+from django.db.models import Case, Count, F, IntegerField, Max, Value, When
 from django.template.loader import get_template, render_to_string
 from django.utils.timezone import now
 from django.utils.translation import activate, ungettext
@@ -12,10 +15,10 @@ from django.utils.translation import ugettext as _
 from waffle import switch_is_active
 
 from mozillians.celery import app
-from mozillians.common.templatetags.helpers import get_object_or_none
 
 
 DAYS_BEFORE_INVALIDATION = 2 * 7  # 14 days
+logger = logging.getLogger(__name__)
 
 
 @app.task(ignore_result=True)
@@ -36,64 +39,62 @@ def send_pending_membership_emails():
     For each curated group that has pending memberships that the curators have
     not yet been emailed about, send to all the curators an email with the count
     of all pending memberships and a link to view and manage the requests.
+
+    Runs the same number of queries however many groups need a reminder.
     """
 
     from mozillians.groups.models import Group, GroupMembership
 
-    # Curated groups that have pending membership requests
-    groups = (Group.objects.exclude(curators__isnull=True)
-                           .exclude(accepting_new_members=Group.CLOSED))
-    groups = groups.filter(groupmembership__status=GroupMembership.PENDING).distinct()
+    # Curated groups with pending membership requests newer than the last reminder
+    curated_group_ids = Group.curators.through.objects.values('group')
+    groups = list(Group.objects.exclude(accepting_new_members=Group.CLOSED)
+                  .filter(pk__in=curated_group_ids,
+                          groupmembership__status=GroupMembership.PENDING)
+                  .annotate(max_pk=Max('groupmembership__pk'),
+                            pending_requests=Count('groupmembership__pk'))
+                  .filter(max_pk__gt=F('max_reminder')))
+    if not groups:
+        return
+
+    curator_emails = defaultdict(list)
+    curatorships = (Group.curators.through.objects.filter(group__in=groups)
+                    .select_related('userprofile__user'))
+    for curatorship in curatorships:
+        curator_emails[curatorship.group_id].append(curatorship.userprofile.email)
+
+    # TODO: Switch locale to curator's preferred language so translation will occur
+    # Using English for now
+    activate('en-us')
 
+    messages = []
     for group in groups:
-        # what's the max pk of pending memberships?
-        pending_memberships = group.groupmembership_set.filter(status=GroupMembership.PENDING)
-        max_pk = pending_memberships.aggregate(max_pk=Max('pk'))['max_pk']
-        curators = group.curators.all()
-        # Only send reminder if there are newer requests than we'd previously reminded about
-        if max_pk > group.max_reminder and curators:
-            # TODO: Switch locale to curator's preferred language so translation will occur
-            # Using English for now
-            activate('en-us')
-
-            count = pending_memberships.count()
-            subject = ungettext(
-                '%(count)d outstanding request to join Mozillians group "%(name)s"',
-                '%(count)d outstanding requests to join Mozillians group "%(name)s"',
-                count
-            ) % {
-                'count': count,
-                'name': group.name
-            }
-            body = render_to_string('groups/email/memberships_pending.txt', {
-                'group': group,
-                'count': count,
-            })
-
-            send_mail(subject, body, settings.FROM_NOREPLY,
-                      [profile.email for profile in curators],
-                      fail_silently=False)
-
-            group.max_reminder = max_pk
-            group.save()
-
-
-@app.task(ignore_result=True)
-def email_membership_change(group_pk, user_pk, old_status, new_status):
-    """
-    Email user that their group membership status has changed.
-
-    old_status and new_status can either be a valid value for GroupMembership.status,
-    or None if we're going from or to a state where there is no GroupMembership
-    record (e.g. if they're being removed from a group).
-
-    This is queued from Group.add_member() and Group.remove_member().
-    """
-
-    from mozillians.groups.models import Group, GroupMembership
-
-    group = Group.objects.get(pk=group_pk)
-    user = User.objects.get(pk=user_pk)
+        subject = ungettext(
+            '%(count)d outstanding request to join Mozillians group "%(name)s"',
+            '%(count)d outstanding requests to join Mozillians group "%(name)s"',
+            group.pending_requests
+        ) % {
+            'count': group.pending_requests,
+            'name': group.name
+        }
+        body = render_to_string('groups/email/memberships_pending.txt', {
+            'group': group,
+            'count': group.pending_requests,
+        })
+        messages.append((subject, body, settings.FROM_NOREPLY, curator_emails[group.pk]))
+
+    send_mass_mail(messages, fail_silently=False)
+
+    # Remember the max pk of the pending requests of each group in one update.
+    reminders = [When(pk=group.pk, then=Value(group.max_pk)) for group in groups]
+    (Group.objects.filter(pk__in=[group.pk for group in groups])
+                  .update(max_reminder=Case(*reminders, default=F('max_reminder'),
+                                            output_field=IntegerField())))
+
+
+def _get_membership_change_email(group, user, old_status, new_status):
+    """Return the subject and the body of the email of a membership change."""
+
+    from mozillians.groups.models import GroupMembership
 
     # TODO: Switch locale to user's preferred language so translation will occur
     # Using English for now
@@ -123,31 +124,91 @@ def email_membership_change(group_pk, user_pk, old_status, new_status):
         'user': user,
     }
     template = get_template(template_name)
-    body = template.render(context)
+    return subject, template.render(context)
+
+
+@app.task(ignore_result=True)
+def email_membership_change(group_pk, user_pk, old_status, new_status):
+    """
+    Email user that their group membership status has changed.
+
+    old_status and new_status can either be a valid value for GroupMembership.status,
+    or None if we're going from or to a state where there is no GroupMembership
+    record (e.g. if they're being removed from a group).
+
+    This is queued from Group.add_member() and Group.remove_member().
+    """
+
+    from mozillians.groups.models import Group
+
+    group = Group.objects.get(pk=group_pk)
+    user = User.objects.get(pk=user_pk)
+    subject, body = _get_membership_change_email(group, user, old_status, new_status)
     send_mail(subject, body, settings.FROM_NOREPLY, [user.userprofile.email], fail_silently=False)
 
 
+@app.task(ignore_result=True)
+def email_membership_changes(changes):
+    """
+    Email users that their group membership status has changed, over one connection.
+
+    changes is a list of (group_pk, user_pk, old_status, new_status), with the
+    arguments of email_membership_change. Changes that have no email are skipped.
+
+    This is queued from invalidate_group_membership().
+    """
+
+    from mozillians.groups.models import Group
+
+    groups = Group.objects.in_bulk(set(change[0] for change in changes))
+    users = User.objects.select_related('userprofile').in_bulk(
+        set(change[1] for change in changes))
+
+    messages = []
+    for group_pk, user_pk, old_status, new_status in changes:
+        group = groups.get(group_pk)
+        user = users.get(user_pk)
+        if not group or not user:
+            continue
+        try:
+            subject, body = _get_membership_change_email(group, user, old_status, new_status)
+        except ValueError:
+            continue
+        messages.append((subject, body, settings.FROM_NOREPLY, [user.userprofile.email]))
+
+    send_mass_mail(messages, fail_silently=False)
+
+
 @app.task
 def invalidate_group_membership():
     """
     For groups with defined `invalidation_days` we need to invalidate
     user membership after timedelta.
+
+    The memberships of each group are expired in bulk, then the members
+    are emailed in one batch and each affected profile is sent to CIS once.
     """
-    from mozillians.groups.models import Group, GroupMembership
+    from mozillians.groups.models import Group
+    from mozillians.users.tasks import send_userprofile_to_cis
 
     groups = Group.objects.filter(invalidation_days__isnull=False)
 
+    emails = []
+    profile_ids = set()
     for group in groups:
         curator_ids = group.curators.all().values_list('id', flat=True)
         last_update = now() - timedelta(days=group.invalidation_days)
         memberships = (group.groupmembership_set.filter(updated_on__lte=last_update)
                                                 .exclude(userprofile__id__in=curator_ids))
 
-        for member in memberships:
-            status = None
-            if group.accepting_new_members != Group.OPEN:
-                status = GroupMembership.PENDING
-            group.remove_member(member.userprofile, status=status)
+        for profile_id, user_id, old_status, new_status in group.expire_memberships(memberships):
+            emails.append((group.pk, user_id, old_status, new_status))
+            profile_ids.add(profile_id)
+
+    if emails:
+        email_membership_changes.delay(emails)
+    for profile_id in sorted(profile_ids):
+        send_userprofile_to_cis.delay(profile_id)
 
 
 @app.task
@@ -155,75 +216,97 @@ def notify_membership_renewal():
     """
     For groups with defined `invalidation_days` we need to notify users
     2 weeks prior invalidation that the membership is expiring.
+
+    The memberships, invites and curators of each group are fetched in
+    bulk and all the emails are sent over one connection. Returns the
+    number of emails sent and the duration of the run in seconds.
     """
 
     from mozillians.groups.models import Group, GroupMembership, Invite
 
+    start = time.time()
     groups = (Group.objects.filter(invalidation_days__isnull=False,
                                    invalidation_days__gte=DAYS_BEFORE_INVALIDATION)
                            .exclude(accepting_new_members=Group.OPEN).distinct())
 
-    for group in groups:
-        curator_ids = group.curators.all().values_list('id', flat=True)
-        memberships = (group.groupmembership_set.filter(status=GroupMembership.MEMBER)
-                       .exclude(userprofile__id__in=curator_ids))
-
-        # Filter memberships to be notified
-        # Switch is being used only for testing mail notifications
-        # It disables membership filtering based on date
-        if not switch_is_active('test_membership_renewal_notification'):
-            last_update_days = group.invalidation_days - DAYS_BEFORE_INVALIDATION
-            last_update = now() - timedelta(days=last_update_days)
-
-            query_start = datetime.combine(last_update.date(), datetime.min.time())
-            query_end = datetime.combine(last_update.date(), datetime.max.time())
-
-            query = {
-                'updated_on__range': [query_start, query_end],
-                'needs_renewal': False,
-            }
-            memberships = memberships.filter(**query)
-
-        member_template = get_template('groups/email/notify_member_renewal.txt')
-        curator_template = get_template('groups/email/notify_curator_renewal.txt')
-
-        for membership in memberships:
-            ctx = {
-                'member_full_name': membership.userprofile.full_name,
-                'group_name': membership.group.name,
-                'group_url': membership.group.get_absolute_url(),
-                'member_profile_url': membership.userprofile.get_absolute_url(),
-                'inviter': None
-            }
-
-            invite = get_object_or_none(Invite, group=group, redeemer=membership.userprofile)
-            if invite:
-                ctx['inviter'] = invite.inviter
-
-            subject_msg = unicode('[Mozillians] Your membership to Mozilla group "{0}" '
-                                  'is about to expire')
-            subject = _(subject_msg.format(membership.group.name))
-            message = member_template.render(ctx)
-            send_mail(subject, message, settings.FROM_NOREPLY, [membership.userprofile.email])
-
-            subject_msg = unicode('[Mozillians][{0}] Membership of "{1}" is about to expire')
-            format_args = [membership.group.name, membership.userprofile.full_name]
-            subject = _(subject_msg.format(*format_args))
-
-            # In case the membership was created after an invitation we notify inviters only
-            # Else we fallback to all group curators
-            curators = group.curators.all()
-            inviter = ctx['inviter']
-            if inviter and curators.filter(pk=inviter.id).exists():
-                curators = [inviter]
-
-            for curator in curators:
-                ctx['curator_full_name'] = curator.full_name
-                message = curator_template.render(ctx)
-                send_mail(subject, message, settings.FROM_NOREPLY, [curator.email])
-
-        # Mark these memberships ready for an early renewal
-        memberships.update(needs_renewal=True)
+    member_template = get_template('groups/email/notify_member_renewal.txt')
+    curator_template = get_template('groups/email/notify_curator_renewal.txt')
+    member_subject = unicode('[Mozillians] Your membership to Mozilla group "{0}" '
+                             'is about to expire')
+    curator_subject = unicode('[Mozillians][{0}] Membership of "{1}" is about to expire')
+
+    sent = 0
+    connection = get_connection()
+    connection.open()
+    try:
+        for group in groups:
+            curators = list(group.curators.all().select_related('user'))
+            curator_ids = [curator.id for curator in curators]
+            memberships = (group.groupmembership_set.filter(status=GroupMembership.MEMBER)
+                           .exclude(userprofile__id__in=curator_ids))
+
+            # Filter memberships to be notified
+            # Switch is being used only for testing mail notifications
+            # It disables membership filtering based on date
+            if not switch_is_active('test_membership_renewal_notification'):
+                last_update_days = group.invalidation_days - DAYS_BEFORE_INVALIDATION
+                last_update = now() - timedelta(days=last_update_days)
+
+                query_start = datetime.combine(last_update.date(), datetime.min.time())
+                query_end = datetime.combine(last_update.date(), datetime.max.time())
+
+                query = {
+                    'updated_on__range': [query_start, query_end],
+                    'needs_renewal': False,
+                }
+                memberships = memberships.filter(**query)
+
+            members = [membership.userprofile for membership in
+                       memberships.select_related('userprofile__user')]
+            if not members:
+                continue
+            invites = (Invite.objects.filter(group=group, redeemer__in=members)
+                       .select_related('inviter__user'))
+            inviters = dict((invite.redeemer_id, invite.inviter) for invite in invites)
+            group_url = group.get_absolute_url()
+
+            messages = []
+            for member in members:
+                ctx = {
+                    'member_full_name': member.full_name,
+                    'group_name': group.name,
+                    'group_url': group_url,
+                    'member_profile_url': member.get_absolute_url(),
+                    'inviter': inviters.get(member.id)
+                }
+
+                subject = _(member_subject.format(group.name))
+                messages.append((subject, member_template.render(ctx), settings.FROM_NOREPLY,
+                                 [member.email]))
+
+                # In case the membership was created after an invitation we notify inviters only
+                # Else we fallback to all group curators
+                subject = _(curator_subject.format(group.name, member.full_name))
+                inviter = ctx['inviter']
+                member_curators = curators
+                if inviter and inviter.id in curator_ids:
+                    member_curators = [inviter]
+
+                for curator in member_curators:
+                    ctx['curator_full_name'] = curator.full_name
+                    messages.append((subject, curator_template.render(ctx),
+                                     settings.FROM_NOREPLY, [curator.email]))
+
+            sent += send_mass_mail(messages, connection=connection)
+
+            # Mark these memberships ready for an early renewal
+            memberships.update(needs_renewal=True)
+    finally:
+        connection.close()
+
+    duration = time.time() - start
+    logger.info('Sent {0} membership renewal notifications in {1:.1f}s.'.format(sent, duration))
+    return {'sent': sent, 'duration': duration}
 
 
 @app.task(ignore_result=True)
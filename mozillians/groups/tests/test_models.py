@@ -7,7 +7,9 @@ from mock import patch
 from nose.tools import eq_, ok_
 
 from mozillians.common.tests import TestCase
-from mozillians.groups.models import Group, GroupAlias, GroupMembership, Skill
+from mozillians.groups.models import (Group, GroupAlias, GroupMembership, Skill,
+                                      bulk_membership_changes, in_bulk_membership_changes)
+from mozillians.groups.name_index import GroupNameIndex
 from mozillians.groups.tests import GroupAliasFactory, GroupFactory, SkillFactory
 from mozillians.users.tests import UserFactory
 
@@ -313,6 +315,22 @@ class GroupTests(TestCase):
         group.remove_member(user.userprofile)
         ok_(not group.has_member(user.userprofile))
 
+    @patch('mozillians.users.tasks.send_userprofile_to_cis')
+    def test_bulk_membership_changes(self, send_to_cis):
+        user = UserFactory.create()
+        group = GroupFactory.create()
+        group.add_member(user.userprofile)
+        send_to_cis.reset_mock()
+
+        with bulk_membership_changes():
+            ok_(in_bulk_membership_changes())
+            group.groupmembership_set.all().delete()
+        ok_(not in_bulk_membership_changes())
+
+        # The receivers are skipped, their effects are left to the caller.
+        ok_(not send_to_cis.delay.called)
+        eq_(Group.objects.get(pk=group.pk).member_count, 1)
+
 
 class GroupAliasBaseTests(TestCase):
     def test_auto_slug_field(self):
@@ -368,3 +386,102 @@ class GroupManagerTests(TestCase):
             group.add_member(u.userprofile, status=GroupMembership.PENDING_TERMS)
 
         eq_(Group.objects.get(name='foo').member_count, 3)
+        eq_(Group.objects.get(name='foo').pending_count, 4)
+
+    def test_group_member_count_remove_member(self):
+        group = GroupFactory.create(name='foo', accepting_new_members=Group.REVIEWED)
+        user_1, user_2 = UserFactory.create_batch(2)
+        group.add_member(user_1.userprofile)
+        group.add_member(user_2.userprofile)
+
+        group.remove_member(user_1.userprofile, status=GroupMembership.PENDING)
+        group = Group.objects.get(pk=group.pk)
+        eq_(group.member_count, 1)
+        eq_(group.pending_count, 1)
+
+        group.remove_member(user_1.userprofile)
+        eq_(Group.objects.get(pk=group.pk).pending_count, 0)
+
+    def test_group_member_count_merge(self):
+        group_1, group_2 = GroupFactory.create_batch(2)
+        user_1, user_2 = UserFactory.create_batch(2)
+        group_1.add_member(user_1.userprofile)
+        group_2.add_member(user_1.userprofile)
+        group_2.add_member(user_2.userprofile)
+
+        group_1.merge_groups([group_2])
+        eq_(Group.objects.get(pk=group_1.pk).member_count, 2)
+
+    def test_save_keeps_member_count(self):
+        group = GroupFactory.create(name='foo')
+        group.add_member(UserFactory.create().userprofile)
+        group.description = 'Stale counts are not saved'
+        group.save()
+        eq_(Group.objects.get(name='foo').member_count, 1)
+
+    def test_skill_member_count_profile_changes(self):
+        skill_1, skill_2 = SkillFactory.create_batch(2)
+        user = UserFactory.create()
+        user.userprofile.skills.add(skill_1, skill_2)
+        eq_(Skill.objects.get(pk=skill_1.pk).member_count, 1)
+
+        user.userprofile.skills.remove(skill_1)
+        eq_(Skill.objects.get(pk=skill_1.pk).member_count, 0)
+
+        user.userprofile.skills.clear()
+        eq_(Skill.objects.get(pk=skill_2.pk).member_count, 0)
+
+    def test_skill_member_count_profile_delete(self):
+        skill = SkillFactory.create()
+        user = UserFactory.create()
+        skill.add_member(user.userprofile)
+        user.userprofile.delete()
+        eq_(Skill.objects.get(pk=skill.pk).member_count, 0)
+
+    def test_update_member_counts(self):
+        group = GroupFactory.create()
+        group.add_member(UserFactory.create().userprofile)
+        Group.objects.update(member_count=0)
+
+        Group.update_member_counts()
+        eq_(Group.objects.get(pk=group.pk).member_count, 1)
+
+
+class GroupNameIndexTests(TestCase):
+
+    def test_search_ranking(self):
+        index = GroupNameIndex(1, [(1, 'web', 5), (2, 'webdev', 1), (3, 'the web', 10),
+                                   (4, 'python', 20)],
+                               [(2, 'frontend'), (5, 'orphan')])
+        eq_(index.search('web'), [(1, 'web'), (2, 'webdev'), (3, 'the web')])
+        eq_(index.search('We'), [(1, 'web'), (2, 'webdev'), (3, 'the web')])
+        eq_(index.search('fron'), [(2, 'webdev')])
+        eq_(index.search('n'), [(4, 'python'), (2, 'webdev')])
+        eq_(index.search('web', limit=1), [(1, 'web')])
+        eq_(index.search('orphan'), [])
+
+    def test_autocomplete(self):
+        group = GroupFactory.create(name='autocomplete group', visible=True)
+        GroupFactory.create(name='autocomplete hidden', visible=False)
+        eq_(Group.autocomplete('autocomplete'), [(group.pk, group.name)])
+
+        GroupAliasFactory.create(alias=group, name='autocomplete alias')
+        other = GroupFactory.create(name='other', visible=True)
+        other.add_member(UserFactory.create().userprofile)
+        GroupAliasFactory.create(alias=other, name='autocomplete other')
+        eq_(Group.autocomplete('autocomplete al'), [(group.pk, group.name)])
+        eq_(Group.autocomplete('autocomplete'), [(other.pk, other.name), (group.pk, group.name)])
+
+        skill = SkillFactory.create(name='autocomplete skill')
+        eq_(Skill.autocomplete('complete sk'), [(skill.pk, skill.name)])
+
+    def test_autocomplete_member_counts(self):
+        first = GroupFactory.create(name='ranked a', visible=True)
+        second = GroupFactory.create(name='ranked b', visible=True)
+        eq_(Group.autocomplete('ranked'), [(first.pk, first.name), (second.pk, second.name)])
+
+        with bulk_membership_changes():
+            GroupMembership.objects.create(group=second, status=GroupMembership.MEMBER,
+                                           userprofile=UserFactory.create().userprofile)
+        Group.update_member_counts([second.pk])
+        eq_(Group.autocomplete('ranked'), [(second.pk, second.name), (first.pk, first.name)])
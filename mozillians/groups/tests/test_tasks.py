@@ -2,6 +2,7 @@
 from datetime import datetime, timedelta
 
 from django.conf import settings
+from django.core import mail
 from django.template.loader import get_template
 from django.test import override_settings
 from django.utils.timezone import now
@@ -49,14 +50,15 @@ class SendPendingMembershipEmailsTests(TestCase):
         group.add_member(UserFactory.create().userprofile, GroupMembership.PENDING)
         group.add_member(UserFactory.create().userprofile, GroupMembership.PENDING)
 
-        with patch('mozillians.groups.tasks.send_mail', autospec=True) as mock_send_mail:
+        with patch('mozillians.groups.tasks.send_mass_mail', autospec=True) as mock_send_mass_mail:
             tasks.send_pending_membership_emails()
-        ok_(mock_send_mail.called)
-        # Should only have been called once
-        eq_(1, len(mock_send_mail.call_args_list))
+        ok_(mock_send_mass_mail.called)
+        # Should only have been called once, with one message
+        eq_(1, len(mock_send_mass_mail.call_args_list))
+        eq_(1, len(mock_send_mass_mail.call_args[0][0]))
 
         # The message body should mention that there are 2 pending memberships
-        subject, body, from_addr, to_list = mock_send_mail.call_args[0]
+        subject, body, from_addr, to_list = mock_send_mass_mail.call_args[0][0][0]
         eq_('2 outstanding requests to join Mozillians group "%s"' % group.name, subject)
         ok_('There are 2 outstanding requests' in body)
         # Full path to group page is in the message
@@ -66,9 +68,9 @@ class SendPendingMembershipEmailsTests(TestCase):
         # Add another pending membership
         group.add_member(UserFactory.create().userprofile, GroupMembership.PENDING)
         # Should send email again
-        with patch('mozillians.groups.tasks.send_mail', autospec=True) as mock_send_mail:
+        with patch('mozillians.groups.tasks.send_mass_mail', autospec=True) as mock_send_mass_mail:
             tasks.send_pending_membership_emails()
-        ok_(mock_send_mail.called)
+        ok_(mock_send_mass_mail.called)
 
     def test_sending_pending_email_singular(self):
         # If a curated group has exactly one pending membership, added since the reminder email
@@ -81,12 +83,12 @@ class SendPendingMembershipEmailsTests(TestCase):
         # Add one pending membership
         group.add_member(UserFactory.create().userprofile, GroupMembership.PENDING)
 
-        with patch('mozillians.groups.tasks.send_mail', autospec=True) as mock_send_mail:
+        with patch('mozillians.groups.tasks.send_mass_mail', autospec=True) as mock_send_mass_mail:
             tasks.send_pending_membership_emails()
-        ok_(mock_send_mail.called)
+        ok_(mock_send_mass_mail.called)
 
         # The message body should mention that there is 1 pending memberships
-        subject, body, from_addr, to_list = mock_send_mail.call_args[0]
+        subject, body, from_addr, to_list = mock_send_mass_mail.call_args[0][0][0]
         eq_('1 outstanding request to join Mozillians group "%s"' % group.name, subject)
         ok_('There is 1 outstanding request' in body)
         # Full path to group page is in the message
@@ -115,18 +117,38 @@ class SendPendingMembershipEmailsTests(TestCase):
         group.add_member(user2.userprofile, GroupMembership.MEMBER)
 
         # None of this should trigger an email send
-        with patch('mozillians.groups.tasks.send_mail', autospec=True) as mock_send_mail:
+        with patch('mozillians.groups.tasks.send_mass_mail', autospec=True) as mock_send_mass_mail:
             tasks.send_pending_membership_emails()
-        ok_(not mock_send_mail.called)
+        ok_(not mock_send_mass_mail.called)
 
     def test_sending_pending_email_non_curated(self):
         # If a non-curated group has a pending membership,  do not send anyone an email
         group = GroupFactory.create(accepting_new_members=Group.REVIEWED)
         user = UserFactory.create()
         group.add_member(user.userprofile, GroupMembership.PENDING)
-        with patch('mozillians.groups.tasks.send_mail', autospec=True) as mock_send_mail:
+        with patch('mozillians.groups.tasks.send_mass_mail', autospec=True) as mock_send_mass_mail:
             tasks.send_pending_membership_emails()
-        ok_(not mock_send_mail.called)
+        ok_(not mock_send_mass_mail.called)
+
+    def test_sending_pending_email_many_groups(self):
+        curator = UserFactory.create()
+        groups = GroupFactory.create_batch(3)
+        for group in groups:
+            group.curators.add(curator.userprofile)
+            group.add_member(UserFactory.create().userprofile, GroupMembership.PENDING)
+        # Remind all the curators, then add a request to the last group.
+        tasks.send_pending_membership_emails()
+        group.add_member(UserFactory.create().userprofile, GroupMembership.PENDING)
+
+        with patch('mozillians.groups.tasks.send_mass_mail', autospec=True) as mock_send_mass_mail:
+            with self.assertNumQueries(3):
+                tasks.send_pending_membership_emails()
+        messages = mock_send_mass_mail.call_args[0][0]
+        eq_(1, len(messages))
+        eq_('2 outstanding requests to join Mozillians group "%s"' % group.name, messages[0][0])
+
+        max_pk = group.groupmembership_set.order_by('-pk').values_list('pk', flat=True)[0]
+        eq_(Group.objects.get(pk=group.pk).max_reminder, max_pk)
 
 
 class EmailMembershipChangeTests(TestCase):
@@ -206,7 +228,7 @@ class EmailMembershipChangeTests(TestCase):
 class MembershipInvalidationTests(TestCase):
     """ Test membership invalidation."""
 
-    @patch('mozillians.groups.models.email_membership_change')
+    @patch('mozillians.groups.tasks.email_membership_changes')
     def test_invalidate_open_group(self, mail_task):
         member = UserFactory.create(vouched=True)
         curator = UserFactory.create(vouched=True)
@@ -231,9 +253,10 @@ class MembershipInvalidationTests(TestCase):
         ok_(not group.groupmembership_set.filter(userprofile=member.userprofile).exists())
         ok_(group.groupmembership_set.filter(userprofile=curator.userprofile).exists())
 
-        mail_task.delay.assert_called_once_with(group.id, member.id, GroupMembership.MEMBER, None)
+        mail_task.delay.assert_called_once_with([(group.id, member.id, GroupMembership.MEMBER,
+                                                  None)])
 
-    @patch('mozillians.groups.models.email_membership_change')
+    @patch('mozillians.groups.tasks.email_membership_changes')
     def test_invalidate_group_by_request(self, mail_task):
         member = UserFactory.create(vouched=True)
         curator = UserFactory.create(vouched=True)
@@ -258,10 +281,10 @@ class MembershipInvalidationTests(TestCase):
                                              status=GroupMembership.PENDING).exists())
         ok_(group.groupmembership_set.filter(userprofile=curator.userprofile).exists())
 
-        mail_task.delay.assert_called_once_with(group.id, member.id, GroupMembership.MEMBER,
-                                                GroupMembership.PENDING)
+        mail_task.delay.assert_called_once_with([(group.id, member.id, GroupMembership.MEMBER,
+                                                  GroupMembership.PENDING)])
 
-    @patch('mozillians.groups.models.email_membership_change')
+    @patch('mozillians.groups.tasks.email_membership_changes')
     def invalidate_closed_group(self, mail_task):
         member = UserFactory.create(vouched=True)
         curator = UserFactory.create(vouched=True)
@@ -286,10 +309,10 @@ class MembershipInvalidationTests(TestCase):
                                              status=GroupMembership.PENDING).exists())
         ok_(group.groupmembership_set.filter(userprofile=curator.userprofile).exists())
 
-        mail_task.delay.assert_called_once_with(group.id, member.id, GroupMembership.MEMBER,
-                                                GroupMembership.PENDING)
+        mail_task.delay.assert_called_once_with([(group.id, member.id, GroupMembership.MEMBER,
+                                                  GroupMembership.PENDING)])
 
-    @patch('mozillians.groups.models.email_membership_change')
+    @patch('mozillians.groups.tasks.email_membership_changes')
     def test_invalidate_group_pending_membership(self, mail_task):
         """Invalidate a group where a user has not yet been accepted by a curator.
 
@@ -317,7 +340,7 @@ class MembershipInvalidationTests(TestCase):
         ok_(group.groupmembership_set.filter(userprofile=curator.userprofile).exists())
         ok_(not mail_task.called)
 
-    @patch('mozillians.groups.models.email_membership_change')
+    @patch('mozillians.groups.tasks.email_membership_changes')
     def invalidate_group_pending_terms(self, mail_task):
         """Invalidate a group where a user has not yet accepted the terms.
 
@@ -345,6 +368,63 @@ class MembershipInvalidationTests(TestCase):
         ok_(group.groupmembership_set.filter(userprofile=curator.userprofile).exists())
         ok_(not mail_task.called)
 
+    @patch('mozillians.groups.tasks.email_membership_changes')
+    def test_invalidate_in_bulk(self, mail_task):
+        curator = UserFactory.create(vouched=True)
+        members = UserFactory.create_batch(3, vouched=True)
+        group = GroupFactory.create(name='Foo', invalidation_days=5,
+                                    accepting_new_members=Group.REVIEWED)
+        group.curators.add(curator.userprofile)
+        group.add_member(curator.userprofile)
+        for member in members:
+            group.add_member(member.userprofile)
+        InviteFactory.create(group=group, redeemer=members[0].userprofile,
+                             inviter=curator.userprofile)
+        group.groupmembership_set.update(updated_on=datetime.now() - timedelta(days=10))
+        # A pending request is removed, the members are moved back to pending.
+        (group.groupmembership_set.filter(userprofile=members[0].userprofile)
+                                  .update(status=GroupMembership.PENDING))
+
+        invalidate_group_membership()
+
+        eq_(set(group.groupmembership_set.values_list('userprofile', 'status')),
+            set([(curator.userprofile.pk, GroupMembership.MEMBER),
+                 (members[1].userprofile.pk, GroupMembership.PENDING),
+                 (members[2].userprofile.pk, GroupMembership.PENDING)]))
+        ok_(not group.invite_set.exists())
+        group = Group.objects.get(pk=group.pk)
+        eq_(group.member_count, 1)
+        eq_(group.pending_count, 2)
+
+        emails = mail_task.delay.call_args[0][0]
+        eq_(sorted(emails),
+            sorted([(group.id, members[0].id, GroupMembership.PENDING, GroupMembership.PENDING),
+                    (group.id, members[1].id, GroupMembership.MEMBER, GroupMembership.PENDING),
+                    (group.id, members[2].id, GroupMembership.MEMBER, GroupMembership.PENDING)]))
+
+        # The expired memberships are renewed, they do not expire again the next day.
+        mail_task.reset_mock()
+        invalidate_group_membership()
+        eq_(group.groupmembership_set.count(), 3)
+        ok_(not mail_task.delay.called)
+
+    @patch('mozillians.groups.tasks.send_mass_mail')
+    def test_email_membership_changes(self, send_mass_mail):
+        member_1, member_2 = UserFactory.create_batch(2)
+        group = GroupFactory.create()
+
+        tasks.email_membership_changes([
+            (group.id, member_1.id, GroupMembership.MEMBER, GroupMembership.PENDING),
+            # There is no email for this change.
+            (group.id, member_2.id, GroupMembership.PENDING, GroupMembership.PENDING),
+        ])
+
+        messages = send_mass_mail.call_args[0][0]
+        eq_(len(messages), 1)
+        subject, body, from_addr, to_list = messages[0]
+        eq_('Status changed for Mozillians group "%s"' % group.name, subject)
+        eq_([member_1.userprofile.email], to_list)
+
 
 class InvitationEmailTests(TestCase):
     @patch('mozillians.groups.tasks.send_mail')
@@ -434,9 +514,9 @@ class InvitationEmailTests(TestCase):
 
 
 class MembershipRenewalNotificationTests(TestCase):
-    @patch('mozillians.groups.tasks.send_mail')
+    @patch('mozillians.groups.tasks.send_mass_mail')
     @patch('mozillians.groups.tasks.now')
-    def test_send_renewal_notification_email(self, mock_now, mock_send_mail):
+    def test_send_renewal_notification_email(self, mock_now, mock_send_mass_mail):
         """Test renewal notification functionality"""
         curator = UserFactory.create()
         member = UserFactory.create()
@@ -450,17 +530,16 @@ class MembershipRenewalNotificationTests(TestCase):
 
         notify_membership_renewal()
 
-        ok_(mock_send_mail.called)
-        eq_(2, len(mock_send_mail.call_args_list))
-        name, args, kwargs = mock_send_mail.mock_calls[0]
-        subject, body, from_addr, to_list = args
+        ok_(mock_send_mass_mail.called)
+        eq_(2, len(mock_send_mass_mail.call_args[0][0]))
+        subject, body, from_addr, to_list = mock_send_mass_mail.call_args[0][0][0]
         eq_(subject, '[Mozillians] Your membership to Mozilla group "foobar" is about to expire')
         eq_(from_addr, settings.FROM_NOREPLY)
         eq_(to_list, [member.userprofile.email])
 
-    @patch('mozillians.groups.tasks.send_mail')
+    @patch('mozillians.groups.tasks.send_mass_mail')
     @patch('mozillians.groups.tasks.now')
-    def test_send_renewal_notification_curators_email(self, mock_now, mock_send_mail):
+    def test_send_renewal_notification_curators_email(self, mock_now, mock_send_mass_mail):
         """Test renewal notification functionality for curators"""
         curator1 = UserFactory.create(email='foo@example.com')
         curator2 = UserFactory.create(email='foobar@example.com')
@@ -477,26 +556,24 @@ class MembershipRenewalNotificationTests(TestCase):
 
         notify_membership_renewal()
 
-        ok_(mock_send_mail.called)
-        eq_(3, len(mock_send_mail.mock_calls))
+        ok_(mock_send_mass_mail.called)
+        eq_(3, len(mock_send_mass_mail.call_args[0][0]))
 
         # Check email for curator1
-        name, args, kwargs = mock_send_mail.mock_calls[1]
-        subject, body, from_addr, to_list = args
+        subject, body, from_addr, to_list = mock_send_mass_mail.call_args[0][0][1]
         eq_(subject, '[Mozillians][foobar] Membership of "Example Name" is about to expire')
         eq_(from_addr, settings.FROM_NOREPLY)
         eq_(list(to_list), [u'foo@example.com'])
 
         # Check email for curator2
-        name, args, kwargs = mock_send_mail.mock_calls[2]
-        subject, body, from_addr, to_list = args
+        subject, body, from_addr, to_list = mock_send_mass_mail.call_args[0][0][2]
         eq_(subject, '[Mozillians][foobar] Membership of "Example Name" is about to expire')
         eq_(from_addr, settings.FROM_NOREPLY)
         eq_(list(to_list), [u'foobar@example.com'])
 
-    @patch('mozillians.groups.tasks.send_mail')
+    @patch('mozillians.groups.tasks.send_mass_mail')
     @patch('mozillians.groups.tasks.now')
-    def test_send_renewal_notification_inviters_email(self, mock_now, mock_send_mail):
+    def test_send_renewal_notification_inviters_email(self, mock_now, mock_send_mass_mail):
         """Test renewal notification functionality for curators"""
         curator1 = UserFactory.create(email='foo@example.com')
         curator2 = UserFactory.create(email='foobar@example.com')
@@ -518,19 +595,18 @@ class MembershipRenewalNotificationTests(TestCase):
 
         notify_membership_renewal()
 
-        ok_(mock_send_mail.called)
-        eq_(2, len(mock_send_mail.mock_calls))
+        ok_(mock_send_mass_mail.called)
+        eq_(2, len(mock_send_mass_mail.call_args[0][0]))
 
         # Check email for inviter
-        name, args, kwargs = mock_send_mail.mock_calls[1]
-        subject, body, from_addr, to_list = args
+        subject, body, from_addr, to_list = mock_send_mass_mail.call_args[0][0][1]
         eq_(subject, '[Mozillians][foobar] Membership of "Example Name" is about to expire')
         eq_(from_addr, settings.FROM_NOREPLY)
         eq_(list(to_list), [u'bar@example.com'])
 
-    @patch('mozillians.groups.tasks.send_mail')
+    @patch('mozillians.groups.tasks.send_mass_mail')
     @patch('mozillians.groups.tasks.now')
-    def test_send_renewal_notification_inviter_not_curator(self, mock_now, mock_send_mail):
+    def test_send_renewal_notification_inviter_not_curator(self, mock_now, mock_send_mass_mail):
         """Test renewal notification functionality for curators"""
         curator1 = UserFactory.create(email='foo@example.com')
         curator2 = UserFactory.create(email='foobar@example.com')
@@ -551,30 +627,46 @@ class MembershipRenewalNotificationTests(TestCase):
 
         notify_membership_renewal()
 
-        ok_(mock_send_mail.called)
-        eq_(3, len(mock_send_mail.mock_calls))
+        ok_(mock_send_mass_mail.called)
+        eq_(3, len(mock_send_mass_mail.call_args[0][0]))
 
         # Check email to mozillians
-        name, args, kwargs = mock_send_mail.mock_calls[0]
-        subject, body, from_addr, to_list = args
+        subject, body, from_addr, to_list = mock_send_mass_mail.call_args[0][0][0]
         eq_(subject, '[Mozillians] Your membership to Mozilla group "foobar" is about to expire')
         eq_(from_addr, settings.FROM_NOREPLY)
         eq_(to_list, [member.userprofile.email])
 
         # Check email for curator1
-        name, args, kwargs = mock_send_mail.mock_calls[1]
-        subject, body, from_addr, to_list = args
+        subject, body, from_addr, to_list = mock_send_mass_mail.call_args[0][0][1]
         eq_(subject, '[Mozillians][foobar] Membership of "Example Name" is about to expire')
         eq_(from_addr, settings.FROM_NOREPLY)
         eq_(list(to_list), [u'foo@example.com'])
 
         # Check email for curator2
-        name, args, kwargs = mock_send_mail.mock_calls[2]
-        subject, body, from_addr, to_list = args
+        subject, body, from_addr, to_list = mock_send_mass_mail.call_args[0][0][2]
         eq_(subject, '[Mozillians][foobar] Membership of "Example Name" is about to expire')
         eq_(from_addr, settings.FROM_NOREPLY)
         eq_(list(to_list), [u'foobar@example.com'])
 
+    @patch('mozillians.groups.tasks.now')
+    def test_send_renewal_notification_report(self, mock_now):
+        curator = UserFactory.create()
+        members = UserFactory.create_batch(2)
+        group = GroupFactory.create(name='foobar', invalidation_days=365,
+                                    accepting_new_members=Group.REVIEWED)
+        group.curators.add(curator.userprofile)
+        for member in members:
+            group.add_member(member.userprofile)
+        mock_now.return_value = now() + timedelta(days=351)
+
+        result = notify_membership_renewal()
+
+        eq_(result['sent'], 4)
+        ok_(result['duration'] >= 0)
+        eq_(len(mail.outbox), 4)
+        ok_(all(membership.needs_renewal for membership in
+                group.groupmembership_set.exclude(userprofile=curator.userprofile)))
+
     @patch('mozillians.groups.tasks.now')
     def test_invalidation_days_less_than_2_weeks(self, mock_now):
         """Test renewal notification for groups with invalidation_days less than 2 weeks"""
@@ -588,7 +680,7 @@ class MembershipRenewalNotificationTests(TestCase):
         datetime_now = now() + timedelta(days=10)
         mock_now.return_value = datetime_now
 
-        with patch('mozillians.groups.tasks.send_mail', autospec=True) as mock_send_mail:
+        with patch('mozillians.groups.tasks.send_mass_mail', autospec=True) as mock_send_mass_mail:
             notify_membership_renewal()
 
-        ok_(not mock_send_mail.called)
+        ok_(not mock_send_mass_mail.called)
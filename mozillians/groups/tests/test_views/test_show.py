@@ -113,6 +113,23 @@ class ShowTests(TestCase):
         eq_(people[0].userprofile, user_2.userprofile)
         eq_(people[1].userprofile, user_3.userprofile)
         eq_(people[2].userprofile, user_1.userprofile)
+        profiles = response.context['member_profiles']
+        eq_([profile.pk for profile in profiles],
+            [user_2.userprofile.pk, user_3.userprofile.pk, user_1.userprofile.pk])
+
+    def test_show_pending_member_ids(self):
+        curator = UserFactory.create()
+        group = GroupFactory.create(curators=[curator.userprofile])
+        group.add_member(curator.userprofile)
+        group.add_member(self.user_1.userprofile, GroupMembership.PENDING)
+
+        url = reverse('groups:show_group', kwargs={'url': group.url})
+        with self.login(curator) as client:
+            response = client.get(url, follow=True)
+        eq_(response.status_code, 200)
+        eq_(response.context['pending_member_ids'], set([self.user_1.userprofile.pk]))
+        eq_(response.context['curator_ids'], set([curator.userprofile.pk]))
+        eq_(len(response.context['member_profiles']), 2)
 
     def test_show_common_skills(self):
         """Show most common skills first."""
@@ -155,6 +172,37 @@ class ShowTests(TestCase):
         eq_(skills[2], skill_4)
         ok_(skill_1 not in skills)
 
+    def test_show_common_skills_invalidation(self):
+        user_1, user_2, user_3 = UserFactory.create_batch(3)
+        group = GroupFactory.create()
+        group.add_member(user_1.userprofile)
+        group.add_member(user_2.userprofile)
+        skill = SkillFactory.create()
+        skill.members.add(user_1.userprofile)
+        url = reverse('groups:show_group', kwargs={'url': group.url})
+
+        with self.login(user_1) as client:
+            eq_(client.get(url, follow=True).context['skills'], [])
+
+            # The skills of a member change.
+            user_2.userprofile.skills.add(skill)
+            eq_(client.get(url, follow=True).context['skills'], [skill])
+
+            # The members of the group change.
+            group.remove_member(user_2.userprofile)
+            eq_(client.get(url, follow=True).context['skills'], [])
+            user_3.userprofile.skills.add(skill)
+            group.add_member(user_3.userprofile)
+            eq_(client.get(url, follow=True).context['skills'], [skill])
+
+            # The skill is renamed, then deleted.
+            skill.name = 'renamed skill'
+            skill.save()
+            eq_([common_skill.name for common_skill in
+                 client.get(url, follow=True).context['skills']], ['renamed skill'])
+            skill.delete()
+            eq_(client.get(url, follow=True).context['skills'], [])
+
     @requires_login()
     def test_show_anonymous(self):
         client = Client()
@@ -1,8 +1,6 @@
 import json
 import re
 
-from collections import defaultdict
-
 from django import http
 from django.conf import settings
 from django.contrib import messages
@@ -114,8 +112,8 @@ def search(request, searched_object=Group):
     """
     term = request.GET.get('term', None)
     if request.is_ajax() and term:
-        groups = searched_object.search(term).values_list('name', flat=True)
-        return http.HttpResponse(json.dumps(list(groups)), content_type='application/json')
+        groups = [name for pk, name in searched_object.autocomplete(term)]
+        return http.HttpResponse(json.dumps(groups), content_type='application/json')
 
     return http.HttpResponseBadRequest()
 
@@ -194,20 +192,7 @@ def show(request, url, alias_model, template):
         memberships = memberships.order_by('userprofile')
 
         # Find the most common skills of the group members.
-        # Order by popularity in the group.
-        shared_skill_ids = (group.members.filter(groupmembership__status=GroupMembership.MEMBER)
-                            .values_list('skills', flat=True))
-
-        count_skills = defaultdict(int)
-        for skill_id in shared_skill_ids:
-            count_skills[skill_id] += 1
-        common_skills_ids = [k for k, _ in sorted(count_skills.items(),
-                                                  key=lambda x: x[1],
-                                                  reverse=True)
-                             if count_skills[k] > 1]
-
-        # Translate ids to Skills preserving order.
-        skills = [Skill.objects.get(id=skill_id) for skill_id in common_skills_ids if skill_id]
+        skills = group.get_common_skills()
 
         data.update(skills=skills, membership_filter_form=membership_filter_form)
 
@@ -223,8 +208,27 @@ def show(request, url, alias_model, template):
 
     show_pagination = paginator.count > settings.ITEMS_PER_PAGE
 
+    # Fetch the profiles of the page in bulk, keeping the order of the page.
+    pending_member_ids = set()
+    curator_ids = set()
+    if isinstance(group, Group):
+        profile_ids = [member.userprofile_id for member in people]
+        pending_member_ids = set(member.userprofile_id for member in people
+                                 if (member.status == GroupMembership.PENDING
+                                     or member.needs_renewal))
+        if is_curator:
+            curator_ids = set(group.curators.values_list('id', flat=True))
+    else:
+        profile_ids = [person.id for person in people]
+
+    records = UserProfile.objects.filter(id__in=profile_ids).materialize(profile.privacy_level)
+    records = dict((record.pk, record) for record in records)
+
     extra_data = dict(
         people=people,
+        member_profiles=[records[profile_id] for profile_id in profile_ids],
+        pending_member_ids=pending_member_ids,
+        curator_ids=curator_ids,
         group=group,
         in_group=in_group,
         is_curator=is_curator,
@@ -518,6 +522,10 @@ def group_edit(request, url=None):
 
 class SkillsAutocomplete(autocomplete.Select2QuerySetView):
 
+    def get_queryset(self):
+        """Return the matching skills from the in memory name index."""
+        return [Skill(pk=pk, name=name) for pk, name in Skill.autocomplete(self.q)]
+
     def has_add_permission(self, request):
         """Return True if the user has the permission to add a model."""
         if not request.user.is_authenticated():
@@ -527,7 +535,7 @@ class SkillsAutocomplete(autocomplete.Select2QuerySetView):
     def get_create_option(self, context, q):
         """Disable create_object if skill exists."""
         search_q = q.strip()
-        if not search_q or Skill.objects.filter(name=search_q).exists():
+        if not search_q or search_q.lower() in [name for pk, name in Skill.autocomplete(search_q)]:
             return []
         return super(SkillsAutocomplete, self).get_create_option(context, search_q)
 
@@ -13,7 +13,7 @@ import django_filters
 import happyforms
 from dal import autocomplete
 from haystack.forms import ModelSearchForm as HaystackSearchForm
-from haystack.query import SQ, SearchQuerySet
+from haystack.query import SQ, EmptySearchQuerySet, SearchQuerySet
 from nocaptcha_recaptcha.fields import NoReCaptchaField
 from pytz import common_timezones
 from PIL import Image
@@ -27,7 +27,7 @@ from mozillians.phonebook.widgets import MonthYearWidget
 from mozillians.users import get_languages_for_locale
 from mozillians.users.managers import PUBLIC
 from mozillians.users.models import AbuseReport, ExternalAccount, IdpProfile, Language, UserProfile
-from mozillians.users.search_indexes import IdpProfileIndex, UserProfileIndex
+from mozillians.users.search_indexes import SEARCH_TEXT_FIELDS
 
 
 REGEX_NUMERIC = re.compile(r'\d+', re.IGNORECASE)
@@ -481,7 +481,12 @@ class PhonebookSearchForm(HaystackSearchForm):
         return cdata
 
     def search(self):
-        """Search on the ES index the query sting provided by the user."""
+        """Search on the ES index the query sting provided by the user.
+
+        The results are not loaded from the db, they are rendered from the
+        cards stored in the index, see users.search_indexes.get_search_card.
+        The returned queryset is lazy, ES is only queried for the page shown.
+        """
 
         search_term = self.cleaned_data.get('q')
         profile = None
@@ -516,41 +521,23 @@ class PhonebookSearchForm(HaystackSearchForm):
             for k in location_query.keys():
                 if k.startswith('privacy_'):
                     location_query[k] = privacy_level
-            return SearchQuerySet().filter(**location_query).load_all() or self.no_query_found()
+            return SearchQuerySet().filter(**location_query)
 
         # Calling super will handle with form validation and
         # will also search in fields that are not explicit queried through `text`
         sqs = super(PhonebookSearchForm, self).search().models(*search_models)
 
-        if not sqs:
-            return self.no_query_found()
+        if isinstance(sqs, EmptySearchQuerySet):
+            return sqs
 
-        query = SQ()
-        q_args = {}
         # Profiles Search
-        all_indexed_fields = UserProfileIndex.fields.keys() + IdpProfileIndex.fields.keys()
-        privacy_indexed_fields = [field for field in all_indexed_fields
-                                  if field.startswith('privacy_')]
-        # Every profile object in mozillians.org has privacy settings.
-        # Let's take advantage of this and compare the indexed fields
-        # with the ones listed in a profile in order to build the query to ES.
-        for p_field in privacy_indexed_fields:
-            # this is the field that we are going to query
-            q_field = p_field.split('_', 1)[1]
-            # The user needs to have less or equal permission number with the queried field
-            # (lower number, means greater permission level)
-            q_args = {
-                q_field: search_term,
-                '{0}__gte'.format(p_field): privacy_level
-            }
-            query.add(SQ(**q_args), SQ.OR)
-
-        # Username is always public
-        query.add(SQ(**{'username': search_term}), SQ.OR)
+        # Every profile document holds the text visible at each privacy level
+        # in its own field, match the one of the requester's level.
+        query = SQ(**{SEARCH_TEXT_FIELDS[privacy_level]: search_term})
 
         # Group Search
         if not search_models or Group in search_models:
             # Filter only visible groups.
             query.add(SQ(**{'visible': True}), SQ.OR)
 
-        return sqs.filter(query).load_all()
+        return sqs.filter(query)
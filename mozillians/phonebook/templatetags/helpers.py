@@ -8,8 +8,10 @@ from django.utils.translation import get_language
 from django_jinja import library
 import jinja2
 
+from mozillians.common.templatetags.helpers import get_privacy_level
 from mozillians.users import get_languages_for_locale
 from mozillians.users.models import IdpProfile
+from mozillians.users.search_indexes import get_search_card
 
 
 PARAGRAPH_RE = re.compile(r'(?:\r\n|\r|\n){2,}')
@@ -26,7 +28,8 @@ def paragraphize(value):
 @library.render_with('includes/search_result.html')
 def search_result(context, result):
     d = dict(context.items())
-    d.update(result=result)
+    privacy_level = get_privacy_level(context.get('request'))
+    d.update(result=result, card=get_search_card(result, privacy_level))
     return d
 
 
@@ -1,11 +1,15 @@
+from django.contrib.auth.models import AnonymousUser
 from django.forms import model_to_dict
+from django.test.client import RequestFactory
 
 from mock import MagicMock, patch
 from nose.tools import eq_, ok_
 
 from mozillians.common.tests import TestCase
+from mozillians.groups.tests import GroupFactory
 from mozillians.phonebook.forms import (ContributionForm, EmailForm, ExternalAccountForm,
-                                        filter_vouched)
+                                        PhonebookSearchForm, filter_vouched)
+from mozillians.users.managers import MOZILLIANS, PUBLIC
 from mozillians.users.models import UserProfile
 from mozillians.users.tests import UserFactory
 
@@ -87,3 +91,35 @@ class ExternalAccountFormTests(TestCase):
                                         'privacy': 3})
             form.is_valid()
         ok_('identifier' in form.errors)
+
+
+class PhonebookSearchFormTests(TestCase):
+
+    def setUp(self):
+        super(PhonebookSearchFormTests, self).setUp()
+        self.profile = UserFactory.create(userprofile={'full_name': 'Foo Bar',
+                                                       'privacy_full_name': MOZILLIANS,
+                                                       'ircname': 'quux',
+                                                       'privacy_ircname': PUBLIC}).userprofile
+        self.group = GroupFactory.create(name='foo group', visible=True)
+
+    def _search(self, user, q):
+        request = RequestFactory().get('/')
+        request.user = user
+        form = PhonebookSearchForm({'q': q}, request=request)
+        ok_(form.is_valid(), msg=dict(form.errors))
+        return sorted((result.model_name, int(result.pk)) for result in form.search())
+
+    def test_anonymous(self):
+        eq_(self._search(AnonymousUser(), 'foo'), [])
+        eq_(self._search(AnonymousUser(), 'quux'), [('userprofile', self.profile.pk)])
+
+    def test_vouched(self):
+        user = UserFactory.create()
+        eq_(self._search(user, 'foo'),
+            [('group', self.group.pk), ('userprofile', self.profile.pk)])
+
+    def test_unvouched(self):
+        user = UserFactory.create(vouched=False)
+        eq_(self._search(user, 'foo'), [])
+        eq_(self._search(user, 'quux'), [('userprofile', self.profile.pk)])
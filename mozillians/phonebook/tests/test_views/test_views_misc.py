@@ -12,6 +12,7 @@ from nose.tools import eq_, ok_
 from waffle.models import Flag
 
 from mozillians.common.tests import TestCase, requires_login, requires_vouch
+from mozillians.groups.tests import GroupFactory
 from mozillians.phonebook.models import Invite
 from mozillians.phonebook.tests import InviteFactory, _get_privacy_fields
 from mozillians.users.managers import MOZILLIANS, PRIVATE, PUBLIC
@@ -46,6 +47,57 @@ class SearchTests(TestCase):
             'application/opensearchdescription+xml')
 
 
+class PhonebookSearchTests(TestCase):
+
+    def setUp(self):
+        super(PhonebookSearchTests, self).setUp()
+        self.profile = UserFactory.create(userprofile={'full_name': 'Foo Bar',
+                                                       'privacy_full_name': MOZILLIANS,
+                                                       'ircname': 'quux',
+                                                       'privacy_ircname': PUBLIC}).userprofile
+        self.url = reverse('phonebook:haystack_search')
+
+    def _result_ids(self, response):
+        eq_(response.status_code, 200)
+        return [int(result.pk) for result in response.context['object_list']]
+
+    def test_search_anonymous(self):
+        client = Client()
+        eq_(self._result_ids(client.get(self.url, {'q': 'foo'})), [])
+        eq_(self._result_ids(client.get(self.url, {'q': 'quux'})), [self.profile.pk])
+
+    def test_search_vouched(self):
+        user = UserFactory.create()
+        with self.login(user) as client:
+            response = client.get(self.url, {'q': 'foo'})
+        eq_(self._result_ids(response), [self.profile.pk])
+        ok_('Foo Bar' in response.content)
+
+    def test_search_profile_updated(self):
+        self.profile.full_name = 'Baz'
+        self.profile.save()
+        user = UserFactory.create()
+        with self.login(user) as client:
+            eq_(self._result_ids(client.get(self.url, {'q': 'foo'})), [])
+            eq_(self._result_ids(client.get(self.url, {'q': 'baz'})), [self.profile.pk])
+
+    def test_search_group_member_count(self):
+        group = GroupFactory.create(name='foo group', visible=True)
+        user = UserFactory.create()
+        with self.login(user) as client:
+            # The count changes without reindexing the group.
+            group.add_member(user.userprofile)
+            response = client.get(self.url, {'q': 'group'})
+        eq_(response.status_code, 200)
+        eq_([(int(result.pk), result.member_count)
+             for result in response.context['object_list'] if result.model_name == 'group'],
+            [(group.pk, 1)])
+
+    def test_search_empty_query(self):
+        client = Client()
+        eq_(self._result_ids(client.get(self.url, {'q': ''})), [])
+
+
 class InviteTests(TestCase):
     @requires_login()
     def test_invite_anonymous(self):
@@ -1,13 +1,15 @@
 from django.contrib.auth.decorators import login_required
 from django.core.urlresolvers import reverse
+from django.db import connection
 from django.test import Client
-from django.test.utils import override_settings
+from django.test.utils import CaptureQueriesContext, override_settings
 
 from mock import patch
 from nose.tools import ok_, eq_
 
 from mozillians.common.templatetags.helpers import redirect, urlparams
 from mozillians.common.tests import TestCase
+from mozillians.groups.tests import GroupFactory, InviteFactory
 from mozillians.users.managers import PUBLIC, MOZILLIANS, EMPLOYEES, PRIVATE
 from mozillians.users.tests import UserFactory
 
@@ -223,3 +225,33 @@ class ViewProfileTests(TestCase):
         with self.login(user) as client:
             response = client.get(url, follow=True)
         ok_('vouch_form' in response.context)
+
+    def test_view_profile_query_count(self):
+        """The number of queries does not depend on the number of groups."""
+        lookup_user = UserFactory.create()
+        user = UserFactory.create()
+        url = reverse('phonebook:profile_view',
+                      kwargs={'username': lookup_user.username})
+
+        def _add_groups(count):
+            for i in range(count):
+                group = GroupFactory.create(is_access_group=True, curators=[user.userprofile])
+                group.add_member(lookup_user.userprofile)
+                InviteFactory.create(group=group, redeemer=lookup_user.userprofile,
+                                     inviter=user.userprofile)
+                tag = GroupFactory.create(curators=[lookup_user.userprofile])
+                tag.add_member(lookup_user.userprofile)
+
+        def _count_queries(client):
+            # Warm up the caches first
+            client.get(url)
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get(url)
+            eq_(response.status_code, 200)
+            return len(queries)
+
+        with self.login(user) as client:
+            _add_groups(1)
+            max_queries = _count_queries(client)
+            _add_groups(5)
+            eq_(_count_queries(client), max_queries)
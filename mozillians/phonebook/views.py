@@ -33,8 +33,9 @@ from waffle.decorators import waffle_flag
 from mozillians.api.models import APIv2App
 from mozillians.common.decorators import allow_public, allow_unvouched
 from mozillians.common.middleware import LOGIN_MESSAGE, GET_VOUCHED_MESSAGE
-from mozillians.common.templatetags.helpers import (get_object_or_none, nonprefixed_url, redirect,
-                                                    urlparams)
+from mozillians.common.paginator import HasMorePaginator
+from mozillians.common.templatetags.helpers import (get_object_or_none, get_privacy_level,
+                                                    nonprefixed_url, redirect, urlparams)
 from mozillians.common.urlresolvers import reverse
 from mozillians.groups.models import Group
 import mozillians.phonebook.forms as forms
@@ -42,6 +43,7 @@ from mozillians.phonebook.models import Invite
 from mozillians.phonebook.utils import redeem_invite
 from mozillians.users.managers import EMPLOYEES, MOZILLIANS, PUBLIC, PRIVATE
 from mozillians.users.models import AbuseReport, ExternalAccount, IdpProfile, UserProfile
+from mozillians.users.search_indexes import get_search_card
 from mozillians.users.tasks import (check_spam_account, send_userprofile_to_cis,
                                     update_email_in_basket)
 
@@ -126,15 +128,14 @@ def view_profile(request, username):
         # own profile
         view_as = request.GET.get('view_as', 'myself')
         privacy_level = privacy_mappings.get(view_as, None)
-        profile = UserProfile.objects.privacy_level(privacy_level).get(user__username=username)
+        profile = (UserProfile.objects.privacy_level(privacy_level).select_related('user')
+                   .get(user__username=username))
         data['privacy_mode'] = view_as
     else:
-        userprofile_query = UserProfile.objects.filter(user__username=username)
-        public_profile_exists = userprofile_query.public().exists()
-        profile_exists = userprofile_query.exists()
-        profile_complete = userprofile_query.exclude(full_name='').exists()
+        profile = (UserProfile.objects.select_related('user')
+                   .filter(user__username=username).first())
 
-        if not public_profile_exists:
+        if not (profile and profile.is_public):
             if not request.user.is_authenticated():
                 # you have to be authenticated to continue
                 messages.warning(request, LOGIN_MESSAGE)
@@ -146,10 +147,9 @@ def view_profile(request, username):
                 messages.error(request, GET_VOUCHED_MESSAGE)
                 return redirect('phonebook:home')
 
-        if not profile_exists or not profile_complete:
+        if not profile or not profile.full_name:
             raise Http404
 
-        profile = UserProfile.objects.get(user__username=username)
         profile.set_instance_privacy_level(PUBLIC)
         if request.user.is_authenticated():
             profile.set_instance_privacy_level(
@@ -183,13 +183,21 @@ def view_profile(request, username):
                 messages.info(request, msg)
                 return redirect('phonebook:profile_view', profile.user.username)
 
+    profile.prefetch_profile_relations()
+    identities = [idp for idp in profile.idp_profiles.all()
+                  if not profile._privacy_level or idp.privacy >= profile._privacy_level]
+
     data['shown_user'] = profile.user
     data['profile'] = profile
     data['access_groups'] = profile.get_annotated_access_groups()
     data['tags'] = profile.get_annotated_tags()
     data['abuse_form'] = abuse_form
-    data['primary_identity'] = profile.identity_profiles.filter(primary_contact_identity=True)
-    data['alternate_identities'] = profile.identity_profiles.filter(primary_contact_identity=False)
+    data['primary_identity'] = [idp for idp in identities if idp.primary_contact_identity]
+    data['alternate_identities'] = [idp for idp in identities if not idp.primary_contact_identity]
+    data['can_create_access_groups'] = (
+        request.user.is_authenticated() and any(getattr(group, 'inviter', None)
+                                                for group in data['access_groups'])
+        and request.user.userprofile.can_create_access_groups)
 
     # Only show pending groups if user is looking at their own profile,
     # or current user is a superuser
@@ -369,6 +377,7 @@ def change_primary_contact_identity(request, identity_pk):
     if alternate_identities.filter(primary_contact_identity=True).exists():
         alternate_identities.filter(pk=identity_pk).update(primary_contact_identity=True)
         alternate_identities.exclude(pk=identity_pk).update(primary_contact_identity=False)
+        profile.update_primary_contact_email()
 
         msg = _(u'Primary Contact Identity successfully updated.')
         messages.success(request, msg)
@@ -531,6 +540,12 @@ class PhonebookSearchView(SearchView):
         })
         return self.render_to_response(context)
 
+    def get_paginator(self, *args, **kwargs):
+        """Browse locations page by page, without counting the profiles."""
+        if self.kwargs.get('country'):
+            return HasMorePaginator(*args, **kwargs)
+        return super(PhonebookSearchView, self).get_paginator(*args, **kwargs)
+
     def get_form_kwargs(self):
         """Pass the request.user to the form's kwargs."""
         kwargs = {'initial': self.get_initial()}
@@ -553,8 +568,38 @@ class PhonebookSearchView(SearchView):
         context_data['country'] = self.kwargs.get('country')
         context_data['region'] = self.kwargs.get('region')
         context_data['city'] = self.kwargs.get('city')
+        self._materialize_profiles(context_data.get('object_list') or [])
+        self._add_member_counts(context_data.get('object_list') or [])
         return context_data
 
+    def _materialize_profiles(self, results):
+        """Replace the profiles of the results with records fetched in bulk.
+
+        Only results indexed without a search card are rendered from the db.
+        """
+        privacy_level = get_privacy_level(self.request)
+        results = [result for result in results if result.model_name == 'userprofile'
+                   and not get_search_card(result, privacy_level)]
+        if not results:
+            return
+
+        profile_ids = [int(result.pk) for result in results]
+        records = UserProfile.objects.filter(id__in=profile_ids).materialize(privacy_level)
+        records = dict((record.pk, record) for record in records)
+        for result in results:
+            result._object = records.get(int(result.pk))
+
+    def _add_member_counts(self, results):
+        """Set the current member count of the group results, in one query."""
+        results = [result for result in results if result.model_name == 'group']
+        if not results:
+            return
+
+        counts = dict(Group.objects.filter(id__in=[int(result.pk) for result in results])
+                                   .values_list('id', 'member_count'))
+        for result in results:
+            result.member_count = counts.get(int(result.pk), 0)
+
 
 # Verify additional identities
 class VerifyIdentityView(OIDCAuthenticationRequestView):
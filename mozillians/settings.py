@@ -294,6 +294,8 @@ USER_AVATAR_DIR = config('USER_AVATAR_DIR', default='uploads/userprofile')
 DEFAULT_AVATAR = config('DEFAULT_AVATAR', default='img/default_avatar.png')
 DEFAULT_AVATAR_URL = config('DEFAULT_AVATAR_URL', default=urljoin(MEDIA_URL, DEFAULT_AVATAR))
 DEFAULT_AVATAR_PATH = os.path.join(MEDIA_ROOT, DEFAULT_AVATAR)
+# Thumbnail geometries rendered when a profile photo is uploaded
+PHOTO_THUMBNAIL_GEOMETRIES = ['70x70', '150x150', '160x160', '300x300', '500x500']
 
 # Mozspace
 MOZSPACE_PHOTO_DIR = config('MOZSPACE_PHOTO_DIR', default='uploads/mozspaces')
@@ -411,9 +413,14 @@ AWS_ACCESS_KEY_ID = config('AWS_ACCESS_KEY_ID', default='')
 AWS_SECRET_ACCESS_KEY = config('AWS_SECRET_ACCESS_KEY', default='')
 
 # Django Haystack
-ES_DISABLED = config('ES_DISABLED', default=True)
+ES_DISABLED = config('ES_DISABLED', default=True, cast=bool)
 ES_HOST = config('ES_HOST', default='127.0.0.1:9200')
 ES_PROTOCOL = config('ES_PROTOCOL', default='http://')
+# Directory of the embedded search index used when ES is disabled,
+# the tests keep it in memory.
+SEARCH_INDEX_PATH = config(
+    'SEARCH_INDEX_PATH',
+    default='' if 'test' in sys.argv else os.path.join(ROOT.parent, 'search_index'))
 
 
 def _lazy_haystack_setup():
@@ -421,22 +428,21 @@ def _lazy_haystack_setup():
 
     es_url = '%s%s' % (settings.ES_PROTOCOL, settings.ES_HOST)
     es_index_name = config('ES_INDEX_NAME', default='mozillians_haystack')
+    if settings.ES_DISABLED:
+        return {
+            'default': {
+                'ENGINE': 'mozillians.common.search_backend.EmbeddedSearchEngine',
+                'PATH': settings.SEARCH_INDEX_PATH,
+                'INDEX_NAME': es_index_name
+            },
+        }
+
     haystack_connections = {
         'default': {
             'ENGINE': 'haystack.backends.elasticsearch_backend.ElasticsearchSearchEngine',
             'URL': es_url,
             'INDEX_NAME': es_index_name
         },
-        'tmp': {
-            'ENGINE': 'haystack.backends.elasticsearch_backend.ElasticsearchSearchEngine',
-            'URL': es_url,
-            'INDEX_NAME': 'tmp_{}'.format(es_index_name)
-        },
-        'current': {
-            'ENGINE': 'haystack.backends.elasticsearch_backend.ElasticsearchSearchEngine',
-            'URL': es_url,
-            'INDEX_NAME': 'current_{}'.format(es_index_name)
-        }
     }
 
     return haystack_connections
@@ -444,10 +450,15 @@ def _lazy_haystack_setup():
 
 HAYSTACK_CONNECTIONS = lazy(_lazy_haystack_setup, dict)()
 HAYSTACK_SIGNAL_PROCESSOR = 'mozillians.common.signals.SearchSignalProcessor'
-# Defaults to the number of the nodes in prod ES cluster
-ES_REINDEX_WORKERS_NUM = config('ES_REINDEX_WORKERS_NUM', default=3, cast=int)
+# Index the changed objects from a celery task, coalescing the saves of the
+# last SEARCH_INDEX_QUEUE_DELAY seconds. Tests index synchronously.
+SEARCH_INDEX_QUEUED = config('SEARCH_INDEX_QUEUED', default='test' not in sys.argv, cast=bool)
+SEARCH_INDEX_QUEUE_DELAY = config('SEARCH_INDEX_QUEUE_DELAY', default=5, cast=int)
+# The reindex is split in primary key ranges of ES_REINDEX_PARTITION_SIZE,
+# indexed in parallel by the celery workers.
+ES_REINDEX_PARTITION_SIZE = config('ES_REINDEX_PARTITION_SIZE', default=5000, cast=int)
+ES_REINDEX_PARTITION_TIMEOUT = config('ES_REINDEX_PARTITION_TIMEOUT', default=600, cast=int)
 ES_REINDEX_BATCHSIZE = config('ES_REINDEX_BATCHSIZE', default=100, cast=int)
-ES_REINDEX_TIMEOUT = config('ES_REINDEX_TIMEOUT', default=1800, cast=int)
 
 # Setup django-axes
 AXES_PROXY_COUNT = 1
@@ -257,7 +257,8 @@ class UserProfileViewSet(NoCacheReadOnlyModelViewSet):
         if privacy_level == PUBLIC:
             queryset = queryset.public()
 
-        queryset = queryset.privacy_level(privacy_level)
+        # Both serializers read the username.
+        queryset = queryset.privacy_level(privacy_level).select_related('user')
         return queryset
 
     def retrieve(self, request, pk):
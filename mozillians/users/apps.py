@@ -7,3 +7,5 @@ class UserConfig(AppConfig):
 
     def ready(self):
         import mozillians.users.signals # noqa
+
+        self.get_model('UserProfile').install_privacy_descriptors()
@@ -0,0 +1,29 @@
+from collections import defaultdict
+
+from django.core.management.base import BaseCommand
+
+from mozillians.users.models import IdpProfile, UserProfile
+
+
+class Command(BaseCommand):
+    args = '(no args)'
+    help = 'Syncs the stored primary contact email of the profiles with their identities'
+
+    def handle(self, *args, **options):
+        identities = defaultdict(list)
+        rows = (IdpProfile.objects.order_by('pk')
+                .values_list('profile_id', 'primary_contact_identity', 'email', 'privacy'))
+        for row in rows.iterator():
+            identities[row[0]].append(row[1:])
+
+        profiles = UserProfile.objects.values_list('pk', 'primary_contact_email',
+                                                   'primary_contact_privacy')
+        updated = 0
+        for pk, email, privacy in profiles.iterator():
+            contact = UserProfile.get_primary_contact(identities.get(pk, []))
+            if (email, privacy) != contact:
+                UserProfile.objects.filter(pk=pk).update(primary_contact_email=contact[0],
+                                                         primary_contact_privacy=contact[1])
+                updated += 1
+
+        self.stdout.write('Updated {0} profiles.\n'.format(updated))
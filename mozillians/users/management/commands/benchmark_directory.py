@@ -0,0 +1,211 @@
+"""
+Benchmark the busiest code paths against a synthetic directory.
+
+Run generate_directory first. Every benchmark runs inside a savepoint that
+is rolled back afterwards, so the directory is left untouched and the runs
+are comparable. For each benchmark the wall clock time and the number of
+queries are reported. The results are written to a JSON report, so
+regressions are visible between releases.
+
+The search benchmarks query Elasticsearch, rebuild the search index after
+generating the directory to run them. The index_all_profiles benchmark
+writes to a throwaway index, deleted afterwards, the search alias and the
+live indices are never touched.
+"""
+import json
+import platform
+import random
+import time
+import uuid
+from urlparse import urlparse
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils.timezone import now
+
+from haystack import connections
+from haystack.query import SQ, SearchQuerySet
+
+from mozillians.api.models import APIv2App
+from mozillians.celery import app
+from mozillians.common.urlresolvers import reverse
+from mozillians.common.utils import bundle_profile_data
+from mozillians.groups.models import Group, GroupMembership
+from mozillians.groups.tasks import invalidate_group_membership, notify_membership_renewal
+from mozillians.users.managers import MOZILLIANS
+from mozillians.users.models import IdpProfile, UserProfile
+from mozillians.users.search_indexes import SEARCH_TEXT_FIELDS, IdpProfileIndex, UserProfileIndex
+from mozillians.users.tasks import (SEARCH_REINDEX_CHECKPOINT_KEY, get_search_partitions,
+                                    get_search_reindex_backend, index_search_partition)
+
+
+BENCHMARKS = ['view_profile', 'show_group', 'api_v2_users', 'api_v2_groups',
+              'bundle_profile_data', 'index_all_profiles', 'notify_membership_renewal',
+              'invalidate_group_membership', 'search_privacy_clauses', 'search_text']
+SAMPLE_SIZE = 10
+SEARCH_TERMS = ['mozillian', 'developer', 'designer', 'synth1']
+SEARCH_PAGE_SIZE = 20
+
+
+class Command(BaseCommand):
+    args = '(no args)'
+    help = 'Times and counts the queries of the busiest code paths on a synthetic directory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--output', dest='output', default='benchmark.json',
+                            help='Path of the JSON report.')
+        parser.add_argument('--repeat', dest='repeat', type=int, default=5,
+                            help='Number of runs of each benchmark.')
+        parser.add_argument('--prefix', dest='prefix', default='synthetic',
+                            help='Prefix of the synthetic directory.')
+        parser.add_argument('--seed', dest='seed', type=int, default=42,
+                            help='Seed used to pick the sampled profiles and groups.')
+        parser.add_argument('--only', dest='only', action='append', choices=BENCHMARKS,
+                            help='Run only this benchmark, can be repeated.')
+
+    def handle(self, *args, **options):
+        rng = random.Random(options['seed'])
+        users = User.objects.filter(username__startswith=options['prefix'] + '-',
+                                    userprofile__is_vouched=True).order_by('username')
+        usernames = list(users.values_list('username', flat=True))
+        if not usernames:
+            raise CommandError('No synthetic directory found, run generate_directory first.')
+
+        self.viewer = users[0]
+        self.usernames = rng.sample(usernames, min(len(usernames), SAMPLE_SIZE))
+        self.profile_ids = list(UserProfile.objects.filter(user__username__in=self.usernames)
+                                .values_list('pk', flat=True))
+        groups = (Group.objects.filter(name__startswith=options['prefix'].lower() + ' ')
+                  .order_by('-member_count'))
+        # The largest group, a median one and a small one.
+        group_urls = list(groups.values_list('url', flat=True))
+        self.group_urls = sorted(set([group_urls[0], group_urls[len(group_urls) // 2],
+                                      group_urls[-1]])) if group_urls else []
+
+        # Run the tasks queued by the benchmarked code in process, as part of it.
+        app.conf.task_always_eager = True
+
+        results = {}
+        for name in options['only'] or BENCHMARKS:
+            results[name] = self.run_benchmark(name, options['repeat'])
+            self.stdout.write('{0:<28} {1:>10.1f} ms {2:>8} queries\n'.format(
+                name, results[name]['median_ms'], results[name]['queries']))
+
+        report = {
+            'created': now().isoformat(),
+            'python': platform.python_version(),
+            'database': connection.vendor,
+            'directory': {
+                'profiles': UserProfile.objects.count(),
+                'groups': Group.objects.count(),
+                'memberships': GroupMembership.objects.count(),
+            },
+            'results': results,
+        }
+        with open(options['output'], 'w') as output:
+            json.dump(report, output, indent=2, sort_keys=True)
+        self.stdout.write('Report written to {0}\n'.format(options['output']))
+
+    def run_benchmark(self, name, repeat):
+        timings = []
+        queries = 0
+        with transaction.atomic():
+            self.setup()
+            for i in range(repeat):
+                savepoint = transaction.savepoint()
+                with CaptureQueriesContext(connection) as captured:
+                    start = time.time()
+                    getattr(self, 'benchmark_{0}'.format(name))()
+                    timings.append((time.time() - start) * 1000)
+                queries = len(captured)
+                transaction.savepoint_rollback(savepoint)
+            transaction.set_rollback(True)
+
+        timings.sort()
+        return {
+            'runs': repeat,
+            'min_ms': timings[0],
+            'median_ms': timings[len(timings) // 2],
+            'max_ms': timings[-1],
+            'queries': queries,
+        }
+
+    def setup(self):
+        host = urlparse(settings.SITE_URL).netloc
+        self.client = Client(HTTP_HOST=host)
+        self.client.force_login(self.viewer)
+        self.app = APIv2App.objects.create(name='benchmark', description='benchmark',
+                                           owner=self.viewer.userprofile, enabled=True,
+                                           privacy_level=MOZILLIANS)
+
+    def _get(self, url, **params):
+        response = self.client.get(url, params, secure=True)
+        if response.status_code != 200:
+            raise CommandError('GET {0} returned {1}'.format(url, response.status_code))
+
+    def benchmark_view_profile(self):
+        for username in self.usernames:
+            self._get(reverse('phonebook:profile_view', args=[username]))
+
+    def benchmark_show_group(self):
+        for url in self.group_urls:
+            self._get(reverse('groups:show_group', args=[url]))
+
+    def benchmark_api_v2_users(self):
+        self._get(reverse('userprofile-list'), **{'api-key': self.app.key})
+
+    def benchmark_api_v2_groups(self):
+        self._get(reverse('group-list'), **{'api-key': self.app.key})
+
+    def benchmark_bundle_profile_data(self):
+        for profile_id in self.profile_ids:
+            bundle_profile_data(profile_id)
+
+    def benchmark_index_all_profiles(self):
+        """The work of index_all_profiles, without switching the search alias."""
+        if settings.ES_DISABLED:
+            raise CommandError('index_all_profiles needs Elasticsearch.')
+        alias = connections['default'].options['INDEX_NAME']
+        index_name = '{0}_benchmark_{1}'.format(alias, uuid.uuid4().hex)
+        backend = get_search_reindex_backend(index_name)
+        partitions = get_search_partitions()
+        backend.setup()
+        try:
+            for partition in partitions:
+                index_search_partition(index_name, *partition)
+        finally:
+            backend.conn.indices.delete(index=index_name, ignore=404)
+            cache.delete_many([SEARCH_REINDEX_CHECKPOINT_KEY.format(index_name, label, start)
+                               for label, start, end in partitions])
+
+    @override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+    def benchmark_notify_membership_renewal(self):
+        notify_membership_renewal()
+
+    @override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+    def benchmark_invalidate_group_membership(self):
+        invalidate_group_membership()
+
+    def _search(self, query):
+        sqs = SearchQuerySet().models(UserProfile, IdpProfile).filter(query)
+        return list(sqs[:SEARCH_PAGE_SIZE])
+
+    def benchmark_search_privacy_clauses(self):
+        """One clause per privacy indexed field, as searched before search_text."""
+        fields = UserProfileIndex.fields.keys() + IdpProfileIndex.fields.keys()
+        privacy_fields = [field for field in fields if field.startswith('privacy_')]
+        for term in SEARCH_TERMS:
+            query = SQ(username=term)
+            for privacy_field in privacy_fields:
+                query.add(SQ(**{privacy_field.split('_', 1)[1]: term,
+                                '{0}__gte'.format(privacy_field): MOZILLIANS}), SQ.OR)
+            self._search(query)
+
+    def benchmark_search_text(self):
+        for term in SEARCH_TERMS:
+            self._search(SQ(**{SEARCH_TEXT_FIELDS[MOZILLIANS]: term}))
@@ -0,0 +1,84 @@
+"""
+Microbenchmark the privacy aware attribute access of UserProfile.
+
+Compares the descriptor based accessors with a replica of the dynamic
+__getattribute__ that UserProfile used to implement. No database access
+is needed, the benchmark runs against an unsaved profile.
+"""
+from timeit import Timer
+
+from django.core.management.base import BaseCommand
+
+from mozillians.users.managers import EMPLOYEES, MOZILLIANS, PUBLIC
+from mozillians.users.models import UserProfile
+
+
+BENCHMARK_FIELDS = ['full_name', 'bio', 'ircname', 'timezone', 'is_vouched', 'last_updated']
+LEGACY_SPECIAL_FUNCTIONS = {
+    'accounts': '_accounts',
+    'alternate_emails': '_alternate_emails',
+    'email': '_primary_email',
+    'is_public_indexable': '_is_public_indexable',
+    'languages': '_languages',
+    'vouches_made': '_vouches_made',
+    'vouches_received': '_vouches_received',
+    'vouched_by': '_vouched_by',
+    'websites': '_websites',
+    'identity_profiles': '_identity_profiles'
+}
+
+
+def _raw_getattr(profile, attrname):
+    """Read an attribute of profile without the privacy aware accessors."""
+    try:
+        return profile.__dict__[attrname]
+    except KeyError:
+        return object.__getattribute__(profile, attrname)
+
+
+def legacy_getattribute(profile, attrname):
+    """Replica of the dynamic UserProfile.__getattribute__ implementation."""
+    _getattr = (lambda x: _raw_getattr(profile, x))
+    privacy_fields = UserProfile.privacy_fields()
+    privacy_level = _getattr('_privacy_level')
+    special_functions = dict(LEGACY_SPECIAL_FUNCTIONS)
+
+    if attrname in special_functions:
+        return _getattr(special_functions[attrname])
+
+    if not privacy_level or attrname not in privacy_fields:
+        return _getattr(attrname)
+
+    field_privacy = _getattr('privacy_%s' % attrname)
+    if field_privacy < privacy_level:
+        return privacy_fields.get(attrname)
+
+    return _getattr(attrname)
+
+
+class Command(BaseCommand):
+    args = '(no args)'
+    help = 'Compares the cost of privacy aware attribute access on UserProfile'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--number', dest='number', type=int, default=100000,
+                            help='Number of attribute reads per measurement.')
+
+    def handle(self, *args, **options):
+        number = options['number']
+        profile = UserProfile(full_name='Foo Bar', bio='Lorem ipsum', ircname='foobar',
+                              timezone='Europe/Athens', privacy_bio=MOZILLIANS)
+
+        self.stdout.write('{0:<12} {1:<14} {2:>12} {3:>12} {4:>8}\n'.format(
+            'level', 'field', 'legacy ns', 'current ns', 'speedup'))
+
+        for level in [None, PUBLIC, MOZILLIANS, EMPLOYEES]:
+            profile.set_instance_privacy_level(level)
+            for field in BENCHMARK_FIELDS:
+                legacy = Timer(lambda: legacy_getattribute(profile, field)).timeit(number)
+                current = Timer(lambda: getattr(profile, field)).timeit(number)
+                self.stdout.write('{0:<12} {1:<14} {2:>12.1f} {3:>12.1f} {4:>7.1f}x\n'.format(
+                    str(level), field,
+                    legacy / number * 1e9,
+                    current / number * 1e9,
+                    legacy / current))
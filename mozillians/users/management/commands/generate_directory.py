@@ -0,0 +1,300 @@
+"""
+Generate a reproducible synthetic directory on the local database.
+
+Creates users with complete profiles, identity profiles, locations, groups,
+skills, memberships, curators, invites and vouches. The same options and
+seed always produce the same directory, so benchmark_directory results
+can be compared between releases.
+
+Rows are inserted with bulk_create, which bypasses the model signals.
+Nothing is sent to basket, CIS or the search index, the member counts of
+the groups and skills are stored once at the end.
+"""
+import bisect
+import random
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.timezone import now
+
+from mozillians.geo.models import City, Country, Region
+from mozillians.groups.models import (Group, GroupAlias, GroupMembership, Invite, Skill,
+                                      SkillAlias)
+from mozillians.groups.tasks import DAYS_BEFORE_INVALIDATION
+from mozillians.groups.templatetags.helpers import slugify
+from mozillians.users.managers import EMPLOYEES, MOZILLIANS, PRIVATE, PUBLIC
+from mozillians.users.models import IdpProfile, UserProfile, Vouch
+
+
+BATCH_SIZE = 500
+# The prefix is part of the mapbox ids of the generated locations.
+MAX_PREFIX_LENGTH = 20
+COUNTRY_CODES = ['x{0}'.format(letter) for letter in 'abcdefghij']
+REGIONS_PER_COUNTRY = 3
+CITIES_PER_REGION = 3
+PRIVACY_WEIGHTS = [(PUBLIC, 4), (MOZILLIANS, 5), (EMPLOYEES, 1)]
+EMAIL_PRIVACY_WEIGHTS = [(PUBLIC, 2), (MOZILLIANS, 7), (PRIVATE, 1)]
+
+
+class WeightedChoice(object):
+    """Pick items with the given weights using a seeded random generator."""
+
+    def __init__(self, rng, items_with_weights):
+        self.rng = rng
+        self.items = []
+        self.totals = []
+        total = 0
+        for item, weight in items_with_weights:
+            total += weight
+            self.items.append(item)
+            self.totals.append(total)
+
+    def __call__(self):
+        return self.items[bisect.bisect(self.totals, self.rng.random() * self.totals[-1])]
+
+    def sample(self, count):
+        """Return up to count distinct items."""
+        if not self.items:
+            return []
+        picked = set()
+        for _ in range(count * 3):
+            if len(picked) >= count:
+                break
+            picked.add(self())
+        return list(picked)
+
+
+class Command(BaseCommand):
+    args = '(no args)'
+    help = 'Generates a reproducible synthetic directory for benchmarking'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--profiles', dest='profiles', type=int, default=1000,
+                            help='Number of profiles to create.')
+        parser.add_argument('--groups', dest='groups', type=int, default=None,
+                            help='Number of groups to create, defaults to profiles / 10.')
+        parser.add_argument('--skills', dest='skills', type=int, default=None,
+                            help='Number of skills to create, defaults to profiles / 5.')
+        parser.add_argument('--seed', dest='seed', type=int, default=42,
+                            help='Seed of the random generator.')
+        parser.add_argument('--prefix', dest='prefix', default='synthetic',
+                            help='Prefix of the generated usernames, groups and skills.')
+        parser.add_argument('--force', dest='force', action='store_true', default=False,
+                            help='Run even if DEBUG is off.')
+
+    def handle(self, *args, **options):
+        if not settings.DEBUG and not options['force']:
+            raise CommandError('Refusing to generate data with DEBUG off, use --force.')
+
+        self.rng = random.Random(options['seed'])
+        self.prefix = options['prefix']
+        if len(self.prefix) > MAX_PREFIX_LENGTH:
+            raise CommandError('The prefix is longer than {0} characters.'
+                               .format(MAX_PREFIX_LENGTH))
+        self.now = now()
+        profile_count = options['profiles']
+        group_count = options['groups']
+        if group_count is None:
+            group_count = max(profile_count // 10, 1)
+        skill_count = options['skills']
+        if skill_count is None:
+            skill_count = max(profile_count // 5, 1)
+
+        if User.objects.filter(username__startswith=self.prefix + '-').exists():
+            raise CommandError('A directory with prefix "{0}" already exists.'
+                               .format(self.prefix))
+
+        with transaction.atomic():
+            cities = self.create_locations()
+            profiles = self.create_profiles(profile_count, cities)
+            self.create_identities(profiles)
+            groups = self.create_groups(Group, GroupAlias, group_count)
+            skills = self.create_groups(Skill, SkillAlias, skill_count)
+            self.create_memberships(profiles, groups)
+            self.create_skills(profiles, skills)
+            self.create_vouches(profiles)
+            Group.update_member_counts([group.pk for group in groups])
+            Skill.update_member_counts([skill.pk for skill in skills])
+
+        self.stdout.write('Created {0} profiles, {1} groups and {2} skills.\n'.format(
+            len(profiles), len(groups), len(skills)))
+
+    def create_locations(self):
+        """Return the cities of countries and regions of their own, named after the prefix."""
+        cities = []
+        for code in COUNTRY_CODES:
+            country = Country.objects.get_or_create(
+                mapbox_id='{0}.country.{1}'.format(self.prefix, code),
+                defaults={'name': '{0} country {1}'.format(self.prefix, code), 'code': code})[0]
+            for i in range(REGIONS_PER_COUNTRY):
+                region = Region.objects.get_or_create(
+                    mapbox_id='{0}.region.{1}{2}'.format(self.prefix, code, i),
+                    defaults={'name': '{0} region {1}{2}'.format(self.prefix, code, i),
+                              'country': country})[0]
+                for j in range(CITIES_PER_REGION):
+                    city = City.objects.get_or_create(
+                        mapbox_id='{0}.city.{1}{2}{3}'.format(self.prefix, code, i, j),
+                        defaults={'name': '{0} city {1}{2}{3}'.format(self.prefix, code, i, j),
+                                  'region': region, 'country': country,
+                                  'lat': self.rng.uniform(-90, 90),
+                                  'lng': self.rng.uniform(-180, 180)})[0]
+                    cities.append(city)
+        return cities
+
+    def create_profiles(self, count, cities):
+        privacy = WeightedChoice(self.rng, PRIVACY_WEIGHTS)
+        email_privacy = WeightedChoice(self.rng, EMAIL_PRIVACY_WEIGHTS)
+
+        users = []
+        for i in range(count):
+            username = '{0}-{1:06d}'.format(self.prefix, i)
+            users.append(User(username=username, email='{0}@example.com'.format(username),
+                              date_joined=self.now - timedelta(days=self.rng.randint(0, 3650))))
+        User.objects.bulk_create(users, batch_size=BATCH_SIZE)
+        users = User.objects.filter(username__startswith=self.prefix + '-').order_by('username')
+
+        profiles = []
+        for i, user in enumerate(users):
+            city = self.rng.choice(cities)
+            contact_privacy = email_privacy()
+            profiles.append(UserProfile(
+                user=user,
+                full_name='Synthetic Mozillian {0}'.format(i),
+                bio='Synthetic profile number {0}.'.format(i) * self.rng.randint(0, 10),
+                ircname='synth{0}'.format(i),
+                title=self.rng.choice(['', 'Developer', 'Community Manager', 'Designer']),
+                # One in five profiles is not vouched yet.
+                is_vouched=self.rng.random() > 0.2,
+                can_vouch=self.rng.random() > 0.5,
+                geo_city=city, geo_region=city.region, geo_country=city.country,
+                lat=city.lat, lng=city.lng,
+                primary_contact_email=user.email,
+                primary_contact_privacy=contact_privacy,
+                privacy_email=contact_privacy,
+                privacy_full_name=privacy(),
+                privacy_bio=privacy(),
+                privacy_ircname=privacy(),
+                privacy_geo_city=privacy(),
+                privacy_geo_region=privacy(),
+                privacy_geo_country=privacy(),
+                privacy_groups=privacy(),
+                privacy_skills=privacy(),
+                privacy_title=privacy(),
+            ))
+        UserProfile.objects.bulk_create(profiles, batch_size=BATCH_SIZE)
+        return list(UserProfile.objects.filter(user__in=users)
+                    .select_related('user').order_by('user__username'))
+
+    def create_identities(self, profiles):
+        identities = []
+        for profile in profiles:
+            # About one in ten profiles belongs to staff.
+            if self.rng.random() < 0.1:
+                provider = IdpProfile.PROVIDER_LDAP
+                auth0_user_id = 'ad|Mozilla-LDAP|{0}'.format(profile.user.username)
+            else:
+                provider = IdpProfile.PROVIDER_GITHUB
+                auth0_user_id = 'github|{0}'.format(profile.pk)
+            identities.append(IdpProfile(
+                profile=profile, type=provider, auth0_user_id=auth0_user_id,
+                email=profile.user.email, primary=True, primary_contact_identity=True,
+                privacy=profile.primary_contact_privacy, username=profile.user.username))
+        IdpProfile.objects.bulk_create(identities, batch_size=BATCH_SIZE)
+
+    def create_groups(self, model, alias_model, count):
+        groups = []
+        for i in range(count):
+            # Group names are always lower case.
+            name = '{0} {1} {2:05d}'.format(self.prefix, model.__name__, i).lower()
+            kwargs = {'name': name, 'url': slugify(name)}
+            if model is Group:
+                # One in five groups is an access group, half of them expire memberships.
+                is_access_group = self.rng.random() < 0.2
+                kwargs.update({
+                    'is_access_group': is_access_group,
+                    'accepting_new_members': self.rng.choice(
+                        [Group.OPEN, Group.REVIEWED, Group.CLOSED]),
+                    'invalidation_days': (self.rng.choice([None, 90, 365])
+                                          if is_access_group else None),
+                    'description': 'Synthetic group number {0}.'.format(i),
+                })
+            groups.append(model(**kwargs))
+        model.objects.bulk_create(groups, batch_size=BATCH_SIZE)
+        groups = list(model.objects.filter(name__startswith=self.prefix.lower() + ' ')
+                      .order_by('name'))
+        alias_model.objects.bulk_create(
+            [alias_model(name=group.name, url=group.url, alias=group) for group in groups],
+            batch_size=BATCH_SIZE)
+        return groups
+
+    def _popularity(self, items):
+        """Return a picker where the first items are a lot more popular than the last."""
+        return WeightedChoice(self.rng, [(item, 1.0 / (rank + 1))
+                                         for rank, item in enumerate(items)])
+
+    def create_memberships(self, profiles, groups):
+        popular_group = self._popularity(groups)
+        memberships = []
+        invites = []
+        for profile in profiles:
+            for group in popular_group.sample(self.rng.randint(0, 8)):
+                status = (GroupMembership.PENDING if self.rng.random() < 0.1
+                          else GroupMembership.MEMBER)
+                memberships.append(GroupMembership(
+                    userprofile=profile, group=group, status=status,
+                    date_joined=self.now - timedelta(days=self.rng.randint(0, 1000))))
+                if group.is_access_group and self.rng.random() < 0.5:
+                    invites.append((group, profile))
+        GroupMembership.objects.bulk_create(memberships, batch_size=BATCH_SIZE)
+
+        curators = []
+        curators_by_group = {}
+        for group in groups:
+            group_curators = self.rng.sample(profiles, min(len(profiles), self.rng.randint(1, 2)))
+            curators_by_group[group.pk] = group_curators
+            curators.extend(Group.curators.through(group=group, userprofile=curator)
+                            for curator in group_curators)
+        Group.curators.through.objects.bulk_create(curators, batch_size=BATCH_SIZE)
+
+        Invite.objects.bulk_create(
+            [Invite(group=group, redeemer=profile, accepted=True,
+                    inviter=self.rng.choice(curators_by_group[group.pk]))
+             for group, profile in invites],
+            batch_size=BATCH_SIZE)
+
+        # Spread the memberships of the expiring groups around the renewal dates.
+        for group in groups:
+            if not group.invalidation_days:
+                continue
+            group_pks = sorted(GroupMembership.objects.filter(group=group)
+                               .values_list('pk', flat=True))
+            for delta in [0, DAYS_BEFORE_INVALIDATION, group.invalidation_days]:
+                pks = self.rng.sample(group_pks, min(len(group_pks), 5))
+                last_update = self.now - timedelta(days=group.invalidation_days - delta)
+                GroupMembership.objects.filter(pk__in=pks).update(updated_on=last_update)
+
+    def create_skills(self, profiles, skills):
+        popular_skill = self._popularity(skills)
+        profile_skills = []
+        for profile in profiles:
+            profile_skills.extend(UserProfile.skills.through(userprofile=profile, skill=skill)
+                                  for skill in popular_skill.sample(self.rng.randint(0, 6)))
+        UserProfile.skills.through.objects.bulk_create(profile_skills, batch_size=BATCH_SIZE)
+
+    def create_vouches(self, profiles):
+        vouched = [profile for profile in profiles if profile.is_vouched]
+        vouchers = [profile for profile in vouched if profile.can_vouch]
+        vouches = []
+        for profile in vouched:
+            if not vouchers or self.rng.random() < 0.1:
+                vouches.append(Vouch(vouchee=profile, voucher=None, autovouch=True,
+                                     date=self.now, description='A synthetic autovouch.'))
+                continue
+            for voucher in self.rng.sample(vouchers, min(len(vouchers), self.rng.randint(1, 3))):
+                if voucher.pk != profile.pk:
+                    vouches.append(Vouch(vouchee=profile, voucher=voucher, date=self.now,
+                                         description='A synthetic vouch.'))
+        Vouch.objects.bulk_create(vouches, batch_size=BATCH_SIZE)
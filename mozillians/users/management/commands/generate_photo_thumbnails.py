@@ -0,0 +1,25 @@
+from django.core.management.base import BaseCommand
+
+from mozillians.users.models import UserProfile
+from mozillians.users.tasks import generate_photo_thumbnails
+
+
+class Command(BaseCommand):
+    args = '(no args)'
+    help = 'Queues the thumbnail generation of the photos without a thumbnail manifest'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', dest='all', action='store_true', default=False,
+                            help='Regenerate the thumbnails of every photo.')
+
+    def handle(self, *args, **options):
+        profiles = UserProfile.objects.exclude(photo='')
+        if not options['all']:
+            profiles = profiles.filter(photo_thumbnails='')
+
+        count = 0
+        for pk in profiles.values_list('pk', flat=True).iterator():
+            generate_photo_thumbnails.delay(pk)
+            count += 1
+
+        self.stdout.write('Queued {0} profiles.\n'.format(count))
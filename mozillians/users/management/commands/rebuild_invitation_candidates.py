@@ -0,0 +1,31 @@
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+
+from mozillians.groups.models import GroupMembership
+from mozillians.users.models import IdpProfile, InvitationCandidate
+
+
+class Command(BaseCommand):
+    args = '(no args)'
+    help = 'Rebuilds the invitation directory used by the group invitation autocompletes'
+
+    def handle(self, *args, **options):
+        # Same rules as InvitationCandidate.refresh
+        staff_query = Q(pk__in=[])
+        for domain in settings.AUTO_VOUCH_DOMAINS:
+            staff_query |= Q(email__iendswith='@' + domain)
+        mfa_query = Q(primary=True, type__in=IdpProfile.HIGH_AAL_ACCOUNTS)
+
+        profile_ids = set(IdpProfile.objects.filter(staff_query | mfa_query)
+                          .values_list('profile_id', flat=True))
+        profile_ids.update(GroupMembership.objects.filter(
+            group__name=settings.NDA_GROUP, status=GroupMembership.MEMBER
+        ).values_list('userprofile_id', flat=True))
+        profile_ids.update(InvitationCandidate.objects.values_list('profile_id', flat=True))
+
+        for profile_id in sorted(profile_ids):
+            InvitationCandidate.refresh(profile_id)
+
+        self.stdout.write('Refreshed {0} profiles, {1} candidates.\n'.format(
+            len(profile_ids), InvitationCandidate.objects.count()))
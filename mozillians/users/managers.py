@@ -1,5 +1,7 @@
+import re
+
 from django.apps import apps
-from django.db.models import Q
+from django.db.models import BooleanField, Case, Prefetch, Q, Value, When
 from django.db.models.query import ModelIterable, QuerySet, ValuesIterable
 
 from django.utils.translation import ugettext_lazy as _lazy
@@ -16,6 +18,22 @@ PRIVACY_CHOICES_WITH_PRIVATE = ((MOZILLIANS, _lazy(u'Mozillians')),
                                 (PRIVATE, _lazy(u'Private')))
 
 PUBLIC_INDEXABLE_FIELDS = ['full_name', 'ircname', 'email']
+PROFILE_RECORD_RELATED_FIELDS = ['user', 'geo_country', 'geo_region', 'geo_city',
+                                 'country', 'region', 'city']
+# The words of the names, usernames and emails of the invitation candidates.
+INVITATION_TERM_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def visible_q(privacy_level, prefix=''):
+    """Return a Q object matching profiles with any field visible at privacy_level.
+
+    Use prefix to match profiles through a relation, e.g. 'vouchee__'.
+    """
+    UserProfile = apps.get_model('users', 'UserProfile')
+    query = Q()
+    for field in UserProfile.privacy_fields():
+        query |= Q(**{'%sprivacy_%s__gte' % (prefix, field): privacy_level})
+    return query
 
 
 class UserProfileValuesIterable(ValuesIterable):
@@ -111,6 +129,34 @@ class UserProfileQuerySet(QuerySet):
     def not_public_indexable(self):
         return self.complete().exclude(self.public_index_q)
 
+    def with_visibility(self, privacy_level):
+        """Annotate is_visible, True if any field is visible at privacy_level."""
+        is_visible = Case(When(visible_q(privacy_level), then=Value(True)),
+                          default=Value(False), output_field=BooleanField())
+        return self.annotate(is_visible=is_visible)
+
+    def materialize(self, privacy_level=None):
+        """Return the profiles as privacy redacted, read only records.
+
+        Users, geo data, external accounts, identity profiles, languages
+        and groups are fetched in bulk, so the number of queries does not
+        depend on the number of profiles. When privacy_level is not given
+        the privacy level of the queryset is used.
+        """
+        from mozillians.users.models import ProfileRecord
+
+        GroupMembership = apps.get_model('groups', 'GroupMembership')
+        memberships = (GroupMembership.objects.filter(status=GroupMembership.MEMBER)
+                       .select_related('group').order_by('group__name'))
+
+        queryset = self.select_related(*PROFILE_RECORD_RELATED_FIELDS).prefetch_related(
+            'externalaccount_set', 'idp_profiles', 'language_set',
+            Prefetch('groupmembership_set', queryset=memberships, to_attr='_member_memberships'))
+        if privacy_level is not None:
+            queryset._privacy_level = privacy_level
+
+        return [ProfileRecord(profile) for profile in queryset]
+
     def _clone(self, *args, **kwargs):
         """Custom _clone with privacy level propagation."""
         c = super(UserProfileQuerySet, self)._clone(*args, **kwargs)
@@ -125,3 +171,18 @@ class UserProfileQuerySet(QuerySet):
         clone = self._values(*fields, **expressions)
         clone._iterable_class = UserProfileValuesIterable
         return clone
+
+
+class InvitationCandidateQuerySet(QuerySet):
+    """Custom QuerySet for the invitation directory."""
+
+    def search(self, query):
+        """Return the candidates with a term starting with each word of query.
+
+        The query is split in words like the indexed names, so o'brien
+        matches the terms o and brien.
+        """
+        queryset = self
+        for word in INVITATION_TERM_RE.findall(query.lower()):
+            queryset = queryset.filter(terms__term__startswith=word)
+        return queryset.distinct()
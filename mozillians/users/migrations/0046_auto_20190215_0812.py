@@ -0,0 +1,46 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.20 on 2019-02-15 16:12
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def migrate_primary_contact_email(apps, schema_editor):
+    UserProfile = apps.get_model('users', 'UserProfile')
+    IdpProfile = apps.get_model('users', 'IdpProfile')
+
+    # Profiles with identities but no contact identity hide the email.
+    profile_ids = IdpProfile.objects.values_list('profile_id', flat=True).distinct()
+    UserProfile.objects.filter(pk__in=list(profile_ids)).update(primary_contact_privacy=1)
+
+    # The last update wins, like get_primary_contact the first identity by pk does.
+    contacts = (IdpProfile.objects.filter(primary_contact_identity=True)
+                .order_by('profile_id', '-pk'))
+    for idp in contacts:
+        UserProfile.objects.filter(pk=idp.profile_id).update(primary_contact_email=idp.email,
+                                                             primary_contact_privacy=idp.privacy)
+
+
+def backwards(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0045_auto_20190109_0324'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='userprofile',
+            name='primary_contact_email',
+            field=models.EmailField(blank=True, default=b'', max_length=254),
+        ),
+        migrations.AddField(
+            model_name='userprofile',
+            name='primary_contact_privacy',
+            field=models.PositiveIntegerField(blank=True, choices=[(3, 'Mozillians'), (4, 'Public'), (1, 'Private')], default=None, null=True),
+        ),
+        migrations.RunPython(migrate_primary_contact_email, backwards),
+    ]
@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+import re
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+TERM_RE = re.compile(r'\w+', re.UNICODE)
+TERM_LENGTH = 100
+# IdpProfile.HIGH_AAL_ACCOUNTS
+HIGH_AAL_ACCOUNTS = [40, 31, 30, 20]
+
+
+def build_invitation_candidates(apps, schema_editor):
+    """Same rules as InvitationCandidate.refresh, for every profile at once."""
+    UserProfile = apps.get_model('users', 'UserProfile')
+    IdpProfile = apps.get_model('users', 'IdpProfile')
+    GroupMembership = apps.get_model('groups', 'GroupMembership')
+    InvitationCandidate = apps.get_model('users', 'InvitationCandidate')
+    InvitationCandidateTerm = apps.get_model('users', 'InvitationCandidateTerm')
+
+    domains = tuple('@' + domain.lower() for domain in settings.AUTO_VOUCH_DOMAINS)
+    identities = defaultdict(list)
+    for identity in (IdpProfile.objects.order_by('pk')
+                     .values_list('profile_id', 'email', 'primary', 'type').iterator()):
+        identities[identity[0]].append(identity[1:])
+    nda_member_ids = set(GroupMembership.objects.filter(
+        group__name=settings.NDA_GROUP, status='member').values_list('userprofile_id', flat=True))
+
+    candidates = []
+    terms = []
+    profile_ids = set(identities) | nda_member_ids
+    for profile in UserProfile.objects.select_related('user').order_by('pk').iterator():
+        if profile.pk not in profile_ids:
+            continue
+        profile_identities = identities[profile.pk]
+        primary = next((idp for idp in profile_identities if idp[1]), None)
+        is_staff = any(email.lower().endswith(domains) for email, _, _ in profile_identities)
+        is_nda_member = profile.pk in nda_member_ids
+        has_mfa_identity = bool(primary and primary[2] in HIGH_AAL_ACCOUNTS)
+        if not (is_staff or is_nda_member or has_mfa_identity):
+            continue
+
+        label = profile.full_name
+        if primary:
+            label += u' ({0})'.format(primary[0])
+        candidates.append(InvitationCandidate(
+            profile_id=profile.pk, label=label[:255], is_staff=is_staff,
+            is_nda_member=is_nda_member, has_mfa_identity=has_mfa_identity))
+
+        user = profile.user
+        words = set(TERM_RE.findall(
+            u' '.join([profile.full_name, user.username, user.email]).lower()))
+        words.update([user.username.lower(), user.email.lower()])
+        terms.extend(InvitationCandidateTerm(candidate_id=profile.pk, term=term)
+                     for term in set(word[:TERM_LENGTH] for word in words if word))
+
+    InvitationCandidate.objects.bulk_create(candidates, batch_size=1000)
+    InvitationCandidateTerm.objects.bulk_create(terms, batch_size=1000)
+
+
+def backwards(apps, schema_editor):
+    pass
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('groups', '0020_auto_20171206_0641'),
+        ('users', '0047_userprofile_photo_thumbnails'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InvitationCandidate',
+            fields=[
+                ('profile', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='invitation_candidate', serialize=False, to='users.UserProfile')),
+                ('label', models.CharField(max_length=255)),
+                ('is_staff', models.BooleanField(default=False)),
+                ('is_nda_member', models.BooleanField(default=False)),
+                ('has_mfa_identity', models.BooleanField(default=False)),
+            ],
+            options={
+                'ordering': ['label'],
+            },
+        ),
+        migrations.CreateModel(
+            name='InvitationCandidateTerm',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('term', models.CharField(db_index=True, max_length=100)),
+                ('candidate', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='terms', to='users.InvitationCandidate')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='invitationcandidateterm',
+            unique_together=set([('candidate', 'term')]),
+        ),
+        migrations.RunPython(build_invitation_candidates, backwards),
+    ]
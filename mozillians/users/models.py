@@ -1,3 +1,4 @@
+import json
 import logging
 import os
 import uuid
@@ -5,10 +6,11 @@ from itertools import chain
 
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.core.files.storage import default_storage
 from django.core.mail import send_mail
-from django.db import models
-from django.db.models import Manager, ManyToManyField
+from django.db import IntegrityError, models, transaction
+from django.db.models import Manager, ManyToManyField, Prefetch, prefetch_related_objects
 from django.utils.encoding import iri_to_uri
 from django.utils.http import urlquote
 from django.utils.timezone import now
@@ -32,15 +34,17 @@ from mozillians.phonebook.validators import (validate_email, validate_twitter,
                                              validate_phone_number, validate_linkedin,
                                              validate_discord)
 from mozillians.users import get_languages_for_locale
-from mozillians.users.managers import (EMPLOYEES,
+from mozillians.users.managers import (EMPLOYEES, INVITATION_TERM_RE, InvitationCandidateQuerySet,
                                        MOZILLIANS, PRIVACY_CHOICES, PRIVACY_CHOICES_WITH_PRIVATE,
                                        PRIVATE, PUBLIC, PUBLIC_INDEXABLE_FIELDS,
-                                       UserProfileQuerySet)
+                                       UserProfileQuerySet, visible_q)
 from mozillians.users.tasks import send_userprofile_to_cis
 
 
 COUNTRIES = product_details.get_regions('en-US')
 AVATAR_SIZE = (300, 300)
+PRIVACY_CLEARANCE_CACHE_TIMEOUT = 60 * 60
+INVITATION_TERM_LENGTH = 100
 logger = logging.getLogger(__name__)
 ProfileManager = Manager.from_queryset(UserProfileQuerySet)
 
@@ -59,6 +63,79 @@ class PrivacyField(models.PositiveSmallIntegerField):
         super(PrivacyField, self).__init__(*args, **myargs)
 
 
+class PrivacyFieldDescriptor(object):
+    """Privacy aware accessor for a privacy controlled field.
+
+    Returns the real value of the field, if the privacy level of the
+    field is at least as large as the _privacy_level attribute of the
+    instance. Otherwise it returns the default privacy respecting value
+    for the field, as defined in the privacy_fields dictionary.
+
+    The descriptor wraps the accessor Django installed for the field, so
+    related fields and file fields keep working as before.
+    """
+
+    def __init__(self, name, wrapped):
+        self.name = name
+        self.privacy_name = 'privacy_%s' % name
+        self.wrapped = wrapped
+        self.wraps_data_descriptor = hasattr(wrapped, '__set__')
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self.wrapped.__get__(None, owner) if self.wrapped else self
+
+        privacy_level = instance._privacy_level
+        if privacy_level and getattr(instance, self.privacy_name) < privacy_level:
+            privacy_fields = type(instance).privacy_fields()
+            if self.name in privacy_fields:
+                return privacy_fields[self.name]
+
+        if self.wraps_data_descriptor:
+            return self.wrapped.__get__(instance, owner)
+        try:
+            return instance.__dict__[self.name]
+        except KeyError:
+            # Deferred field, load it without going through the privacy checks.
+            instance.refresh_from_db(fields=[self.name])
+            return instance.__dict__[self.name]
+
+    def __set__(self, instance, value):
+        if self.wraps_data_descriptor:
+            self.wrapped.__set__(instance, value)
+        else:
+            instance.__dict__[self.name] = value
+
+    def __delete__(self, instance):
+        if self.wraps_data_descriptor:
+            self.wrapped.__delete__(instance)
+        else:
+            del instance.__dict__[self.name]
+
+
+class PrivacyAliasDescriptor(object):
+    """Route reads of an attribute to the property that privacy safes it.
+
+    Writes go to the wrapped accessor, if any, or to the instance.
+    """
+
+    def __init__(self, name, target, wrapped=None):
+        self.name = name
+        self.target = target
+        self.wrapped = wrapped
+
+    def __get__(self, instance, owner=None):
+        if instance is None:
+            return self.wrapped.__get__(None, owner) if self.wrapped else self
+        return getattr(instance, self.target)
+
+    def __set__(self, instance, value):
+        if hasattr(self.wrapped, '__set__'):
+            self.wrapped.__set__(instance, value)
+        else:
+            instance.__dict__[self.name] = value
+
+
 class UserProfilePrivacyModel(models.Model):
     _privacy_level = None
 
@@ -145,6 +222,21 @@ class UserProfile(UserProfilePrivacyModel):
         ('contribute', 'Get Involved'),
     )
 
+    # Attributes whose privacy modifications are more complex than
+    # hiding a single field. They are routed to the respective property.
+    PRIVACY_AWARE_ALIASES = {
+        'accounts': '_accounts',
+        'alternate_emails': '_alternate_emails',
+        'email': '_primary_email',
+        'is_public_indexable': '_is_public_indexable',
+        'languages': '_languages',
+        'vouches_made': '_vouches_made',
+        'vouches_received': '_vouches_received',
+        'vouched_by': '_vouched_by',
+        'websites': '_websites',
+        'identity_profiles': '_identity_profiles'
+    }
+
     objects = ProfileManager()
 
     user = models.OneToOneField(User)
@@ -214,6 +306,13 @@ class UserProfile(UserProfilePrivacyModel):
     # This is the Auth0 user ID. We are saving only the primary here.
     auth0_user_id = models.CharField(max_length=1024, default='', blank=True)
     is_staff = models.BooleanField(default=False)
+    # Denormalized primary contact identity, kept in sync by IdpProfile.
+    # A NULL privacy means that there are no identities for this profile.
+    primary_contact_email = models.EmailField(blank=True, default='')
+    primary_contact_privacy = models.PositiveIntegerField(null=True, blank=True, default=None,
+                                                          choices=PRIVACY_CHOICES_WITH_PRIVATE)
+    # JSON manifest with the urls of the pre-generated photo thumbnails.
+    photo_thumbnails = models.TextField(blank=True, default='')
 
     def __unicode__(self):
         """Return this user's name when their profile is called."""
@@ -226,47 +325,32 @@ class UserProfile(UserProfilePrivacyModel):
         db_table = 'profile'
         ordering = ['full_name']
 
-    def __getattribute__(self, attrname):
-        """Special privacy aware __getattribute__ method.
-
-        This method returns the real value of the attribute of object,
-        if the privacy_level of the attribute is at least as large as
-        the _privacy_level attribute.
-
-        Otherwise it returns a default privacy respecting value for
-        the attribute, as defined in the privacy_fields dictionary.
-
-        special_functions provides methods that privacy safe their
-        respective properties, where the privacy modifications are
-        more complex.
+    @classmethod
+    def install_privacy_descriptors(cls):
+        """Install the privacy aware accessors of the model.
+
+        Privacy controlled fields, as returned by privacy_fields(), are
+        wrapped in a PrivacyFieldDescriptor and the attributes listed in
+        PRIVACY_AWARE_ALIASES are routed to the property that privacy
+        safes them. This needs to run once, after all the models are
+        loaded, since privacy_fields() inspects the reverse relations too.
         """
-        _getattr = (lambda x: super(UserProfile, self).__getattribute__(x))
-        privacy_fields = UserProfile.privacy_fields()
-        privacy_level = _getattr('_privacy_level')
-        special_functions = {
-            'accounts': '_accounts',
-            'alternate_emails': '_alternate_emails',
-            'email': '_primary_email',
-            'is_public_indexable': '_is_public_indexable',
-            'languages': '_languages',
-            'vouches_made': '_vouches_made',
-            'vouches_received': '_vouches_received',
-            'vouched_by': '_vouched_by',
-            'websites': '_websites',
-            'identity_profiles': '_identity_profiles'
-        }
-
-        if attrname in special_functions:
-            return _getattr(special_functions[attrname])
-
-        if not privacy_level or attrname not in privacy_fields:
-            return _getattr(attrname)
-
-        field_privacy = _getattr('privacy_%s' % attrname)
-        if field_privacy < privacy_level:
-            return privacy_fields.get(attrname)
-
-        return _getattr(attrname)
+        descriptor_types = (PrivacyAliasDescriptor, PrivacyFieldDescriptor)
+        for name, target in cls.PRIVACY_AWARE_ALIASES.items():
+            wrapped = cls.__dict__.get(name)
+            if not isinstance(wrapped, descriptor_types):
+                setattr(cls, name, PrivacyAliasDescriptor(name, target, wrapped))
+
+        for name in cls.privacy_fields():
+            wrapped = cls.__dict__.get(name)
+            if name in cls.PRIVACY_AWARE_ALIASES or isinstance(wrapped, descriptor_types):
+                continue
+            setattr(cls, name, PrivacyFieldDescriptor(name, wrapped))
+
+    def _get_unfiltered(self, attrname):
+        """Return the value of attrname bypassing the privacy aware accessors."""
+        descriptor = type(self).__dict__[attrname]
+        return descriptor.wrapped.__get__(self, type(self))
 
     def _filter_accounts_privacy(self, accounts):
         if self._privacy_level:
@@ -275,15 +359,13 @@ class UserProfile(UserProfilePrivacyModel):
 
     @property
     def _accounts(self):
-        _getattr = (lambda x: super(UserProfile, self).__getattribute__(x))
         excluded_types = [ExternalAccount.TYPE_WEBSITE, ExternalAccount.TYPE_EMAIL]
-        accounts = _getattr('externalaccount_set').exclude(type__in=excluded_types)
+        accounts = self.externalaccount_set.exclude(type__in=excluded_types)
         return self._filter_accounts_privacy(accounts)
 
     @property
     def _alternate_emails(self):
-        _getattr = (lambda x: super(UserProfile, self).__getattribute__(x))
-        accounts = _getattr('externalaccount_set').filter(type=ExternalAccount.TYPE_EMAIL)
+        accounts = self.externalaccount_set.filter(type=ExternalAccount.TYPE_EMAIL)
         return self._filter_accounts_privacy(accounts)
 
     @property
@@ -294,24 +376,30 @@ class UserProfile(UserProfilePrivacyModel):
         and ExternalAccount objects. In conflicts/duplicates it returns
         the minimum privacy level defined.
         """
-        legacy_emails_qs = self._alternate_emails
-        idp_qs = self._identity_profiles
+        legacy_emails = list(self._alternate_emails)
+        idp_profiles = list(self._identity_profiles)
 
-        e_exclude = [e.id for e in legacy_emails_qs if
-                     idp_qs.filter(email=e.identifier, privacy__gte=e.privacy).exists()]
-        legacy_emails_qs = legacy_emails_qs.exclude(id__in=e_exclude)
+        def _max_privacy(accounts, email_attr):
+            privacy = {}
+            for account in accounts:
+                email = getattr(account, email_attr)
+                privacy[email] = max(privacy.get(email, account.privacy), account.privacy)
+            return privacy
 
-        idp_exclude = [i.id for i in idp_qs if
-                       legacy_emails_qs.filter(identifier=i.email,
-                                               privacy__gte=i.privacy).exists()]
-        idp_qs = idp_qs.exclude(id__in=idp_exclude)
+        # An IdP email replaces a legacy one with the same or lower privacy
+        idp_privacy = _max_privacy(idp_profiles, 'email')
+        legacy_emails = [e for e in legacy_emails
+                         if not idp_privacy.get(e.identifier, 0) >= e.privacy]
 
-        return chain(legacy_emails_qs, idp_qs)
+        legacy_privacy = _max_privacy(legacy_emails, 'identifier')
+        idp_profiles = [i for i in idp_profiles
+                        if not legacy_privacy.get(i.email, 0) >= i.privacy]
+
+        return legacy_emails + idp_profiles
 
     @property
     def _identity_profiles(self):
-        _getattr = (lambda x: super(UserProfile, self).__getattribute__(x))
-        accounts = _getattr('idp_profiles').all()
+        accounts = self.idp_profiles.all()
         return self._filter_accounts_privacy(accounts)
 
     @property
@@ -323,95 +411,145 @@ class UserProfile(UserProfilePrivacyModel):
 
     @property
     def _languages(self):
-        _getattr = (lambda x: super(UserProfile, self).__getattribute__(x))
-        if self._privacy_level > _getattr('privacy_languages'):
-            return _getattr('language_set').none()
-        return _getattr('language_set').all()
+        if self._privacy_level > self.privacy_languages:
+            return self.language_set.none()
+        return self.language_set.all()
 
     @property
     def _primary_email(self):
-        _getattr = (lambda x: super(UserProfile, self).__getattribute__(x))
-
         privacy_fields = UserProfile.privacy_fields()
 
-        if self._privacy_level:
-            # Try IDP contact first
-            if self.idp_profiles.exists():
-                contact_ids = self.identity_profiles.filter(primary_contact_identity=True)
-                if contact_ids.exists():
-                    return contact_ids[0].email
-                return ''
-
+        if self.primary_contact_privacy is None:
             # Fallback to user.email
-            if _getattr('privacy_email') < self._privacy_level:
+            if self._privacy_level and self.privacy_email < self._privacy_level:
                 return privacy_fields['email']
+            return self.user.email
+
+        # Try IDP contact first
+        if self._privacy_level:
+            if self.primary_contact_privacy < self._privacy_level:
+                return ''
+            return self.primary_contact_email
 
         # In case we don't have a privacy aware attribute access
-        if self.idp_profiles.filter(primary_contact_identity=True).exists():
-            return self.idp_profiles.filter(primary_contact_identity=True)[0].email
-        return _getattr('user').email
+        return self.primary_contact_email or self.user.email
+
+    @staticmethod
+    def get_primary_contact(identities):
+        """Return the primary contact email and privacy of a profile.
+
+        identities are the (primary_contact_identity, email, privacy) of
+        the identities of the profile ordered by pk, the first contact
+        identity wins.
+        """
+        for is_contact, email, privacy in identities:
+            if is_contact:
+                return email, privacy
+        if identities:
+            # Identities without a contact one hide the email from everyone.
+            return '', PRIVATE
+        return '', None
+
+    def update_primary_contact_email(self, save=True):
+        """Sync the denormalized primary contact email with the identities."""
+        identities = list(IdpProfile.objects.filter(profile=self).order_by('pk')
+                          .values_list('primary_contact_identity', 'email', 'privacy'))
+        self.primary_contact_email, self.primary_contact_privacy = (
+            UserProfile.get_primary_contact(identities))
+
+        if save and self.pk:
+            from mozillians.common.signals import reindex_profile
+
+            UserProfile.objects.filter(pk=self.pk).update(
+                primary_contact_email=self.primary_contact_email,
+                primary_contact_privacy=self.primary_contact_privacy)
+            reindex_profile(self)
 
     @property
     def _vouched_by(self):
         privacy_level = self._privacy_level
-        voucher = (UserProfile.objects.filter(vouches_made__vouchee=self)
-                   .order_by('vouches_made__date'))
-
-        if voucher.exists():
-            voucher = voucher[0]
-            if privacy_level:
-                voucher.set_instance_privacy_level(privacy_level)
-                for field in UserProfile.privacy_fields():
-                    if getattr(voucher, 'privacy_%s' % field) >= privacy_level:
-                        return voucher
+        vouchers = (UserProfile.objects.filter(vouches_made__vouchee=self)
+                    .order_by('vouches_made__date'))
+
+        if privacy_level:
+            voucher = vouchers.with_visibility(privacy_level).first()
+            if voucher is None or not voucher.is_visible:
                 return None
+            voucher.set_instance_privacy_level(privacy_level)
             return voucher
 
-        return None
+        return vouchers.first()
 
     def _vouches(self, type):
-        _getattr = (lambda x: super(UserProfile, self).__getattribute__(x))
-
-        vouch_ids = []
-        for vouch in _getattr(type).all():
-            vouch.vouchee.set_instance_privacy_level(self._privacy_level)
-            for field in UserProfile.privacy_fields():
-                if getattr(vouch.vouchee, 'privacy_%s' % field, 0) >= self._privacy_level:
-                    vouch_ids.append(vouch.id)
-        vouches = _getattr(type).filter(pk__in=vouch_ids)
-
-        return vouches
+        return self._get_unfiltered(type).filter(visible_q(self._privacy_level, 'vouchee__'))
 
     @property
     def _vouches_made(self):
-        _getattr = (lambda x: super(UserProfile, self).__getattribute__(x))
         if self._privacy_level:
             return self._vouches('vouches_made')
-        return _getattr('vouches_made')
+        return self._get_unfiltered('vouches_made')
 
     @property
     def _vouches_received(self):
-        _getattr = (lambda x: super(UserProfile, self).__getattribute__(x))
         if self._privacy_level:
             return self._vouches('vouches_received')
-        return _getattr('vouches_received')
+        return self._get_unfiltered('vouches_received')
 
     @property
     def _websites(self):
-        _getattr = (lambda x: super(UserProfile, self).__getattribute__(x))
-        accounts = _getattr('externalaccount_set').filter(type=ExternalAccount.TYPE_WEBSITE)
+        accounts = self.externalaccount_set.filter(type=ExternalAccount.TYPE_WEBSITE)
         return self._filter_accounts_privacy(accounts)
 
     @property
     def display_name(self):
         return self.full_name
 
+    @property
+    def privacy_clearance(self):
+        """Return the group memberships that the privacy clearance depends on.
+
+        The result is kept on the instance for the rest of the request and
+        in the shared cache, versioned with the membership generation of
+        the profile so that membership changes invalidate it.
+        """
+        clearance = self.__dict__.get('_privacy_clearance')
+        if clearance is not None:
+            return clearance
+
+        generation = utils.get_cache_generation('privacy_clearance:{0}'.format(self.pk))
+        cache_key = 'privacy_clearance:{0}:{1}'.format(self.pk, generation)
+        clearance = cache.get(cache_key)
+        if clearance is None:
+            memberships = (GroupMembership.objects
+                           .filter(userprofile__pk=self.pk,
+                                   group__name__in=['staff', settings.NDA_GROUP])
+                           .values_list('group__name', 'status'))
+            clearance = {
+                'manager': self.user.groups.filter(name='Managers').exists(),
+                'staff': False,
+                'nda': False,
+            }
+            for name, status in memberships:
+                if name == 'staff':
+                    clearance['staff'] = True
+                if name == settings.NDA_GROUP and status == GroupMembership.MEMBER:
+                    clearance['nda'] = True
+            cache.set(cache_key, clearance, PRIVACY_CLEARANCE_CACHE_TIMEOUT)
+
+        self.__dict__['_privacy_clearance'] = clearance
+        return clearance
+
+    def invalidate_privacy_clearance(self):
+        """Drop the cached privacy clearance after a membership change."""
+        self.__dict__.pop('_privacy_clearance', None)
+        utils.bump_cache_generation('privacy_clearance:{0}'.format(self.pk))
+
     @property
     def privacy_level(self):
         """Return user privacy clearance."""
-        if (self.user.groups.filter(name='Managers').exists() or self.user.is_superuser):
+        if self.privacy_clearance['manager'] or self.user.is_superuser:
             return PRIVATE
-        if self.groups.filter(name='staff').exists():
+        if self.privacy_clearance['staff']:
             return EMPLOYEES
         if self.is_vouched:
             return MOZILLIANS
@@ -437,16 +575,11 @@ class UserProfile(UserProfilePrivacyModel):
 
     @property
     def is_manager(self):
-        return self.user.is_superuser or self.user.groups.filter(name='Managers').exists()
+        return self.user.is_superuser or self.privacy_clearance['manager']
 
     @property
     def is_nda(self):
-        query = {
-            'userprofile__pk': self.pk,
-            'group__name': settings.NDA_GROUP,
-            'status': GroupMembership.MEMBER
-        }
-        return GroupMembership.objects.filter(**query).exists() or self.user.is_superuser
+        return self.privacy_clearance['nda'] or self.user.is_superuser
 
     @property
     def date_vouched(self):
@@ -527,27 +660,79 @@ class UserProfile(UserProfilePrivacyModel):
         else:
             m2mfield.add(*groups_to_add)
 
-    def get_photo_thumbnail(self, geometry='160x160', **kwargs):
+    def get_photo_thumbnail(self, geometry='160x160', photo=None, **kwargs):
+        """Return the thumbnail of photo, the privacy aware photo by default."""
         if 'crop' not in kwargs:
             kwargs['crop'] = 'center'
+        if photo is None:
+            photo = self.photo
 
-        if self.photo and default_storage.exists(self.photo.name):
+        if photo and default_storage.exists(photo.name):
             # Workaround for legacy images in RGBA model
 
             try:
-                image_obj = Image.open(self.photo)
+                image_obj = Image.open(photo)
             except IOError:
                 return get_thumbnail(settings.DEFAULT_AVATAR_PATH, geometry, **kwargs)
 
             if image_obj.mode == 'RGBA':
-                new_fh = default_storage.open(self.photo.name, 'w')
+                new_fh = default_storage.open(photo.name, 'w')
                 converted_image_obj = image_obj.convert('RGB')
                 converted_image_obj.save(new_fh, 'JPEG')
                 new_fh.close()
 
-            return get_thumbnail(self.photo, geometry, **kwargs)
+            return get_thumbnail(photo, geometry, **kwargs)
         return get_thumbnail(settings.DEFAULT_AVATAR_PATH.format(), geometry, **kwargs)
 
+    @property
+    def photo_manifest(self):
+        """Return the pre-generated thumbnail urls of the photo by geometry."""
+        try:
+            manifest = json.loads(self.photo_thumbnails)
+        except ValueError:
+            manifest = {}
+        if not self.photo or manifest.get('photo') != self.photo.name:
+            return {}
+        return manifest.get('thumbnails', {})
+
+    @property
+    def photo_thumbnails_stale(self):
+        """Return True if the thumbnail manifest does not match the photo."""
+        try:
+            photo = json.loads(self.photo_thumbnails).get('photo', '')
+        except ValueError:
+            photo = ''
+        # The manifest follows the stored photo, whoever looks at the profile.
+        return photo != (self._get_unfiltered('photo').name or '')
+
+    def generate_photo_thumbnails(self):
+        """Render the standard thumbnail geometries and store their urls."""
+        from mozillians.common.signals import reindex_profile
+
+        manifest = ''
+        photo = self._get_unfiltered('photo')
+        if photo:
+            thumbnails = {}
+            # Missing photos are served the default avatar, don't record that.
+            if default_storage.exists(photo.name):
+                thumbnails = dict((geometry, self.get_photo_thumbnail(geometry, photo=photo).url)
+                                  for geometry in settings.PHOTO_THUMBNAIL_GEOMETRIES)
+            manifest = json.dumps({'photo': photo.name, 'thumbnails': thumbnails})
+
+        self.photo_thumbnails = manifest
+        UserProfile.objects.filter(pk=self.pk).update(photo_thumbnails=manifest)
+        # The search cards link the thumbnails.
+        reindex_profile(self)
+
+    def get_photo_thumbnail_url(self, geometry='160x160', **kwargs):
+        """Return the thumbnail url, from the manifest if it is pre-generated."""
+        # Only the default center crop is pre-generated
+        if kwargs.get('crop', 'center') == 'center' and set(kwargs) <= set(['crop']):
+            url = self.photo_manifest.get(geometry)
+            if url:
+                return url
+        return self.get_photo_thumbnail(geometry, **kwargs).url
+
     def get_photo_url(self, geometry='160x160', **kwargs):
         """Return photo url.
 
@@ -559,7 +744,7 @@ class UserProfile(UserProfilePrivacyModel):
         if (not self.photo and self.privacy_photo >= privacy_level):
             return gravatar(self.email, size=geometry)
 
-        photo_url = self.get_photo_thumbnail(geometry, **kwargs).url
+        photo_url = self.get_photo_thumbnail_url(geometry, **kwargs)
         if photo_url.startswith('https://') or photo_url.startswith('http://'):
             return photo_url
         return absolutify(photo_url)
@@ -631,18 +816,32 @@ class UserProfile(UserProfilePrivacyModel):
         send_mail(subject, filtered_message, settings.FROM_NOREPLY,
                   [self.email])
 
+    def prefetch_profile_relations(self):
+        """Fetch the relations shown on the profile page in bulk.
+
+        The identities, the visible memberships with their groups and
+        curators and the group invites redeemed by the profile are fetched
+        with a constant number of queries, no matter how many groups the
+        profile is in.
+        """
+        memberships = (GroupMembership.objects.filter(group__visible=True)
+                       .select_related('group').prefetch_related('group__curators'))
+        invites = Invite.objects.select_related('inviter__user')
+        prefetch_related_objects(
+            [self], 'idp_profiles',
+            Prefetch('groupmembership_set', queryset=memberships, to_attr='_visible_memberships'),
+            Prefetch('groups_invited', queryset=invites, to_attr='_redeemed_invites'))
+
     def _get_annotated_groups(self):
-        # Query this way so we only get the groups that the privacy controls allow the
-        # current user to see. We have to force evaluation of this query first, otherwise
-        # Django combines the whole thing into one query and loses the privacy control.
-        groups_manager = self.groups
-        # checks to avoid AttributeError exception b/c self.groups may returns
-        # EmptyQuerySet instead of the default manager due to privacy controls
-        user_group_ids = []
-        if hasattr(groups_manager, 'visible'):
-            user_group_ids = groups_manager.visible().values_list('id', flat=True)
-
-        return self.groupmembership_set.filter(group__id__in=user_group_ids)
+        # Only return the groups that the privacy controls allow the current user to see.
+        if self._privacy_level and self.privacy_groups < self._privacy_level:
+            return []
+
+        memberships = getattr(self, '_visible_memberships', None)
+        if memberships is None:
+            memberships = (self.groupmembership_set.filter(group__visible=True)
+                           .select_related('group').prefetch_related('group__curators'))
+        return memberships
 
     def get_annotated_tags(self):
         """
@@ -650,10 +849,11 @@ class UserProfile(UserProfilePrivacyModel):
         membership. The groups pending membership will have a .pending attribute
         set to True, others will have it set False.
         """
-        tags = self._get_annotated_groups().filter(group__is_access_group=False)
         annotated_tags = []
-        for membership in tags:
+        for membership in self._get_annotated_groups():
             tag = membership.group
+            if tag.is_access_group:
+                continue
             tag.pending = (membership.status == GroupMembership.PENDING)
             tag.pending_terms = (membership.status == GroupMembership.PENDING_TERMS)
             annotated_tags.append(tag)
@@ -666,19 +866,25 @@ class UserProfile(UserProfilePrivacyModel):
         set to True, others will have it set False. There is also an inviter attribute
         which displays the inviter of the user in the group.
         """
-        access_groups = self._get_annotated_groups().filter(group__is_access_group=True)
-        annotated_access_groups = []
+        access_groups = [membership for membership in self._get_annotated_groups()
+                         if membership.group.is_access_group]
+        if not access_groups:
+            return []
+
+        invites = getattr(self, '_redeemed_invites', None)
+        if invites is None:
+            group_ids = [membership.group_id for membership in access_groups]
+            invites = (Invite.objects.filter(redeemer=self, group__id__in=group_ids)
+                       .select_related('inviter__user'))
+        invites = dict((invite.group_id, invite) for invite in invites)
 
+        annotated_access_groups = []
         for membership in access_groups:
             group = membership.group
             group.pending = (membership.status == GroupMembership.PENDING)
             group.pending_terms = (membership.status == GroupMembership.PENDING_TERMS)
 
-            try:
-                invite = Invite.objects.get(group=membership.group, redeemer=self)
-            except Invite.DoesNotExist:
-                invite = None
-
+            invite = invites.get(membership.group_id)
             if invite:
                 group.inviter = invite.inviter
             annotated_access_groups.append(group)
@@ -780,6 +986,79 @@ class UserProfile(UserProfilePrivacyModel):
             self.auto_vouch()
 
 
+class ProfileRecord(object):
+    """Read only, privacy redacted snapshot of a UserProfile.
+
+    Records are built by UserProfileQuerySet.materialize() from profiles
+    with their related objects already fetched, so reading the fields,
+    the geo data, the accounts, the identities, the languages, the groups
+    or the email of a record does not hit the database. Anything else is
+    looked up on the privacy aware profile the record was built from.
+    """
+
+    def __init__(self, profile):
+        privacy_level = profile._privacy_level
+        values = {
+            '_profile': profile,
+            '_privacy_level': privacy_level,
+            'pk': profile.pk,
+        }
+
+        for field in UserProfile._meta.concrete_fields:
+            value = getattr(profile, field.name)
+            values[field.name] = value
+            if field.is_relation:
+                values[field.attname] = value.pk if value is not None else None
+
+        accounts = list(profile.externalaccount_set.all())
+        identities = list(profile.idp_profiles.all())
+        if privacy_level:
+            accounts = [a for a in accounts if a.privacy >= privacy_level]
+            identity_profiles = [i for i in identities if i.privacy >= privacy_level]
+        else:
+            identity_profiles = identities
+
+        excluded_types = [ExternalAccount.TYPE_WEBSITE, ExternalAccount.TYPE_EMAIL]
+        values['accounts'] = tuple(a for a in accounts if a.type not in excluded_types)
+        values['websites'] = tuple(a for a in accounts if a.type == ExternalAccount.TYPE_WEBSITE)
+        values['alternate_emails'] = tuple(a for a in accounts
+                                           if a.type == ExternalAccount.TYPE_EMAIL)
+        values['identity_profiles'] = tuple(identity_profiles)
+
+        if privacy_level > profile.privacy_languages:
+            values['languages'] = ()
+        else:
+            values['languages'] = tuple(profile.language_set.all())
+
+        if privacy_level > profile.privacy_groups:
+            values['groups'] = ()
+        else:
+            values['groups'] = tuple(m.group for m in profile._member_memberships)
+
+        values['email'] = profile._primary_email
+
+        self.__dict__.update(values)
+
+    def __getattr__(self, attrname):
+        return getattr(self._profile, attrname)
+
+    def __setattr__(self, attrname, value):
+        raise AttributeError('ProfileRecord is read only')
+
+    def __delattr__(self, attrname):
+        raise AttributeError('ProfileRecord is read only')
+
+    def __unicode__(self):
+        return self.display_name
+
+    def __repr__(self):
+        return '<ProfileRecord: %s>' % self.pk
+
+    @property
+    def display_name(self):
+        return self.full_name
+
+
 class IdpProfile(models.Model):
     """Basic Identity Provider information for Profiles."""
     PROVIDER_UNKNOWN = 0
@@ -855,6 +1134,7 @@ class IdpProfile(models.Model):
         profile = self.profile
         if self.primary_contact_identity:
             profile.privacy_email = self.privacy
+        profile.update_primary_contact_email(save=False)
         # Set the user id in the userprofile too
         if self.primary:
             profile.auth0_user_id = self.auth0_user_id
@@ -867,6 +1147,94 @@ class IdpProfile(models.Model):
         unique_together = ('profile', 'type', 'email')
 
 
+class InvitationCandidate(models.Model):
+    """A profile that can be invited to an access group.
+
+    Materializes the staff, NDA membership and MFA identity checks of the
+    invitation autocompletes, along with the label they display. The rows
+    are refreshed by users.signals when an identity or an NDA membership
+    changes, which includes every login. Profiles that are not eligible
+    for any invitation have no row.
+    """
+    profile = models.OneToOneField(UserProfile, primary_key=True,
+                                   related_name='invitation_candidate')
+    label = models.CharField(max_length=255)
+    is_staff = models.BooleanField(default=False)
+    is_nda_member = models.BooleanField(default=False)
+    has_mfa_identity = models.BooleanField(default=False)
+
+    objects = InvitationCandidateQuerySet.as_manager()
+
+    class Meta:
+        ordering = ['label']
+
+    def __unicode__(self):
+        return self.label
+
+    @classmethod
+    def refresh(cls, profile_id):
+        """Create, update or delete the row of the profile with profile_id."""
+        profile = UserProfile.objects.select_related('user').filter(pk=profile_id).first()
+        if not profile:
+            return
+
+        identities = list(IdpProfile.objects.filter(profile=profile))
+        domains = tuple('@' + domain.lower() for domain in settings.AUTO_VOUCH_DOMAINS)
+        primary = next((idp for idp in identities if idp.primary), None)
+        values = {
+            'is_staff': any(idp.email.lower().endswith(domains) for idp in identities),
+            'is_nda_member': GroupMembership.objects.filter(
+                userprofile=profile, group__name=settings.NDA_GROUP,
+                status=GroupMembership.MEMBER).exists(),
+            'has_mfa_identity': bool(primary and primary.type in IdpProfile.HIGH_AAL_ACCOUNTS),
+        }
+        if not any(values.values()):
+            cls.objects.filter(profile=profile).delete()
+            return
+
+        # Append the email used for login to the label.
+        label = profile.display_name
+        if primary:
+            label += u' ({0})'.format(primary.email)
+        values['label'] = label[:255]
+
+        user = profile.user
+        terms = set(INVITATION_TERM_RE.findall(
+            u' '.join([profile.full_name, user.username, user.email]).lower()))
+        terms.update([user.username.lower(), user.email.lower()])
+        terms = set(term[:INVITATION_TERM_LENGTH] for term in terms if term)
+
+        try:
+            cls._save(profile, values, terms)
+        except IntegrityError:
+            # A concurrent refresh of the profile inserted some of the terms
+            # first, they are read on the second attempt.
+            cls._save(profile, values, terms)
+
+    @classmethod
+    def _save(cls, profile, values, terms):
+        with transaction.atomic():
+            candidate = cls.objects.update_or_create(profile=profile, defaults=values)[0]
+            existing = set(candidate.terms.values_list('term', flat=True))
+            if existing - terms:
+                candidate.terms.filter(term__in=existing - terms).delete()
+            InvitationCandidateTerm.objects.bulk_create(
+                [InvitationCandidateTerm(candidate=candidate, term=term)
+                 for term in terms - existing])
+
+
+class InvitationCandidateTerm(models.Model):
+    """A lower case word of the name, username or email of a candidate."""
+    candidate = models.ForeignKey(InvitationCandidate, related_name='terms')
+    term = models.CharField(max_length=INVITATION_TERM_LENGTH, db_index=True)
+
+    class Meta:
+        unique_together = ('candidate', 'term')
+
+    def __unicode__(self):
+        return self.term
+
+
 class Vouch(models.Model):
     vouchee = models.ForeignKey(UserProfile, related_name='vouches_received')
     voucher = models.ForeignKey(UserProfile, related_name='vouches_made',
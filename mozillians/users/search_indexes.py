@@ -1,9 +1,94 @@
+import json
+
+from django.db.models import Min, Prefetch
 from haystack import indexes
 
+from mozillians.common.templatetags.helpers import get_privacy_aware_photo_url
 from mozillians.groups.models import GroupMembership
+from mozillians.users.managers import EMPLOYEES, MOZILLIANS, PRIVATE, PUBLIC
 from mozillians.users.models import IdpProfile, UserProfile
 
 
+# The field holding the searchable text visible at each privacy level.
+SEARCH_TEXT_FIELDS = {
+    PUBLIC: 'search_text_public',
+    MOZILLIANS: 'search_text_mozillians',
+    EMPLOYEES: 'search_text_employees',
+    PRIVATE: 'search_text_private',
+}
+
+# The field holding the display fields of a search result, as seen at each
+# privacy level. Documents that look the same at every level use 'card'.
+SEARCH_CARD_FIELDS = {
+    PUBLIC: 'card_public',
+    MOZILLIANS: 'card_mozillians',
+    EMPLOYEES: 'card_employees',
+    PRIVATE: 'card_private',
+}
+SEARCH_CARD_PHOTO_GEOMETRY = '70x70'
+
+
+def get_search_card(result, privacy_level):
+    """Return the display fields stored for a search result, if any."""
+    card = (getattr(result, SEARCH_CARD_FIELDS.get(privacy_level, ''), None)
+            or getattr(result, 'card', None))
+    if card:
+        return json.loads(card)
+    return None
+
+
+def prepare_search_cards(profile):
+    """Return the search card fields of profile, redacted for every privacy level."""
+    privacy_level = profile._privacy_level
+    cards = {}
+    try:
+        for level, field in SEARCH_CARD_FIELDS.items():
+            profile._privacy_level = level
+            location = [getattr(profile, name).name for name in ('city', 'region', 'country')
+                        if getattr(profile, name) and getattr(profile, 'privacy_' + name) >= level]
+            cards[field] = json.dumps({
+                'type': 'profile',
+                'username': profile.user.username,
+                'name': profile.display_name if profile.privacy_full_name >= level else '',
+                'email': profile.email if profile.privacy_email >= level else '',
+                'ircname': profile.ircname if profile.privacy_ircname >= level else '',
+                'photo': get_privacy_aware_photo_url(profile, level, SEARCH_CARD_PHOTO_GEOMETRY),
+                'location': ', '.join(location),
+            })
+    finally:
+        profile._privacy_level = privacy_level
+    return cards
+
+
+def prepare_search_text(data, public_fields=()):
+    """Return the search text fields of a prepared search document.
+
+    Every field of the document with a privacy_<field> companion is
+    added to the text of the levels allowed to see it. The public_fields
+    are visible at all levels.
+    """
+    values = []
+    for name in sorted(data):
+        privacy_name = 'privacy_{0}'.format(name)
+        if privacy_name in data:
+            values.append((data[name], data[privacy_name]))
+        elif name in public_fields:
+            values.append((data[name], PUBLIC))
+
+    search_text = {}
+    for level, field in SEARCH_TEXT_FIELDS.items():
+        words = []
+        for value, privacy in values:
+            if not value or privacy < level:
+                continue
+            if isinstance(value, (list, tuple)):
+                words.extend(value)
+            else:
+                words.append(value)
+        search_text[field] = u' '.join(words)
+    return search_text
+
+
 class UserProfileIndex(indexes.SearchIndex, indexes.Indexable):
     """User Profile Search Index."""
     # Primary field of the index
@@ -36,13 +121,29 @@ class UserProfileIndex(indexes.SearchIndex, indexes.Indexable):
 
     # Django's username does not have privacy level
     username = indexes.CharField(model_attr='user__username')
+    # the text visible at each privacy level, see prepare_search_text
+    search_text_public = indexes.CharField()
+    search_text_mozillians = indexes.CharField()
+    search_text_employees = indexes.CharField()
+    search_text_private = indexes.CharField()
+    # the search result card at each privacy level, see prepare_search_cards
+    card_public = indexes.CharField(indexed=False)
+    card_mozillians = indexes.CharField(indexed=False)
+    card_employees = indexes.CharField(indexed=False)
+    card_private = indexes.CharField(indexed=False)
 
     def get_model(self):
         return UserProfile
 
+    def prepare(self, obj):
+        data = super(UserProfileIndex, self).prepare(obj)
+        data.update(prepare_search_text(data, public_fields=['username']))
+        data.update(prepare_search_cards(obj))
+        return data
+
     def prepare_email(self, obj):
         # Do not index the email if it's already in the IdpProfiles
-        if not obj.idp_profiles.exists():
+        if obj.primary_contact_privacy is None:
             return obj.email
         return ''
 
@@ -53,12 +154,26 @@ class UserProfileIndex(indexes.SearchIndex, indexes.Indexable):
         return [language.get_code_display() for language in obj.languages.all()]
 
     def prepare_groups(self, obj):
+        memberships = getattr(obj, '_member_memberships', None)
+        if memberships is not None:
+            return [membership.group.name for membership in memberships]
         return [group.name for group in obj.groups.filter(
             groupmembership__status=GroupMembership.MEMBER)]
 
     def index_queryset(self, using=None):
-        """Exclude incomplete profiles from indexing."""
-        return self.get_model().objects.complete()
+        """Exclude incomplete profiles from indexing.
+
+        The related objects are fetched in bulk for every batch of
+        profiles, so indexing a batch takes the same number of queries
+        whatever its size.
+        """
+        memberships = (GroupMembership.objects.filter(status=GroupMembership.MEMBER)
+                       .select_related('group'))
+        return (self.get_model().objects.complete()
+                .select_related('user', 'country', 'region', 'city')
+                .prefetch_related('skills', 'language_set', 'groups',
+                                  Prefetch('groupmembership_set', queryset=memberships,
+                                           to_attr='_member_memberships')))
 
 
 class IdpProfileIndex(indexes.SearchIndex, indexes.Indexable):
@@ -70,18 +185,33 @@ class IdpProfileIndex(indexes.SearchIndex, indexes.Indexable):
     privacy_iemail = indexes.IntegerField(model_attr='privacy')
     iusername = indexes.CharField(model_attr='username')
     privacy_iusername = indexes.IntegerField(model_attr='privacy')
+    # the text visible at each privacy level, see prepare_search_text
+    search_text_public = indexes.CharField()
+    search_text_mozillians = indexes.CharField()
+    search_text_employees = indexes.CharField()
+    search_text_private = indexes.CharField()
+    # the card of the profile of the identity, see prepare_search_cards
+    card_public = indexes.CharField(indexed=False)
+    card_mozillians = indexes.CharField(indexed=False)
+    card_employees = indexes.CharField(indexed=False)
+    card_private = indexes.CharField(indexed=False)
 
     def get_model(self):
         return IdpProfile
 
+    def prepare(self, obj):
+        data = super(IdpProfileIndex, self).prepare(obj)
+        data.update(prepare_search_text(data))
+        data.update(prepare_search_cards(obj.profile))
+        return data
+
     def index_queryset(self, using=None):
-        """Only index unique emails."""
-        all_idps = IdpProfile.objects.all()
-        idps_ids = []
-        unique_emails = set()
-
-        for idp in all_idps:
-            if idp.email not in unique_emails:
-                idps_ids.append(idp.id)
-                unique_emails.add(idp.email)
-        return self.get_model().objects.filter(id__in=idps_ids)
+        """Only index unique emails, the first identity of every email.
+
+        The reindex reads it in primary key batches, see index_search_partition.
+        """
+        first_ids = (IdpProfile.objects.order_by().values('email')
+                     .annotate(first_id=Min('id')).values('first_id'))
+        return (self.get_model().objects.filter(id__in=first_ids)
+                .select_related('profile__user', 'profile__country', 'profile__region',
+                                'profile__city'))
@@ -8,10 +8,11 @@ from django.contrib.auth.models import User
 
 from raven.contrib.django.raven_compat.models import client as sentry_client
 
-from mozillians.common.utils import bundle_profile_data
-from mozillians.groups.models import Group
-from mozillians.users.models import UserProfile, Vouch
-from mozillians.users.tasks import subscribe_user_to_basket, unsubscribe_from_basket_task
+from mozillians.common.utils import bump_cache_generation, bundle_profile_data
+from mozillians.groups.models import Group, GroupMembership, Skill, in_bulk_membership_changes
+from mozillians.users.models import InvitationCandidate, IdpProfile, UserProfile, Vouch
+from mozillians.users.tasks import (generate_photo_thumbnails, subscribe_user_to_basket,
+                                    unsubscribe_from_basket_task)
 
 
 # Signal to create a UserProfile.
@@ -51,6 +52,26 @@ def remove_user_from_access_groups(sender, instance, **kwargs):
         group.curators.remove(instance)
 
 
+# Signals to keep the skill member counts in sync when a profile is deleted.
+@receiver(signals.pre_delete, sender=UserProfile, dispatch_uid='profile_skill_ids_sig')
+def store_skill_ids(sender, instance, **kwargs):
+    instance._deleted_skill_ids = list(instance.skills.values_list('pk', flat=True))
+
+
+@receiver(signals.post_delete, sender=UserProfile, dispatch_uid='profile_skill_member_counts_sig')
+def update_skill_member_counts(sender, instance, **kwargs):
+    skill_ids = getattr(instance, '_deleted_skill_ids', None)
+    if skill_ids:
+        Skill.update_member_counts(skill_ids)
+
+
+# Signal to render the thumbnails of a new photo.
+@receiver(signals.post_save, sender=UserProfile, dispatch_uid='generate_photo_thumbnails_sig')
+def schedule_photo_thumbnails(sender, instance, raw, **kwargs):
+    if not raw and instance.photo_thumbnails_stale:
+        transaction.on_commit(lambda: generate_photo_thumbnails.delay(instance.pk))
+
+
 # Basket User signals
 @receiver(signals.post_save, sender=UserProfile, dispatch_uid='update_basket_sig')
 def update_basket(sender, instance, **kwargs):
@@ -111,3 +132,91 @@ def update_vouch_flags(sender, instance, **kwargs):
     profile.is_vouched = vouches > 0
     profile.can_vouch = vouches >= settings.CAN_VOUCH_THRESHOLD
     profile.save(**{'autovouch': False})
+
+
+# Signal to keep the primary contact email in sync after removing identities.
+@receiver(signals.post_delete, sender=IdpProfile, dispatch_uid='delete_idp_contact_email_sig')
+def update_primary_contact_email(sender, instance, **kwargs):
+    try:
+        profile = instance.profile
+    except UserProfile.DoesNotExist:
+        # The identity is deleted along with the UserProfile. Do nothing.
+        return
+    profile.update_primary_contact_email()
+
+
+# Signals to invalidate the cached privacy clearance.
+@receiver(signals.post_save, sender=UserProfile, dispatch_uid='new_profile_privacy_clearance_sig')
+def start_privacy_clearance_generation(sender, instance, created, raw, **kwargs):
+    # Never serve a clearance cached for a deleted profile with the same pk.
+    if created and not raw:
+        bump_cache_generation('privacy_clearance:{0}'.format(instance.pk))
+
+
+@receiver(signals.m2m_changed, sender=User.groups.through,
+          dispatch_uid='user_groups_privacy_clearance_sig')
+def invalidate_privacy_clearance(sender, instance, action, reverse, pk_set, **kwargs):
+    if reverse:
+        # The users of a group changed, the members are gone after a clear.
+        if action == 'pre_clear':
+            pk_set = list(instance.user_set.values_list('pk', flat=True))
+        elif action not in ['post_add', 'post_remove']:
+            return
+        profiles = UserProfile.objects.filter(user__pk__in=pk_set)
+    else:
+        if action not in ['post_add', 'post_remove', 'post_clear']:
+            return
+        profiles = UserProfile.objects.filter(user=instance)
+
+    for profile_id in profiles.values_list('pk', flat=True):
+        bump_cache_generation('privacy_clearance:{0}'.format(profile_id))
+
+
+# Signals to keep the invitation directory up to date.
+@receiver(signals.post_save, sender=IdpProfile, dispatch_uid='idp_invitation_candidate_sig')
+def refresh_invitation_candidate(sender, instance, raw, **kwargs):
+    if not raw:
+        InvitationCandidate.refresh(instance.profile_id)
+
+
+@receiver(signals.post_delete, sender=IdpProfile,
+          dispatch_uid='delete_idp_invitation_candidate_sig')
+def refresh_invitation_candidate_after_delete(sender, instance, **kwargs):
+    # The profile may be deleted along with the identity, refresh once it is gone.
+    profile_id = instance.profile_id
+    transaction.on_commit(lambda: InvitationCandidate.refresh(profile_id))
+
+
+@receiver(signals.post_save, sender=GroupMembership,
+          dispatch_uid='nda_membership_invitation_candidate_sig')
+def refresh_nda_invitation_candidate(sender, instance, raw, **kwargs):
+    if not raw and not in_bulk_membership_changes() and instance.group.name == settings.NDA_GROUP:
+        InvitationCandidate.refresh(instance.userprofile_id)
+
+
+@receiver(signals.post_delete, sender=GroupMembership,
+          dispatch_uid='delete_nda_membership_invitation_candidate_sig')
+def refresh_nda_invitation_candidate_after_delete(sender, instance, **kwargs):
+    if not in_bulk_membership_changes() and instance.group.name == settings.NDA_GROUP:
+        # The profile may be deleted along with the membership.
+        profile_id = instance.userprofile_id
+        transaction.on_commit(lambda: InvitationCandidate.refresh(profile_id))
+
+
+@receiver(signals.post_save, sender=UserProfile,
+          dispatch_uid='profile_invitation_candidate_sig')
+def refresh_invitation_candidate_label(sender, instance, raw, **kwargs):
+    """Keep the label and the terms in sync with the name of the profile."""
+    if not raw and InvitationCandidate.objects.filter(profile=instance).exists():
+        InvitationCandidate.refresh(instance.pk)
+
+
+@receiver(signals.post_save, sender=User, dispatch_uid='user_invitation_candidate_sig')
+def refresh_invitation_candidate_terms(sender, instance, raw, **kwargs):
+    """Keep the terms in sync with the username and the email of the user."""
+    if raw:
+        return
+    profile_id = (InvitationCandidate.objects.filter(profile__user=instance)
+                  .values_list('profile_id', flat=True).first())
+    if profile_id:
+        InvitationCandidate.refresh(profile_id)
@@ -1,16 +1,20 @@
 import json
 import logging
 import os
+import re
 from datetime import timedelta
 
+from django.apps import apps
 from django.conf import settings
+from django.core.cache import cache
 from django.core.mail import send_mail
 from django.core.management import call_command
+from django.db.models import Max, Min
 from django.utils.timezone import now
 
 import basket
 import waffle
-from celery import chain, group, shared_task, Task
+from celery import chain, chord, group, shared_task, Task
 from celery.exceptions import MaxRetriesExceededError
 from haystack import connections
 from raven.contrib.django.raven_compat.models import client as sentry_client
@@ -20,6 +24,11 @@ from mozillians.common.utils import akismet_spam_check, bundle_profile_data, is_
 from mozillians.common.templatetags.helpers import get_object_or_none
 
 
+# The name of the search index being built, while a reindex is running.
+SEARCH_REINDEX_KEY = 'search_reindex'
+SEARCH_REINDEX_CHECKPOINT_KEY = 'search_reindex:{0}:{1}:{2}'
+SEARCH_REINDEX_TIMEOUT = 60 * 60 * 24
+
 BASKET_TASK_RETRY_DELAY = 120  # 2 minutes
 BASKET_TASK_MAX_RETRIES = 2  # Total 1+2 = 3 tries
 BASKET_URL = getattr(settings, 'BASKET_URL', False)
@@ -279,6 +288,16 @@ def check_spam_account(instance_id, **kwargs):
         AbuseReport.objects.get_or_create(**kwargs)
 
 
+@app.task
+def generate_photo_thumbnails(instance_id):
+    """Task to pre-generate the standard thumbnails of a profile photo."""
+    from mozillians.users.models import UserProfile
+
+    profile = get_object_or_none(UserProfile, id=instance_id)
+    if profile:
+        profile.generate_photo_thumbnails()
+
+
 @app.task
 def delete_reported_spam_accounts():
     """Task to automatically delete spam accounts"""
@@ -296,81 +315,117 @@ def delete_reported_spam_accounts():
     reports.delete()
 
 
-@shared_task(time_limit=settings.ES_REINDEX_TIMEOUT)
-def index_all_profiles():
-    """Task to rebuild ES index without downtime."""
-
-    ES_CONN_DEFAULT = 'default'
-    ES_CONN_TMP = 'tmp'
-    ES_CONN_CURR = 'current'
-    ES_INDEX_DEFAULT = connections[ES_CONN_DEFAULT].options['INDEX_NAME']
-    ES_INDEX_TMP = connections[ES_CONN_TMP].options['INDEX_NAME']
-    ES_INDEX_CURR = connections[ES_CONN_CURR].options['INDEX_NAME']
-
-    rebuild_options = {
-        'using': [ES_CONN_TMP],
-        'workers': settings.ES_REINDEX_WORKERS_NUM,
-        'batchsize': settings.ES_REINDEX_BATCHSIZE,
-        'interactive': False,
-    }
+def get_search_reindex_backend(index_name, using='default'):
+    """Return a search backend of the using connection writing to index_name."""
+    connection = connections[using]
+    options = dict(connection.options, INDEX_NAME=index_name)
+    return connection.backend(using, **options)
 
-    # Rebuild index in ES_INDEX_TMP
-    call_command('rebuild_index', **rebuild_options)
-
-    # Get `default` ES connection
-    es_conn = connections[ES_CONN_DEFAULT].get_backend().conn
-
-    # Link `default` index to tmp
-    update_aliases_query = {
-        "actions": [
-            {
-                "remove": {
-                    "index": ES_INDEX_CURR,
-                    "alias": ES_INDEX_DEFAULT
-                },
-                "add": {
-                    "index": ES_INDEX_TMP,
-                    "alias": ES_INDEX_DEFAULT
-                },
-            }
-        ]
-    }
 
-    es_conn.indices.update_aliases(
-        update_aliases_query
-    )
+def get_search_partitions(using='default'):
+    """Split the objects of every search index in primary key ranges.
 
-    rebuild_options['using'] = [ES_CONN_CURR]
-
-    # Rebuild index in ES_INDEX_TMP
-    call_command('rebuild_index', **rebuild_options)
-
-    # Link `default` index to current
-    update_aliases_query = {
-        "actions": [
-            {
-                "add": {
-                    "index": ES_INDEX_CURR,
-                    "alias": ES_INDEX_DEFAULT
-                },
-                "remove": {
-                    "index": ES_INDEX_TMP,
-                    "alias": ES_INDEX_DEFAULT
-                },
-            }
-        ]
-    }
+    Returns a list of (model label, first pk, last pk + 1) tuples, every
+    range holds at most ES_REINDEX_PARTITION_SIZE objects.
+    """
+    partitions = []
+    unified_index = connections[using].get_unified_index()
+    for model in unified_index.get_indexed_models():
+        queryset = unified_index.get_index(model).index_queryset(using=using)
+        bounds = queryset.aggregate(first=Min('pk'), last=Max('pk'))
+        if bounds['first'] is None:
+            continue
+        size = settings.ES_REINDEX_PARTITION_SIZE
+        for start in range(bounds['first'], bounds['last'] + 1, size):
+            partitions.append((model._meta.label, start, start + size))
+    return partitions
 
-    es_conn.indices.update_aliases(
-        update_aliases_query
-    )
 
-    # Cleanup `tmp` index
-    options = {
-        'using': [ES_CONN_TMP],
-        'interactive': False
-    }
-    call_command('clear_index', **options)
+@shared_task(time_limit=settings.ES_REINDEX_PARTITION_TIMEOUT)
+def index_search_partition(index_name, label, start, end):
+    """Index the objects of model label with start <= pk < end into index_name."""
+    checkpoint = SEARCH_REINDEX_CHECKPOINT_KEY.format(index_name, label, start)
+    if cache.get(checkpoint):
+        return
+
+    model = apps.get_model(label)
+    backend = get_search_reindex_backend(index_name)
+    index = connections['default'].get_unified_index().get_index(model)
+    queryset = (index.index_queryset(using='default')
+                .filter(pk__gte=start, pk__lt=end).order_by('pk'))
+
+    # Keyset batches rather than iterator(), Django has no server-side
+    # cursors for MySQL and the driver would buffer the whole partition.
+    last_pk = start - 1
+    while True:
+        objects = list(queryset.filter(pk__gt=last_pk)[:settings.ES_REINDEX_BATCHSIZE])
+        if not objects:
+            break
+        backend.update(index, objects)
+        last_pk = objects[-1].pk
+
+    cache.set(checkpoint, True, SEARCH_REINDEX_TIMEOUT)
+
+
+@shared_task()
+def swap_search_index(index_name):
+    """Point the search alias to index_name and drop the older versioned indices."""
+    es_conn = connections['default'].get_backend().conn
+    alias = connections['default'].options['INDEX_NAME']
+
+    actions = []
+    if es_conn.indices.exists_alias(name=alias):
+        actions = [{'remove': {'index': name, 'alias': alias}}
+                   for name in es_conn.indices.get_alias(name=alias) if name != index_name]
+    elif es_conn.indices.exists(index=alias):
+        # Indexed before the versioned reindex, the alias cannot be
+        # created while an index has its name.
+        actions = [{'remove_index': {'index': alias}}]
+
+    # A single request, so the alias switches atomically.
+    actions.append({'add': {'index': index_name, 'alias': alias}})
+    es_conn.indices.update_aliases({'actions': actions})
+    cache.delete(SEARCH_REINDEX_KEY)
+
+    # Ask ES for every version, including the ones of interrupted reindexes.
+    version_re = re.compile(r'^{0}_\d+$'.format(re.escape(alias)))
+    for name in es_conn.indices.get_settings(index='{0}_*'.format(alias)):
+        if name != index_name and version_re.match(name):
+            es_conn.indices.delete(index=name)
+
+
+@shared_task()
+def index_all_profiles():
+    """Task to rebuild ES index without downtime.
+
+    Everything is indexed once, into a new versioned index, and the
+    search alias is switched to it when all the partitions are done.
+    The partitions run in parallel on the celery workers and each one is
+    checkpointed, so running the task again after it was interrupted
+    resumes the pending reindex.
+
+    Without Elasticsearch the embedded index is rebuilt in place.
+    """
+    if settings.ES_DISABLED:
+        call_command('rebuild_index', interactive=False)
+        return
+
+    index_name = cache.get(SEARCH_REINDEX_KEY)
+    if not index_name:
+        alias = connections['default'].options['INDEX_NAME']
+        # Down to the microsecond, the partition checkpoints are keyed on the name.
+        index_name = '{0}_{1}'.format(alias, now().strftime('%Y%m%d%H%M%S%f'))
+        cache.set(SEARCH_REINDEX_KEY, index_name, SEARCH_REINDEX_TIMEOUT)
+
+    # Create the index and its mapping before the workers write to it.
+    get_search_reindex_backend(index_name).setup()
+
+    partitions = [index_search_partition.si(index_name, *partition)
+                  for partition in get_search_partitions()]
+    if partitions:
+        chord(partitions)(swap_search_index.si(index_name))
+    else:
+        swap_search_index(index_name)
 
 
 @app.task
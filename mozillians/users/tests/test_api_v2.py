@@ -264,6 +264,8 @@ class UserProfileViewSetTests(TestCase):
 
         ok_(userprofile_mock.objects.complete.called)
         userprofile_mock.objects.complete().privacy_level.assert_called_with(MOZILLIANS)
+        userprofile_mock.objects.complete().privacy_level().select_related.assert_called_with(
+            'user')
 
     def test_retrieve_base(self):
         viewset = UserProfileViewSet()
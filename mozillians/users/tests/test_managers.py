@@ -1,10 +1,13 @@
 from mock import patch
-from nose.tools import eq_
+from nose.tools import eq_, ok_
 
 from mozillians.common.tests import TestCase
-from mozillians.users.managers import PUBLIC
-from mozillians.users.models import UserProfile
-from mozillians.users.tests import UserFactory
+from mozillians.groups.models import GroupMembership
+from mozillians.groups.tests import GroupFactory
+from mozillians.users.managers import MOZILLIANS, PUBLIC, visible_q
+from mozillians.users.models import (ExternalAccount, IdpProfile, ProfileRecord, UserProfile,
+                                     Vouch)
+from mozillians.users.tests import LanguageFactory, UserFactory
 
 
 class UserProfileQuerySetTests(TestCase):
@@ -71,8 +74,110 @@ class UserProfileQuerySetTests(TestCase):
         new_queryset = queryset.public()
         eq_(new_queryset._privacy_level, 99)
 
+    def test_with_visibility(self):
+        public_user = UserFactory.create(userprofile={'privacy_ircname': PUBLIC})
+        UserFactory.create()
+        queryset = UserProfile.objects.with_visibility(PUBLIC)
+        eq_(set(profile.pk for profile in queryset if profile.is_visible),
+            set([public_user.userprofile.pk]))
+        queryset = UserProfile.objects.with_visibility(MOZILLIANS)
+        ok_(all(profile.is_visible for profile in queryset))
+
+    def test_visible_q_prefix(self):
+        voucher = UserFactory.create(userprofile={'can_vouch': True})
+        vouchee = UserFactory.create(vouched=False, userprofile={'privacy_bio': PUBLIC})
+        UserFactory.create(vouched=False).userprofile.vouch(voucher.userprofile)
+        vouchee.userprofile.vouch(voucher.userprofile)
+        vouches = Vouch.objects.filter(visible_q(PUBLIC, 'vouchee__'))
+        eq_([vouch.vouchee for vouch in vouches], [vouchee.userprofile])
+
     def test_iterator(self):
         UserFactory.create()
         queryset = UserProfile.objects.all()
         queryset.privacy_level(99)
         eq_(queryset.all()[0]._privacy_level, 99)
+
+
+class MaterializeTests(TestCase):
+    def setUp(self):
+        self.group = GroupFactory.create()
+        self.users = UserFactory.create_batch(3)
+        for user in self.users:
+            profile = user.userprofile
+            self.group.add_member(profile)
+            LanguageFactory.create(userprofile=profile)
+            ExternalAccount.objects.create(user=profile, type=ExternalAccount.TYPE_AMO,
+                                           identifier='amo', privacy=MOZILLIANS)
+            ExternalAccount.objects.create(user=profile, type=ExternalAccount.TYPE_WEBSITE,
+                                           identifier='http://example.com', privacy=PUBLIC)
+
+    def test_constant_queries(self):
+        # Profiles, accounts, identities, languages, memberships
+        with self.assertNumQueries(5):
+            records = UserProfile.objects.all().materialize(MOZILLIANS)
+            for record in records:
+                record.email
+                record.user.username
+                record.country.name
+                eq_(len(record.accounts), 1)
+                eq_(len(record.websites), 1)
+                eq_(len(record.languages), 1)
+                eq_(list(record.groups), [self.group])
+        eq_(len(records), 3)
+
+    def test_redacted(self):
+        profile = self.users[0].userprofile
+        profile.privacy_full_name = MOZILLIANS
+        profile.privacy_country = PUBLIC
+        profile.privacy_groups = MOZILLIANS
+        profile.save()
+
+        record = UserProfile.objects.filter(pk=profile.pk).materialize(PUBLIC)[0]
+        ok_(isinstance(record, ProfileRecord))
+        eq_(record.full_name, '')
+        eq_(record.display_name, '')
+        eq_(record.email, '')
+        eq_(record.country, profile.country)
+        eq_(record.city, None)
+        eq_(record.city_id, None)
+        eq_(record.accounts, ())
+        eq_([account.identifier for account in record.websites], ['http://example.com'])
+        eq_(record.groups, ())
+
+    def test_unrestricted(self):
+        profile = self.users[0].userprofile
+        record = UserProfile.objects.filter(pk=profile.pk).materialize()[0]
+        eq_(record.full_name, profile.full_name)
+        eq_(record.email, profile.user.email)
+        eq_(record.city, profile.city)
+
+    def test_queryset_privacy_level(self):
+        profile = self.users[0].userprofile
+        record = UserProfile.objects.filter(pk=profile.pk).privacy_level(PUBLIC).materialize()[0]
+        eq_(record._privacy_level, PUBLIC)
+        eq_(record.full_name, '')
+
+    def test_primary_contact_identity(self):
+        profile = self.users[0].userprofile
+        IdpProfile.objects.create(profile=profile, auth0_user_id='ad|foo@example.com',
+                                  email='foo@example.com', primary_contact_identity=True,
+                                  privacy=MOZILLIANS)
+        record = UserProfile.objects.filter(pk=profile.pk).materialize(MOZILLIANS)[0]
+        eq_(record.email, 'foo@example.com')
+        eq_([idp.email for idp in record.identity_profiles], ['foo@example.com'])
+
+        record = UserProfile.objects.filter(pk=profile.pk).materialize(PUBLIC)[0]
+        eq_(record.email, '')
+        eq_(record.identity_profiles, ())
+
+    def test_pending_groups_excluded(self):
+        profile = self.users[0].userprofile
+        group = GroupFactory.create()
+        group.add_member(profile, GroupMembership.PENDING)
+        record = UserProfile.objects.filter(pk=profile.pk).materialize()[0]
+        eq_(list(record.groups), [self.group])
+
+    def test_read_only(self):
+        record = UserProfile.objects.all().materialize()[0]
+        with self.assertRaises(AttributeError):
+            record.full_name = 'foo'
@@ -4,7 +4,8 @@ from datetime import datetime
 from uuid import uuid4
 
 from django.conf import settings
-from django.contrib.auth.models import User
+from django.contrib.auth.models import Group as AuthGroup, User
+from django.db import IntegrityError
 from django.db.models.query import QuerySet
 from django.test import override_settings
 from django.utils.timezone import make_aware, now
@@ -14,11 +15,14 @@ from mock import Mock, patch
 from nose.tools import eq_, ok_
 
 from mozillians.common.tests import TestCase
-from mozillians.groups.models import Group, Skill
+from mozillians.groups.models import Group, GroupMembership, Skill
 from mozillians.groups.tests import (GroupAliasFactory, GroupFactory,
                                      SkillAliasFactory, SkillFactory)
-from mozillians.users.managers import (EMPLOYEES, MOZILLIANS, PUBLIC, PUBLIC_INDEXABLE_FIELDS)
-from mozillians.users.models import (ExternalAccount, IdpProfile, UserProfile,
+from mozillians.users.managers import (EMPLOYEES, MOZILLIANS, PRIVATE, PUBLIC,
+                                       PUBLIC_INDEXABLE_FIELDS)
+from mozillians.users.models import (ExternalAccount, IdpProfile, InvitationCandidate,
+                                     InvitationCandidateTerm, PrivacyAliasDescriptor,
+                                     PrivacyFieldDescriptor, UserProfile,
                                      _calculate_photo_filename, Vouch)
 from mozillians.users.tests import UserFactory
 
@@ -335,6 +339,41 @@ class UserProfileTests(TestCase):
         group.add_member(user.userprofile)
         eq_(user.userprofile.privacy_level, EMPLOYEES)
 
+    def test_privacy_level_memoized(self):
+        profile = UserFactory.create().userprofile
+        eq_(profile.privacy_level, MOZILLIANS)
+        with self.assertNumQueries(0):
+            eq_(profile.privacy_level, MOZILLIANS)
+            ok_(not profile.is_nda)
+            ok_(not profile.is_manager)
+
+    def test_privacy_level_membership_change(self):
+        user = UserFactory.create()
+        eq_(user.userprofile.privacy_level, MOZILLIANS)
+        group, _ = Group.objects.get_or_create(name='staff')
+        group.add_member(user.userprofile)
+        eq_(user.userprofile.privacy_level, EMPLOYEES)
+        eq_(UserProfile.objects.get(pk=user.userprofile.pk).privacy_level, EMPLOYEES)
+
+        group.remove_member(user.userprofile)
+        eq_(user.userprofile.privacy_level, MOZILLIANS)
+        eq_(UserProfile.objects.get(pk=user.userprofile.pk).privacy_level, MOZILLIANS)
+
+    @override_settings(NDA_GROUP='nda')
+    def test_is_nda_membership_change(self):
+        user = UserFactory.create()
+        ok_(not user.userprofile.is_nda)
+        nda = GroupFactory.create(name='nda')
+        GroupMembership.objects.create(userprofile=user.userprofile, group=nda,
+                                       status=GroupMembership.MEMBER)
+        ok_(UserProfile.objects.get(pk=user.userprofile.pk).is_nda)
+
+    def test_privacy_level_manager(self):
+        user = UserFactory.create()
+        eq_(UserProfile.objects.get(pk=user.userprofile.pk).privacy_level, MOZILLIANS)
+        user.groups.add(AuthGroup.objects.create(name='Managers'))
+        eq_(UserProfile.objects.get(pk=user.userprofile.pk).privacy_level, PRIVATE)
+
     def test_privacy_level_vouched(self):
         user = UserFactory.create()
         eq_(user.userprofile.privacy_level, MOZILLIANS)
@@ -432,6 +471,46 @@ class UserProfileTests(TestCase):
         user.userprofile.get_photo_url('80x80', firefox='rocks')
         get_photo_thumbnail_mock.assert_called_with('80x80', firefox='rocks')
 
+    @patch('mozillians.users.models.UserProfile.get_photo_thumbnail')
+    def test_get_photo_url_from_manifest(self, get_photo_thumbnail_mock):
+        manifest = '{"photo": "foo", "thumbnails": {"150x150": "https://example.com/foo.jpg"}}'
+        user = UserFactory.create(userprofile={'photo': 'foo', 'photo_thumbnails': manifest})
+        eq_(user.userprofile.get_photo_url('150x150'), 'https://example.com/foo.jpg')
+        ok_(not get_photo_thumbnail_mock.called)
+
+    @patch('mozillians.users.models.UserProfile.get_photo_thumbnail')
+    def test_get_photo_url_manifest_fallback(self, get_photo_thumbnail_mock):
+        manifest = '{"photo": "foo", "thumbnails": {"150x150": "https://example.com/foo.jpg"}}'
+        user = UserFactory.create(userprofile={'photo': 'foo', 'photo_thumbnails': manifest})
+        user.userprofile.get_photo_url('80x80')
+        get_photo_thumbnail_mock.assert_called_with('80x80')
+        user.userprofile.get_photo_url('150x150', upscale=False)
+        get_photo_thumbnail_mock.assert_called_with('150x150', upscale=False)
+
+    @patch('mozillians.users.models.UserProfile.get_photo_thumbnail')
+    def test_get_photo_url_stale_manifest(self, get_photo_thumbnail_mock):
+        manifest = '{"photo": "bar", "thumbnails": {"150x150": "https://example.com/bar.jpg"}}'
+        user = UserFactory.create(userprofile={'photo': 'foo', 'photo_thumbnails': manifest})
+        ok_(user.userprofile.photo_thumbnails_stale)
+        user.userprofile.get_photo_url('150x150')
+        get_photo_thumbnail_mock.assert_called_with('150x150')
+
+    @override_settings(PHOTO_THUMBNAIL_GEOMETRIES=['150x150'])
+    @patch('mozillians.users.models.default_storage')
+    @patch('mozillians.users.models.UserProfile.get_photo_thumbnail')
+    def test_photo_thumbnails_private_photo(self, get_photo_thumbnail_mock, mock_storage):
+        mock_storage.exists.return_value = True
+        get_photo_thumbnail_mock.return_value.url = '/media/thumb.jpg'
+        user = UserFactory.create(userprofile={'photo': 'foo', 'privacy_photo': MOZILLIANS})
+        profile = UserProfile.objects.privacy_level(PUBLIC).get(pk=user.userprofile.pk)
+        ok_(profile.photo_thumbnails_stale)
+
+        profile.generate_photo_thumbnails()
+        ok_(not profile.photo_thumbnails_stale)
+        eq_(UserProfile.objects.get(pk=profile.pk).photo_manifest,
+            {'150x150': '/media/thumb.jpg'})
+        eq_(get_photo_thumbnail_mock.call_args[1]['photo'].name, 'foo')
+
     @patch('mozillians.users.models.gravatar')
     def test_get_photo_url_without_photo(self, gravatar_mock):
         user = UserFactory.create()
@@ -568,6 +647,30 @@ class VouchTests(TestCase):
         user_profile.set_instance_privacy_level(MOZILLIANS)
         eq_(set(user_profile.vouches_made.all()), set(Vouch.objects.filter(voucher=user_profile)))
 
+    def test_vouches_received_privacy(self):
+        voucher = UserFactory.create(userprofile={'can_vouch': True})
+        hidden = UserFactory.create(vouched=False).userprofile
+        shown = UserFactory.create(vouched=False,
+                                   userprofile={'privacy_full_name': PUBLIC}).userprofile
+        hidden.vouch(voucher.userprofile)
+        shown.vouch(voucher.userprofile)
+
+        # All the vouches of a vouchee with a field visible at the level, or none.
+        hidden.set_instance_privacy_level(PUBLIC)
+        eq_(list(hidden.vouches_received.all()), [])
+        shown.set_instance_privacy_level(PUBLIC)
+        eq_(set(shown.vouches_received.all()), set(Vouch.objects.filter(vouchee=shown)))
+
+    def test_vouchee_privacy_single_query(self):
+        voucher = UserFactory.create(userprofile={'can_vouch': True})
+        for i in range(3):
+            vouchee = UserFactory.create(userprofile={'privacy_full_name': PUBLIC})
+            vouchee.userprofile.vouch(voucher.userprofile)
+        user_profile = voucher.userprofile
+        user_profile.set_instance_privacy_level(PUBLIC)
+        with self.assertNumQueries(1):
+            eq_(len(user_profile.vouches_made.all()), 3)
+
     def test_vouch_reset(self):
         voucher = UserFactory.create()
         user = UserFactory.create()
@@ -687,6 +790,215 @@ class EmailAttributeTests(TestCase):
         profile.set_instance_privacy_level(PUBLIC)
         eq_(profile.email, '')
 
+    def test_email_without_queries(self):
+        user = UserFactory.create(email='foo@foo.com')
+        IdpProfile.objects.create(profile=user.userprofile, auth0_user_id='github|foo@bar.com',
+                                  email='foo@bar.com', primary_contact_identity=True)
+        profile = UserProfile.objects.select_related('user').get(pk=user.userprofile.pk)
+        profile.set_instance_privacy_level(MOZILLIANS)
+        with self.assertNumQueries(0):
+            eq_(profile.email, 'foo@bar.com')
+
+    def test_update_primary_contact_email(self):
+        profile = UserFactory.create(email='foo@foo.com').userprofile
+        IdpProfile.objects.create(profile=profile, auth0_user_id='github|foo@bar.com',
+                                  email='foo@bar.com', primary_contact_identity=True,
+                                  privacy=PUBLIC)
+        idp = IdpProfile.objects.create(profile=profile, auth0_user_id='ad|foo@example.com',
+                                        email='foo@example.com', privacy=MOZILLIANS)
+        IdpProfile.objects.filter(profile=profile).update(primary_contact_identity=False)
+        IdpProfile.objects.filter(pk=idp.pk).update(primary_contact_identity=True)
+        profile.update_primary_contact_email()
+
+        profile = UserProfile.objects.get(pk=profile.pk)
+        eq_(profile.primary_contact_email, 'foo@example.com')
+        eq_(profile.primary_contact_privacy, MOZILLIANS)
+        profile.set_instance_privacy_level(PUBLIC)
+        eq_(profile.email, '')
+
+    @patch('mozillians.common.signals.reindex_profile')
+    def test_update_primary_contact_email_reindexes_profile(self, reindex_profile_mock):
+        profile = UserFactory.create().userprofile
+        reindex_profile_mock.reset_mock()
+        profile.update_primary_contact_email()
+        reindex_profile_mock.assert_called_once_with(profile)
+
+        reindex_profile_mock.reset_mock()
+        profile.update_primary_contact_email(save=False)
+        ok_(not reindex_profile_mock.called)
+
+    def test_get_primary_contact(self):
+        eq_(UserProfile.get_primary_contact([]), ('', None))
+        eq_(UserProfile.get_primary_contact([(False, 'foo@bar.com', PUBLIC)]), ('', PRIVATE))
+        eq_(UserProfile.get_primary_contact([(False, 'foo@bar.com', PUBLIC),
+                                             (True, 'foo@example.com', MOZILLIANS),
+                                             (True, 'bar@example.com', PUBLIC)]),
+            ('foo@example.com', MOZILLIANS))
+
+    def test_delete_identities_restores_user_email(self):
+        profile = UserFactory.create(email='foo@foo.com').userprofile
+        IdpProfile.objects.create(profile=profile, auth0_user_id='github|foo@bar.com',
+                                  email='foo@bar.com', primary_contact_identity=True)
+        profile.idp_profiles.all().delete()
+
+        profile = UserProfile.objects.get(pk=profile.pk)
+        eq_(profile.primary_contact_privacy, None)
+        eq_(profile.email, 'foo@foo.com')
+
+
+class ApiAlternateEmailsTests(TestCase):
+    def _legacy_api_alternate_emails(self, profile):
+        """The query based merge _api_alternate_emails used to run."""
+        legacy_emails_qs = profile._alternate_emails
+        idp_qs = profile._identity_profiles
+
+        e_exclude = [e.id for e in legacy_emails_qs if
+                     idp_qs.filter(email=e.identifier, privacy__gte=e.privacy).exists()]
+        legacy_emails_qs = legacy_emails_qs.exclude(id__in=e_exclude)
+
+        idp_exclude = [i.id for i in idp_qs if
+                       legacy_emails_qs.filter(identifier=i.email,
+                                               privacy__gte=i.privacy).exists()]
+        idp_qs = idp_qs.exclude(id__in=idp_exclude)
+        return list(legacy_emails_qs) + list(idp_qs)
+
+    def _add_email(self, profile, email, privacy):
+        ExternalAccount.objects.create(user=profile, type=ExternalAccount.TYPE_EMAIL,
+                                       identifier=email, privacy=privacy)
+
+    def _add_idp(self, profile, email, privacy, provider='ad'):
+        IdpProfile.objects.create(profile=profile, auth0_user_id='%s|%s' % (provider, email),
+                                  email=email, privacy=privacy)
+
+    def test_matches_query_based_merge(self):
+        profile = UserFactory.create().userprofile
+        self._add_email(profile, 'only_legacy@example.com', MOZILLIANS)
+        self._add_idp(profile, 'only_idp@example.com', PUBLIC)
+        self._add_email(profile, 'same@example.com', MOZILLIANS)
+        self._add_idp(profile, 'same@example.com', MOZILLIANS)
+        self._add_email(profile, 'legacy_wins@example.com', PUBLIC)
+        self._add_idp(profile, 'legacy_wins@example.com', MOZILLIANS)
+        self._add_email(profile, 'idp_wins@example.com', EMPLOYEES)
+        self._add_idp(profile, 'idp_wins@example.com', PUBLIC)
+        self._add_idp(profile, 'two_idps@example.com', EMPLOYEES)
+        self._add_idp(profile, 'two_idps@example.com', MOZILLIANS, provider='github')
+        self._add_email(profile, 'two_idps@example.com', EMPLOYEES)
+
+        for level in [None, PUBLIC, MOZILLIANS, EMPLOYEES]:
+            profile.set_instance_privacy_level(level)
+            eq_(profile._api_alternate_emails, self._legacy_api_alternate_emails(profile))
+
+    def test_queries(self):
+        profile = UserFactory.create().userprofile
+        for i in range(5):
+            self._add_email(profile, 'foo%s@example.com' % i, MOZILLIANS)
+            self._add_idp(profile, 'foo%s@example.com' % i, PUBLIC)
+        with self.assertNumQueries(2):
+            emails = profile._api_alternate_emails
+        eq_(len(emails), 5)
+        ok_(all(isinstance(email, IdpProfile) for email in emails))
+
+
+@override_settings(AUTO_VOUCH_DOMAINS=('mozilla.com',), NDA_GROUP='nda')
+class InvitationCandidateTests(TestCase):
+    def _candidate(self, profile):
+        return InvitationCandidate.objects.filter(profile=profile).first()
+
+    def test_staff_identity(self):
+        user = UserFactory.create(userprofile={'full_name': 'Jane Staff'})
+        IdpProfile.objects.create(profile=user.userprofile, auth0_user_id='email|jane',
+                                  email='jane@mozilla.com', primary=True)
+        candidate = self._candidate(user.userprofile)
+        ok_(candidate.is_staff)
+        ok_(not candidate.is_nda_member)
+        ok_(not candidate.has_mfa_identity)
+        eq_(candidate.label, u'Jane Staff (jane@mozilla.com)')
+
+    def test_mfa_primary_identity(self):
+        profile = UserFactory.create().userprofile
+        idp = IdpProfile.objects.create(profile=profile, auth0_user_id='github|1',
+                                        email='foo@example.com', primary=True)
+        ok_(self._candidate(profile).has_mfa_identity)
+
+        idp.auth0_user_id = 'email|foo'
+        idp.save()
+        eq_(self._candidate(profile), None)
+
+    def test_nda_membership(self):
+        profile = UserFactory.create().userprofile
+        nda = GroupFactory.create(name='nda')
+        nda.add_member(profile)
+        ok_(self._candidate(profile).is_nda_member)
+
+        GroupFactory.create().add_member(profile)
+        membership = GroupMembership.objects.get(group=nda, userprofile=profile)
+        membership.status = GroupMembership.PENDING
+        membership.save()
+        eq_(self._candidate(profile), None)
+
+    def test_profile_name_change(self):
+        profile = UserFactory.create().userprofile
+        IdpProfile.objects.create(profile=profile, auth0_user_id='ad|foo',
+                                  email='foo@mozilla.com', primary=True)
+        profile.full_name = 'New Name'
+        profile.save()
+        eq_(self._candidate(profile).label, u'New Name (foo@mozilla.com)')
+
+    def test_user_email_change(self):
+        user = UserFactory.create(email='old@example.com')
+        IdpProfile.objects.create(profile=user.userprofile, auth0_user_id='ad|foo',
+                                  email='foo@mozilla.com', primary=True)
+        user.email = 'new@example.com'
+        user.save()
+        candidate = self._candidate(user.userprofile)
+        eq_(list(InvitationCandidate.objects.search('new@ex')), [candidate])
+        eq_(list(InvitationCandidate.objects.search('old@ex')), [])
+
+    def test_search(self):
+        user = UserFactory.create(username='jdoe', email='john@example.com',
+                                  userprofile={'full_name': 'John Smith'})
+        IdpProfile.objects.create(profile=user.userprofile, auth0_user_id='ad|john',
+                                  email='john@mozilla.com', primary=True)
+        other = UserFactory.create(first_name='Jane', userprofile={'full_name': 'Jane Smith'})
+        IdpProfile.objects.create(profile=other.userprofile, auth0_user_id='ad|jane',
+                                  email='jane@mozilla.com', primary=True)
+
+        candidates = InvitationCandidate.objects.all()
+        eq_(set(candidates.search('smi')), set(InvitationCandidate.objects.all()))
+        eq_(list(candidates.search('jo Smi')), [self._candidate(user.userprofile)])
+        eq_(list(candidates.search('JDO')), [self._candidate(user.userprofile)])
+        eq_(list(candidates.search('john@ex')), [self._candidate(user.userprofile)])
+        eq_(list(candidates.search('mith')), [])
+
+    def test_search_punctuation(self):
+        user = UserFactory.create(userprofile={'full_name': u"Jean-Luc O'Brien"})
+        IdpProfile.objects.create(profile=user.userprofile, auth0_user_id='ad|jl',
+                                  email='jl@mozilla.com', primary=True)
+        candidate = self._candidate(user.userprofile)
+        eq_(list(InvitationCandidate.objects.search(u"o'brien")), [candidate])
+        eq_(list(InvitationCandidate.objects.search(u'jean-luc')), [candidate])
+
+    def test_refresh_concurrent_terms(self):
+        user = UserFactory.create(userprofile={'full_name': 'Jane Staff'})
+        IdpProfile.objects.create(profile=user.userprofile, auth0_user_id='ad|jane',
+                                  email='jane@mozilla.com', primary=True)
+        InvitationCandidateTerm.objects.all().delete()
+        bulk_create = InvitationCandidateTerm.objects.bulk_create
+        calls = []
+
+        def concurrent_bulk_create(objs):
+            calls.append(objs)
+            if len(calls) == 1:
+                # Another refresh inserted the same terms first.
+                raise IntegrityError
+            return bulk_create(objs)
+
+        with patch.object(InvitationCandidateTerm.objects, 'bulk_create',
+                          side_effect=concurrent_bulk_create):
+            InvitationCandidate.refresh(user.userprofile.pk)
+        eq_(len(calls), 2)
+        ok_(InvitationCandidate.objects.search('staff').exists())
+
 
 class PrivacyModelTests(unittest.TestCase):
     def setUp(self):
@@ -714,6 +1026,68 @@ class PrivacyModelTests(unittest.TestCase):
         ok_(not mock_get_field.called)
 
 
+class PrivacyDescriptorTests(TestCase):
+    def test_privacy_fields_have_descriptors(self):
+        for field in UserProfile.privacy_fields():
+            descriptor = UserProfile.__dict__[field]
+            if field in UserProfile.PRIVACY_AWARE_ALIASES:
+                ok_(isinstance(descriptor, PrivacyAliasDescriptor))
+            else:
+                ok_(isinstance(descriptor, PrivacyFieldDescriptor))
+
+    def test_install_is_idempotent(self):
+        descriptor = UserProfile.__dict__['full_name']
+        UserProfile.install_privacy_descriptors()
+        ok_(UserProfile.__dict__['full_name'] is descriptor)
+
+    def test_class_access_returns_django_descriptor(self):
+        ok_(UserProfile.groups.through is GroupMembership)
+        eq_(UserProfile.country.field.name, 'country')
+
+    def test_related_field_hidden(self):
+        profile = UserFactory.create(userprofile={'privacy_country': MOZILLIANS}).userprofile
+        ok_(profile.country)
+        profile.set_instance_privacy_level(PUBLIC)
+        eq_(profile.country, None)
+        profile.set_instance_privacy_level(MOZILLIANS)
+        ok_(profile.country)
+
+    def test_many_to_many_field_hidden(self):
+        profile = UserFactory.create(userprofile={'privacy_skills': MOZILLIANS}).userprofile
+        profile.skills.add(SkillFactory.create())
+        profile.set_instance_privacy_level(PUBLIC)
+        eq_(profile.skills.count(), 0)
+        profile.set_instance_privacy_level(MOZILLIANS)
+        eq_(profile.skills.count(), 1)
+
+    def test_set_hidden_field(self):
+        profile = UserFactory.create(userprofile={'privacy_bio': MOZILLIANS}).userprofile
+        profile.set_instance_privacy_level(PUBLIC)
+        profile.bio = 'foobar'
+        eq_(profile.bio, '')
+        profile.set_instance_privacy_level(None)
+        eq_(profile.bio, 'foobar')
+
+    def test_deferred_field(self):
+        user = UserFactory.create(userprofile={'bio': 'foobar', 'privacy_bio': MOZILLIANS})
+        profile = (UserProfile.objects.privacy_level(PUBLIC).defer('bio')
+                   .get(pk=user.userprofile.pk))
+        eq_(profile.bio, '')
+        profile.set_instance_privacy_level(MOZILLIANS)
+        eq_(profile.bio, 'foobar')
+
+    def test_alias_bypasses_field_value(self):
+        user = UserFactory.create(email='foo@example.com')
+        profile = user.userprofile
+        profile.email = 'bar@example.com'
+        eq_(profile.email, 'foo@example.com')
+
+    def test_vouches_received_unfiltered(self):
+        profile = UserFactory.create().userprofile
+        eq_(profile.vouches_received.count(), 1)
+        eq_(profile._get_unfiltered('vouches_received').count(), 1)
+
+
 class CISHelperMethodsTests(unittest.TestCase):
     def tearDown(self):
         Group.objects.all().delete()
@@ -0,0 +1,116 @@
+import json
+
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from mock import patch
+from nose.tools import eq_
+
+from mozillians.common.tests import TestCase
+from mozillians.groups.models import GroupMembership
+from mozillians.groups.tests import GroupFactory, SkillFactory
+from mozillians.users.models import IdpProfile
+from mozillians.users.managers import EMPLOYEES, MOZILLIANS, PUBLIC
+from mozillians.users.search_indexes import (IdpProfileIndex, UserProfileIndex,
+                                             get_search_card, prepare_search_cards,
+                                             prepare_search_text)
+from mozillians.users.tests import LanguageFactory, UserFactory
+
+
+class PrepareSearchTextTests(TestCase):
+
+    def test_text_per_privacy_level(self):
+        data = {
+            'full_name': 'Foo Bar',
+            'privacy_full_name': PUBLIC,
+            'ircname': 'foobar',
+            'privacy_ircname': MOZILLIANS,
+            'skills': ['python', 'django'],
+            'privacy_skills': EMPLOYEES,
+            'bio': '',
+            'privacy_bio': PUBLIC,
+            'username': 'foo',
+            'text': 'not searched',
+        }
+        search_text = prepare_search_text(data, public_fields=['username'])
+        eq_(search_text, {
+            'search_text_public': 'Foo Bar foo',
+            'search_text_mozillians': 'Foo Bar foobar foo',
+            'search_text_employees': 'Foo Bar foobar python django foo',
+            'search_text_private': 'Foo Bar foobar python django foo',
+        })
+
+
+class SearchCardTests(TestCase):
+
+    @patch('mozillians.users.search_indexes.get_privacy_aware_photo_url')
+    def test_cards_are_redacted(self, photo_url_mock):
+        photo_url_mock.return_value = 'http://example.com/photo.jpg'
+        profile = UserFactory.create(userprofile={'full_name': 'Foo Bar',
+                                                  'privacy_full_name': MOZILLIANS,
+                                                  'ircname': 'foobar',
+                                                  'privacy_ircname': EMPLOYEES}).userprofile
+        cards = prepare_search_cards(profile)
+
+        public = json.loads(cards['card_public'])
+        eq_(public['username'], profile.user.username)
+        eq_(public['name'], '')
+        eq_(public['ircname'], '')
+        eq_(public['photo'], 'http://example.com/photo.jpg')
+        mozillians = json.loads(cards['card_mozillians'])
+        eq_(mozillians['name'], 'Foo Bar')
+        eq_(mozillians['ircname'], '')
+        eq_(json.loads(cards['card_employees'])['ircname'], 'foobar')
+        eq_(profile._privacy_level, None)
+
+    def test_get_search_card(self):
+        class Result(object):
+            card_public = json.dumps({'type': 'profile', 'username': 'foo'})
+
+        eq_(get_search_card(Result(), PUBLIC), {'type': 'profile', 'username': 'foo'})
+        eq_(get_search_card(Result(), MOZILLIANS), None)
+
+
+class UserProfileIndexTests(TestCase):
+
+    def _create_profile(self):
+        profile = UserFactory.create().userprofile
+        GroupFactory.create().add_member(profile)
+        GroupFactory.create().add_member(profile, status=GroupMembership.PENDING)
+        profile.skills.add(SkillFactory.create())
+        LanguageFactory.create(userprofile=profile)
+        return profile
+
+    def _prepare_all(self):
+        index = UserProfileIndex()
+        with CaptureQueriesContext(connection) as captured:
+            documents = [index.full_prepare(obj) for obj in index.index_queryset()]
+        return documents, len(captured)
+
+    def test_prepare_queries_do_not_depend_on_profiles(self):
+        profile = self._create_profile()
+        documents, queries = self._prepare_all()
+        eq_(len(documents), 1)
+        eq_(documents[0]['groups'], [profile.groups.get(
+            groupmembership__status=GroupMembership.MEMBER).name])
+        eq_(documents[0]['skills'], [profile.skills.get().name])
+
+        for i in range(4):
+            self._create_profile()
+        documents, more_queries = self._prepare_all()
+        eq_(len(documents), 5)
+        eq_(queries, more_queries)
+
+
+class IdpProfileIndexTests(TestCase):
+
+    def test_index_queryset_unique_emails(self):
+        profile = UserFactory.create().userprofile
+        first = IdpProfile.objects.create(profile=profile, auth0_user_id='github|1',
+                                          email='foo@example.com')
+        IdpProfile.objects.create(profile=profile, auth0_user_id='ad|Mozilla-LDAP|foo',
+                                  email='foo@example.com', type=IdpProfile.PROVIDER_LDAP)
+        other = IdpProfile.objects.create(profile=profile, auth0_user_id='github|2',
+                                          email='bar@example.com')
+
+        eq_(set(IdpProfileIndex().index_queryset()), set([first, other]))
@@ -2,6 +2,7 @@ from datetime import datetime
 
 from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.test.utils import override_settings
 
 from basket.base import BasketException
@@ -10,12 +11,15 @@ from mock import patch
 from nose.tools import eq_, ok_
 
 from mozillians.common.tests import TestCase
-from mozillians.users.models import AbuseReport
-from mozillians.users.tasks import (delete_reported_spam_accounts,
+from mozillians.users.models import AbuseReport, UserProfile
+from mozillians.users.tasks import (SEARCH_REINDEX_KEY, delete_reported_spam_accounts,
+                                    generate_photo_thumbnails, index_all_profiles,
+                                    index_search_partition,
                                     lookup_user_task, remove_incomplete_accounts,
                                     subscribe_user_task, subscribe_user_to_basket,
                                     unsubscribe_from_basket_task,
-                                    unsubscribe_user_task, update_email_in_basket)
+                                    swap_search_index, unsubscribe_user_task,
+                                    update_email_in_basket)
 from mozillians.users.tests import UserFactory
 
 
@@ -331,3 +335,113 @@ class SpamTasksTests(TestCase):
         delete_reported_spam_accounts()
         eq_(AbuseReport.objects.all().count(), 1)
         eq_(User.objects.filter(email=spam_user.email).count(), 1)
+
+
+class PhotoThumbnailsTests(TestCase):
+    @override_settings(PHOTO_THUMBNAIL_GEOMETRIES=['150x150', '300x300'])
+    @patch('mozillians.users.models.default_storage')
+    @patch('mozillians.users.models.UserProfile.get_photo_thumbnail')
+    def test_generate_photo_thumbnails(self, get_photo_thumbnail_mock, mock_storage):
+        mock_storage.exists.return_value = True
+        get_photo_thumbnail_mock.return_value.url = '/media/thumb.jpg'
+        user = UserFactory.create(userprofile={'photo': 'foo'})
+        generate_photo_thumbnails(user.userprofile.pk)
+
+        profile = UserProfile.objects.get(pk=user.userprofile.pk)
+        eq_(profile.photo_manifest, {'150x150': '/media/thumb.jpg',
+                                     '300x300': '/media/thumb.jpg'})
+        ok_(not profile.photo_thumbnails_stale)
+
+    @patch('mozillians.common.signals.reindex_profile')
+    def test_generate_photo_thumbnails_reindexes_profile(self, reindex_profile_mock):
+        user = UserFactory.create()
+        generate_photo_thumbnails(user.userprofile.pk)
+        eq_(reindex_profile_mock.call_args[0][0].pk, user.userprofile.pk)
+
+    def test_generate_photo_thumbnails_without_photo(self):
+        user = UserFactory.create(userprofile={'photo_thumbnails': '{"photo": "foo"}'})
+        generate_photo_thumbnails(user.userprofile.pk)
+
+        profile = UserProfile.objects.get(pk=user.userprofile.pk)
+        eq_(profile.photo_thumbnails, '')
+        ok_(not profile.photo_thumbnails_stale)
+
+
+class ReindexTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+
+    @patch('mozillians.users.tasks.get_search_reindex_backend')
+    def test_index_search_partition_checkpoint(self, get_backend_mock):
+        profiles = [UserFactory.create().userprofile for i in range(3)]
+        start = profiles[0].pk
+        end = profiles[-1].pk + 1
+        backend = get_backend_mock.return_value
+
+        with override_settings(ES_REINDEX_BATCHSIZE=2):
+            index_search_partition('mozillians_1', 'users.UserProfile', start, end)
+        eq_(backend.update.call_count, 2)
+        eq_([obj.pk for obj in backend.update.call_args_list[0][0][1]],
+            [profile.pk for profile in profiles[:2]])
+
+        # The partition is done, running it again does nothing.
+        index_search_partition('mozillians_1', 'users.UserProfile', start, end)
+        eq_(backend.update.call_count, 2)
+
+    @override_settings(ES_DISABLED=False)
+    @patch('mozillians.users.tasks.swap_search_index')
+    @patch('mozillians.users.tasks.get_search_partitions')
+    @patch('mozillians.users.tasks.get_search_reindex_backend')
+    @patch('mozillians.users.tasks.connections')
+    @patch('mozillians.users.tasks.now')
+    def test_index_all_profiles_unique_index_names(self, now_mock, connections_mock,
+                                                   backend_mock, partitions_mock, swap_mock):
+        connections_mock['default'].options = {'INDEX_NAME': 'mozillians'}
+        partitions_mock.return_value = []
+        now_mock.side_effect = [datetime(2019, 2, 15, 8, 12, 0, 1),
+                                datetime(2019, 2, 15, 8, 12, 0, 2)]
+
+        index_all_profiles()
+        cache.delete(SEARCH_REINDEX_KEY)
+        index_all_profiles()
+
+        # Reindexes started in the same second do not share checkpoints.
+        eq_([call[0][0] for call in swap_mock.call_args_list],
+            ['mozillians_20190215081200000001', 'mozillians_20190215081200000002'])
+
+    @patch('mozillians.users.tasks.connections')
+    def test_swap_search_index(self, connections_mock):
+        connections_mock['default'].options = {'INDEX_NAME': 'mozillians'}
+        es_conn = connections_mock['default'].get_backend.return_value.conn
+        es_conn.indices.exists_alias.return_value = True
+        es_conn.indices.get_alias.return_value = {'mozillians_0': {}}
+        # mozillians_2 is left by an interrupted reindex.
+        es_conn.indices.get_settings.return_value = {
+            'mozillians_0': {}, 'mozillians_1': {}, 'mozillians_2': {}, 'mozillians_public': {}}
+        cache.set(SEARCH_REINDEX_KEY, 'mozillians_1')
+
+        swap_search_index('mozillians_1')
+
+        es_conn.indices.update_aliases.assert_called_with({'actions': [
+            {'remove': {'index': 'mozillians_0', 'alias': 'mozillians'}},
+            {'add': {'index': 'mozillians_1', 'alias': 'mozillians'}}]})
+        es_conn.indices.get_settings.assert_called_with(index='mozillians_*')
+        eq_(sorted(call[1]['index'] for call in es_conn.indices.delete.call_args_list),
+            ['mozillians_0', 'mozillians_2'])
+        ok_(not cache.get(SEARCH_REINDEX_KEY))
+
+    @patch('mozillians.users.tasks.connections')
+    def test_swap_search_index_replaces_index(self, connections_mock):
+        connections_mock['default'].options = {'INDEX_NAME': 'mozillians'}
+        es_conn = connections_mock['default'].get_backend.return_value.conn
+        es_conn.indices.exists_alias.return_value = False
+        es_conn.indices.exists.return_value = True
+        es_conn.indices.get_settings.return_value = {'mozillians_1': {}}
+
+        swap_search_index('mozillians_1')
+
+        es_conn.indices.update_aliases.assert_called_with({'actions': [
+            {'remove_index': {'index': 'mozillians'}},
+            {'add': {'index': 'mozillians_1', 'alias': 'mozillians'}}]})
+        ok_(not es_conn.indices.delete.called)
@@ -1,8 +1,4 @@
-from functools import reduce
-from operator import or_
-
 from django.db.models import Q
-from django.conf import settings
 from django.contrib.auth.models import User
 from django.http import JsonResponse
 
@@ -10,10 +6,8 @@ from cities_light.models import City, Country, Region
 from dal import autocomplete
 from pytz import country_timezones
 
-from mozillians.common.templatetags.helpers import get_object_or_none
-from mozillians.groups.models import GroupMembership
 from mozillians.phonebook.forms import get_timezones_list
-from mozillians.users.models import IdpProfile, UserProfile
+from mozillians.users.models import InvitationCandidate, UserProfile
 
 
 class BaseProfileAdminAutocomplete(autocomplete.Select2QuerySetView):
@@ -107,92 +101,32 @@ def get_autocomplete_location_query(qs, q):
 
 
 class StaffProfilesAutocomplete(autocomplete.Select2QuerySetView):
+    """Autocomplete the staff profiles from the invitation directory."""
+    candidate_filter = Q(is_staff=True)
 
     def get_results(self, context):
-        """Modify the text in the results of the group invitation form."""
-
-        results = []
-        for result in context['object_list']:
-            pk = self.get_result_value(result)
-            if not pk:
-                continue
-
-            profile = UserProfile.objects.get(pk=pk)
-            idp = get_object_or_none(IdpProfile, profile=profile, primary=True)
-            text = self.get_result_label(result)
-
-            # Append the email used for login in the autocomplete text
-            if idp:
-                text += ' ({0})'.format(idp.email)
-
-            item = {
-                'id': pk,
-                'text': text
-            }
-            results.append(item)
-        return results
+        """Return the precomputed labels of the group invitation form."""
+        return [{'id': str(candidate.profile_id), 'text': candidate.label}
+                for candidate in context['object_list']]
 
     def get_queryset(self):
         if not self.request.user.userprofile.is_vouched:
-            return UserProfile.objects.none()
-
-        queries = []
+            return InvitationCandidate.objects.none()
 
-        # Query staff profiles
-        for domain in settings.AUTO_VOUCH_DOMAINS:
-            pks = IdpProfile.objects.filter(
-                email__endswith='@' + domain).values_list('profile__pk', flat=True)
-            queries.append(Q(pk__in=pks))
-
-        query = reduce(or_, queries)
-
-        qs = UserProfile.objects.filter(query).distinct()
+        qs = InvitationCandidate.objects.filter(self.candidate_filter)
         if self.q:
-            qs = qs.filter(Q(full_name__icontains=self.q)
-                           | Q(user__email__icontains=self.q)
-                           | Q(user__username__icontains=self.q))
+            qs = qs.search(self.q)
         return qs
 
 
 class AccessGroupInvitationAutocomplete(StaffProfilesAutocomplete):
-
-    def get_queryset(self):
-        staff_qs = super(AccessGroupInvitationAutocomplete, self).get_queryset()
-        staff_ids = staff_qs.values_list('pk', flat=True)
-
-        # Query NDA memberships
-        nda_members_ids = GroupMembership.objects.filter(
-            group__name=settings.NDA_GROUP,
-            status=GroupMembership.MEMBER
-        ).values_list('userprofile__pk', flat=True)
-
-        query = Q(pk__in=staff_ids) | Q(pk__in=nda_members_ids)
-        qs = UserProfile.objects.filter(query).distinct()
-        if self.q:
-            qs = qs.filter(Q(full_name__icontains=self.q)
-                           | Q(user__email__icontains=self.q)
-                           | Q(user__username__icontains=self.q))
-        return qs
+    """Autocomplete the staff profiles and the members of the NDA group."""
+    candidate_filter = Q(is_staff=True) | Q(is_nda_member=True)
 
 
 class NDAGroupInvitationAutocomplete(StaffProfilesAutocomplete):
-
-    def get_queryset(self):
-        staff_qs = super(NDAGroupInvitationAutocomplete, self).get_queryset()
-        staff_ids = staff_qs.values_list('pk', flat=True)
-
-        mfa_idps_query = (IdpProfile.objects.filter(primary=True)
-                                            .filter(Q(type=IdpProfile.PROVIDER_GITHUB)
-                                                    | Q(type=IdpProfile.PROVIDER_FIREFOX_ACCOUNTS)
-                                                    | Q(type=IdpProfile.PROVIDER_GOOGLE)
-                                                    | Q(type=IdpProfile.PROVIDER_LDAP)))
-        mfa_idps_pks = mfa_idps_query.values_list('profile__id', flat=True)
-        qs = UserProfile.objects.filter(Q(pk__in=mfa_idps_pks) | Q(pk__in=staff_ids))
-        if self.q:
-            qs = qs.filter(Q(full_name__icontains=self.q)
-                           | Q(user__email__icontains=self.q)
-                           | Q(user__username__icontains=self.q))
-        return qs
+    """Autocomplete the staff profiles and the profiles with an MFA primary identity."""
+    candidate_filter = Q(is_staff=True) | Q(has_mfa_identity=True)
 
 
 class CountryAutocomplete(autocomplete.Select2QuerySetView):